@@ -0,0 +1,290 @@
+import json
+import math
+import os
+import threading
+import metrics
+
+EVALUATIONS = metrics.counter("alert_evaluations_total", "Pembacaan sensor yang dievaluasi mesin peringatan")
+TRANSITIONS = metrics.counter("alert_transitions_total", "Perubahan status peringatan", ("rule", "state"))
+EVALUATE_SECONDS = metrics.histogram(
+    "alert_evaluate_seconds", "Durasi evaluasi semua aturan untuk satu pembacaan (detik)",
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001),
+)
+
+KINDS = ("level", "rate")
+OPS = (">", "<")
+FIRING = "firing"
+RESOLVED = "resolved"
+REPEAT = "repeat"
+
+
+class AlertRule:
+    """
+    Satu aturan peringatan untuk satu metrik.
+    - kind "level": nilai (dihaluskan EWMA dengan `alpha`; 1 = tanpa penghalusan) dibandingkan dengan `enter`.
+    - kind "rate": laju perubahan per `window` detik (turunan yang dihaluskan EWMA berbasis waktu
+      dengan konstanta `window`, sehingga kira-kira rata-rata laju selama jendela tersebut)
+    Hysteresis: peringatan aktif saat melewati `enter` dan baru selesai setelah kembali melewati `exit`.
+    `sustain`: kondisi harus bertahan sekian detik sebelum peringatan aktif.
+    `device` None berarti berlaku untuk semua perangkat; aturan dengan nama sama per perangkat menimpanya.
+    """
+
+    __slots__ = ("name", "metric", "kind", "op", "enter", "exit", "alpha", "window", "sustain", "device")
+
+    def __init__(self, name, metric, enter, exit=None, kind="level", op=">", alpha=1.0, window=60.0,
+                 sustain=0.0, device=None, hysteresis=0.9):
+        if kind not in KINDS:
+            raise ValueError(f"Jenis aturan harus salah satu dari: {', '.join(KINDS)}")
+        if op not in OPS:
+            raise ValueError(f"Operator harus salah satu dari: {', '.join(OPS)}")
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha harus di antara 0 (tidak termasuk) dan 1")
+        if window <= 0 or sustain < 0:
+            raise ValueError("window harus > 0 dan sustain >= 0")
+        if exit is None:
+            # Batas keluar default sedikit di bawah (atau di atas untuk "<") batas masuk
+            margin = abs(enter) * (1 - hysteresis)
+            exit = enter - margin if op == ">" else enter + margin
+        if (op == ">" and exit > enter) or (op == "<" and exit < enter):
+            raise ValueError("Batas keluar (exit) harus berada di sisi aman batas masuk (enter)")
+        self.name = name
+        self.metric = metric
+        self.kind = kind
+        self.op = op
+        self.enter = float(enter)
+        self.exit = float(exit)
+        self.alpha = float(alpha)
+        self.window = float(window)
+        self.sustain = float(sustain)
+        self.device = device
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def describe(self):
+        value = f"laju {self.metric} per {self.window:g} detik" if self.kind == "rate" else self.metric
+        if self.kind == "level" and self.alpha < 1:
+            value += f" (EWMA α={self.alpha:g})"
+        text = f"{value} {self.op} {self.enter:g} (selesai saat kembali melewati {self.exit:g})"
+        if self.sustain:
+            text += f" selama {self.sustain:g} detik"
+        return text
+
+
+class _RuleState:
+    """State O(1) satu aturan pada satu perangkat."""
+
+    __slots__ = ("value", "last_raw", "last_ts", "active", "since", "notified")
+
+    def __init__(self):
+        self.value = None  # Nilai yang dibandingkan (EWMA level atau laju)
+        self.last_raw = None
+        self.last_ts = None
+        self.active = False
+        self.since = None  # Awal kondisi masuk terpenuhi (untuk sustain)
+        self.notified = 0.0  # Waktu peringatan terakhir dikirim (untuk pengulangan)
+
+
+class AlertEvent:
+    __slots__ = ("rule", "device_id", "state", "value", "raw", "timestamp", "reading")
+
+    def __init__(self, rule, device_id, state, value, raw, timestamp, reading):
+        self.rule = rule
+        self.device_id = device_id
+        self.state = state  # FIRING, REPEAT atau RESOLVED
+        self.value = value
+        self.raw = raw
+        self.timestamp = timestamp
+        self.reading = reading
+
+
+class AlertEngine:
+    """
+    Mengevaluasi setiap pembacaan sensor saat tiba terhadap aturan per metrik/perangkat.
+    Aturan diindeks per metrik sehingga biaya per pembacaan hanya sebanding dengan jumlah aturan
+    untuk metrik di pembacaan tersebut; state disimpan per (aturan, perangkat) dengan ukuran tetap.
+    `on_event(AlertEvent)` dipanggil untuk transisi dan pengulangan (paling sering `repeat_interval` detik).
+    """
+
+    def __init__(self, on_event, rules=(), repeat_interval=30.0, path=None):
+        self.on_event = on_event
+        self.repeat_interval = repeat_interval
+        self.path = path  # File JSON aturan yang diubah saat runtime (None: tidak disimpan)
+        self._rules = {}  # metrik -> {nama: {perangkat atau None: AlertRule}}
+        self._states = {}  # (nama, perangkat) -> _RuleState
+        self._lock = threading.Lock()
+        for rule in rules:
+            self._add(rule)
+        if path and os.path.exists(path):
+            self.load()
+
+    def _add(self, rule):
+        # Aturan dengan nama sama untuk metrik lain dilepas agar satu nama hanya punya satu metrik
+        for metric, by_name in self._rules.items():
+            if metric != rule.metric and rule.name in by_name:
+                by_name[rule.name].pop(rule.device, None)
+        self._rules.setdefault(rule.metric, {}).setdefault(rule.name, {})[rule.device] = rule
+
+    def set_rule(self, rule, save=True):
+        """Menambah atau mengganti aturan (per perangkat jika `rule.device` diisi); state aturan direset."""
+        with self._lock:
+            self._add(rule)
+            for key in [key for key in self._states if key[0] == rule.name and rule.device in (None, key[1])]:
+                del self._states[key]
+        if save:
+            self.save()
+
+    def update_rule(self, name, device=None, **changes):
+        """Salinan aturan `name` (versi perangkat atau umum) dengan nilai yang diubah, disimpan untuk `device`."""
+        base = self.get_rule(name, device)
+        if base is None:
+            raise KeyError(name)
+        data = base.to_dict()
+        if "enter" in changes and "exit" not in changes:
+            data["exit"] = None  # Batas keluar dihitung ulang dari batas masuk yang baru
+        data.update(changes, device=device)
+        rule = AlertRule.from_dict(data)
+        self.set_rule(rule)
+        return rule
+
+    def remove_rule(self, name, device=None):
+        with self._lock:
+            removed = False
+            for by_name in self._rules.values():
+                by_device = by_name.get(name)
+                if by_device is not None and by_device.pop(device, None) is not None:
+                    removed = True
+                    if not by_device:
+                        del by_name[name]
+            for key in [key for key in self._states if key[0] == name and device in (None, key[1])]:
+                del self._states[key]
+        if removed:
+            self.save()
+        return removed
+
+    def get_rule(self, name, device=None):
+        for by_name in self._rules.values():
+            by_device = by_name.get(name)
+            if by_device:
+                return by_device.get(device) or by_device.get(None)
+        return None
+
+    def thresholds(self, device_id):
+        """{metrik: [enter, exit]} aturan level yang berlaku untuk perangkat (dipakai tahap kompresi)."""
+        levels = {}
+        with self._lock:
+            for metric, by_name in self._rules.items():
+                for by_device in by_name.values():
+                    rule = by_device.get(device_id) or by_device.get(None)
+                    if rule is not None and rule.kind == "level":
+                        levels.setdefault(metric, []).extend((rule.enter, rule.exit))
+        return levels
+
+    def rules(self):
+        with self._lock:
+            return [rule for by_name in self._rules.values() for by_device in by_name.values() for rule in by_device.values()]
+
+    def active(self):
+        """Daftar (nama aturan, perangkat, nilai) yang sedang aktif."""
+        with self._lock:
+            return [(name, device, state.value) for (name, device), state in self._states.items() if state.active]
+
+    def evaluate(self, device_id, reading, timestamp):
+        """Mengevaluasi satu pembacaan {metrik: nilai} (dipanggil untuk setiap pesan sensor)."""
+        with EVALUATE_SECONDS.time():
+            EVALUATIONS.inc()
+            events = []
+            with self._lock:
+                for metric, raw in reading.items():
+                    by_name = self._rules.get(metric)
+                    if not by_name or not isinstance(raw, (int, float)) or math.isnan(raw):
+                        continue
+                    for name, by_device in by_name.items():
+                        rule = by_device.get(device_id) or by_device.get(None)
+                        if rule is not None:
+                            event = self._step(rule, device_id, raw, timestamp, reading)
+                            if event is not None:
+                                events.append(event)
+        for event in events:
+            if event.state != REPEAT:
+                TRANSITIONS.labels(event.rule.name, event.state).inc()
+            self.on_event(event)
+
+    def _step(self, rule, device_id, raw, timestamp, reading):
+        key = (rule.name, device_id)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _RuleState()
+
+        if rule.kind == "level":
+            state.value = raw if state.value is None else state.value + rule.alpha * (raw - state.value)
+        elif state.last_ts is not None and timestamp > state.last_ts:
+            # Laju per `window` detik, dihaluskan dengan bobot sebanding selang waktu antar pembacaan
+            elapsed = timestamp - state.last_ts
+            slope = (raw - state.last_raw) / elapsed * rule.window
+            weight = min(1.0, elapsed / rule.window)
+            state.value = slope if state.value is None else state.value + weight * (slope - state.value)
+        state.last_raw = raw
+        state.last_ts = timestamp
+        value = state.value
+        if value is None:
+            return None
+
+        above = value > rule.enter if rule.op == ">" else value < rule.enter
+        if not state.active:
+            if not above:
+                state.since = None
+                return None
+            if state.since is None:
+                state.since = timestamp
+            if timestamp - state.since < rule.sustain:
+                return None
+            state.active = True
+            state.notified = timestamp
+            return AlertEvent(rule, device_id, FIRING, value, raw, timestamp, reading)
+
+        cleared = value < rule.exit if rule.op == ">" else value > rule.exit
+        if cleared:
+            state.active = False
+            state.since = None
+            return AlertEvent(rule, device_id, RESOLVED, value, raw, timestamp, reading)
+        if timestamp - state.notified >= self.repeat_interval:
+            state.notified = timestamp
+            return AlertEvent(rule, device_id, REPEAT, value, raw, timestamp, reading)
+        return None
+
+    def forget(self, device_id):
+        """Melepas state perangkat yang dikeluarkan dari registry."""
+        with self._lock:
+            for key in [key for key in self._states if key[1] == device_id]:
+                del self._states[key]
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            body = json.dumps([rule.to_dict() for rule in self.rules()], indent=2)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                f.write(body)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"❌ Gagal menyimpan aturan peringatan: {e}")
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                rules = [AlertRule.from_dict(data) for data in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            print(f"❌ Gagal memuat aturan peringatan: {e}")
+            return
+        with self._lock:
+            self._rules.clear()
+            self._states.clear()
+            for rule in rules:
+                self._add(rule)
+        print(f"✅ {len(rules)} aturan peringatan dimuat dari {self.path}")
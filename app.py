@@ -1,9 +1,20 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, Response, stream_with_context, g
 from flask_cors import CORS
-import pandas as pd
-from google.cloud import storage  # Library untuk akses GCS
+from storage_session import get_bucket  # Client GCS bersama (satu per proses)
+from response_cache import ResponseCache
+from partition_writer import PARTITION_HEADER
+from storage_backend import create_backend, object_store_kind
+from rollup import load_rollups, METRICS, TIMEZONE
+from stream import StreamHub, start_listener
+import serializer
+import local_storage
+import storage_session
+import compression
+import metrics
 import os
-from io import StringIO  # StringIO untuk membaca CSV sebagai file-like object
+import threading
+import time
+from datetime import datetime
 
 app = Flask(__name__)
 CORS(app)  # Mengizinkan akses API dari sumber lain (CORS)
@@ -12,61 +23,220 @@ CORS(app)  # Mengizinkan akses API dari sumber lain (CORS)
 # Konfigurasi Cloud Storage
 BUCKET_NAME = "data-sensor-bucket"  # Ganti dengan nama bucket Google Cloud Storage Anda
 CSV_FILE_NAME = "data_sensor.csv"  # Ganti dengan nama file CSV di bucket Anda
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Batas ukuran cache respons di memori
+PARTITION_BUCKET_NAME = "all-data-sensor-bucket"  # Bucket partisi harian YYYY/MM/data_DD.csv
+DEFAULT_PAGE_LIMIT = 500  # Jumlah baris default per halaman query rentang waktu
+MAX_PAGE_LIMIT = 5000  # Batas maksimal baris per halaman
+# Rentang default (detik) endpoint rollup per resolusi jika parameter from tidak diberikan
+ROLLUP_DEFAULT_RANGE = {"minute": 86400, "hour": 30 * 86400, "day": 365 * 86400}
+PARTITION_READ_WORKERS = 8  # Partisi harian yang diunduh bersamaan pada ekspor rentang panjang
+# Backend data sensor, sama dengan konfigurasi bot (config.py): gcs, local atau sqlite (hot store + arsip)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+STORAGE_ARCHIVE = os.environ.get('STORAGE_ARCHIVE', 'gcs')
+STORAGE_LOCAL_ROOT = os.environ.get('STORAGE_LOCAL_ROOT', 'storage')
+HOT_STORE_PATH = os.environ.get('HOT_STORE_PATH', 'hot_store.db')
+INTERPOLATE_MAX_GAP = 900  # Celah antar titik tersimpan (detik) yang masih diisi interpolasi
+MAX_INTERPOLATE_STEP = 3600  # Langkah interpolasi maksimal (detik)
+STREAM_REPLAY_SIZE = 1000  # Jumlah event terakhir yang bisa diputar ulang saat klien tersambung kembali
 
+# Cache respons per generation blob (LRU)
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES)
 
-def fetch_csv_from_gcs(bucket_name, file_name):
+# Metrik API (format Prometheus di /metrics)
+REQUEST_SECONDS = metrics.histogram("http_request_seconds", "Durasi permintaan API (detik)", ("endpoint",))
+REQUESTS = metrics.counter("http_requests_total", "Permintaan API per endpoint dan status", ("endpoint", "status"))
+for _name in ("hits", "misses", "evictions", "bytes", "entries", "hit_ratio"):
+    metrics.gauge(f"response_cache_{_name}", f"Cache respons: {_name}").set_function(
+        lambda name=_name: response_cache.stats()[name]
+    )
+metrics.gauge("stream_subscribers", "Klien SSE yang tersambung").set_function(lambda: _stream_hub.subscribers)
+
+# Object store lokal (seperti bot): client bersama diganti folder STORAGE_LOCAL_ROOT sehingga CSV lama
+# dan rollup juga dibaca dari folder itu
+storage_client = None
+if object_store_kind(STORAGE_BACKEND, STORAGE_ARCHIVE) == "local":
+    storage_client = local_storage.Client(STORAGE_LOCAL_ROOT)
+    storage_session.set_client(storage_client)
+
+# Query rentang waktu dan ekspor: data terbaru dari hot store SQLite (indeks perangkat + timestamp),
+# data lama dari partisi harian di object store (manifest dimuat saat query pertama)
+storage = create_backend(
+    STORAGE_BACKEND, archive=STORAGE_ARCHIVE, path=HOT_STORE_PATH, readonly=True,
+    read_workers=PARTITION_READ_WORKERS, client=storage_client,
+)
+
+
+# Hub stream langsung, listener UDP dimulai saat subscriber pertama tersambung
+_stream_hub = None
+_stream_lock = threading.Lock()
+
+
+def get_stream_hub():
+    global _stream_hub
+    with _stream_lock:
+        if _stream_hub is None:
+            hub = StreamHub(replay_size=STREAM_REPLAY_SIZE)
+            start_listener(hub)
+            _stream_hub = hub
+    return _stream_hub
+
+
+def parse_time_param(name, end_of_day=False):
     """
-    Mengambil file CSV dari Google Cloud Storage dan mengonversinya menjadi pandas DataFrame.
+    Membaca parameter waktu (ISO, mis. 2025-01-31 atau 2025-01-31T08:00:00) menjadi
+    string "YYYY-MM-DD HH:MM:SS" yang sama dengan format timestamp di CSV.
     """
+    value = request.args.get(name)
+    if not value:
+        return None
     try:
-        # Inisialisasi Google Cloud Storage Client
-        client = storage.Client()
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Format parameter '{name}' tidak valid: '{value}'")
+    if end_of_day and len(value) == 10:
+        # Tanggal saja pada batas akhir berarti sampai akhir hari tersebut
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
 
-        # Mendapatkan bucket dan file (blob)
-        bucket = client.bucket(bucket_name)
+def parse_interpolate_param():
+    """
+    Parameter `interpolate` (detik): data tersimpan sudah dikompresi (titik yang bisa direkonstruksi
+    dibuang), jadi klien dapat meminta titik di antaranya diisi ulang secara linear setiap N detik.
+    """
+    step = request.args.get('interpolate')
+    if not step:
+        return None
+    if not step.isdigit() or not 1 <= int(step) <= MAX_INTERPOLATE_STEP:
+        raise ValueError(f"Parameter 'interpolate' harus antara 1 - {MAX_INTERPOLATE_STEP} detik")
+    return int(step)
+
+
+def fetch_csv_from_gcs(bucket_name, file_name):
+    """
+    Mengambil file CSV dari Google Cloud Storage sebagai tabel kolom (tanpa pandas/dict per baris).
+    """
+    try:
+        # Mendapatkan bucket dan file (blob) dari client bersama
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(file_name)
 
         # Mengunduh file CSV sebagai string
         csv_content = blob.download_as_text()
 
-        # Membaca CSV dengan pandas menggunakan io.StringIO
-        data = pd.read_csv(StringIO(csv_content))
-
-        return data
+        table = serializer.parse_csv(csv_content)
+        if not table.header:
+            # Jika file CSV kosong
+            raise ValueError(f"File '{file_name}' kosong atau tidak mengandung data yang valid!")
+        return table
 
     except FileNotFoundError:
         # Jika file tidak ditemukan
         raise ValueError(f"File '{file_name}' tidak ditemukan di bucket '{bucket_name}'!")
-    except pd.errors.EmptyDataError:
-        # Jika file CSV kosong
-        raise ValueError(f"File '{file_name}' kosong atau tidak mengandung data yang valid!")
+    except ValueError:
+        raise
     except Exception as e:
         # Jika ada error lain
         raise ValueError(f"Terjadi error saat mengakses file dari GCS: {str(e)}")
 
 
+def negotiate_format():
+    """Format body dari ?format= (records/columns/msgpack) atau header Accept; default records."""
+    requested = request.args.get('format')
+    if requested:
+        if requested not in serializer.FORMATS:
+            raise KeyError(requested)
+        return requested
+    best = request.accept_mimetypes.best_match(('application/json',) + serializer.MSGPACK_TYPES)
+    return 'msgpack' if best in serializer.MSGPACK_TYPES else 'records'
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    # Pola rute (bukan URL mentah) sebagai label agar jumlah seri tetap kecil
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    start = g.get("request_start")
+    if start is not None:
+        REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+    REQUESTS.labels(endpoint, response.status_code).inc()
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Metrik proses API dalam format teks Prometheus.
+    """
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/api/sensors', methods=['GET'])
 def get_sensor_data():
     """
     Endpoint untuk membaca data sensor dari GCS.
+    Dengan parameter from/to/limit/cursor/columns/device, data diambil per halaman dari partisi harian.
+    `format` memilih layout body: records (default), columns (JSON per kolom) atau msgpack;
+    body dikompres gzip/br sesuai Accept-Encoding.
     """
+    if any(param in request.args for param in ('from', 'to', 'limit', 'cursor', 'columns', 'device')):
+        return get_sensor_range()
+
     try:
-        # Ambil data dari GCS
-        data = fetch_csv_from_gcs(BUCKET_NAME, CSV_FILE_NAME)
-
-        # Validasi jika DataFrame kosong
-        if data.empty:
-            return jsonify({
-                'status': 'error',
-                'message': 'Data CSV kosong atau tidak ditemukan!'
-            }), 404
-
-        # Ubah DataFrame ke format JSON
-        result = data.to_dict(orient='records')  # Convert to list of dictionaries
+        data_format = negotiate_format()
+    except KeyError as e:
         return jsonify({
-            'status': 'success',
-            'data': result
-        }), 200
+            'status': 'error',
+            'message': f"Format {e} tidak dikenal (pilihan: {', '.join(serializer.FORMATS)})"
+        }), 400
+
+    try:
+        # Cek metadata blob saja (murah) untuk mendapatkan generation terbaru
+        blob = get_bucket(BUCKET_NAME).get_blob(CSV_FILE_NAME)
+        if blob is None:
+            raise ValueError(f"File '{CSV_FILE_NAME}' tidak ditemukan di bucket '{BUCKET_NAME}'!")
+
+        # ETag per representasi (format dan kompresi) agar cache HTTP tidak mencampurnya
+        encoding = request.accept_encodings.best_match(serializer.available_encodings())
+        etag = "-".join(part for part in (str(blob.generation), data_format, encoding) if part and part != 'records')
+        if request.if_none_match.contains(etag):
+            # Klien sudah memiliki versi terbaru: cukup balas 304 tanpa body
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Vary'] = 'Accept, Accept-Encoding'
+            return response
+
+        # Sajikan dari cache (per format dan kompresi) jika file belum berubah sejak diunduh terakhir kali
+        cache_key = f"{BUCKET_NAME}/{CSV_FILE_NAME}|{data_format}|{encoding}"
+        body = response_cache.get(cache_key, blob.generation)
+        encode, mimetype = serializer.ENCODERS[data_format]
+        if body is None:
+            # Ambil data dari GCS
+            table = fetch_csv_from_gcs(BUCKET_NAME, CSV_FILE_NAME)
+
+            # Validasi jika tidak ada baris data
+            if table.rows == 0:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Data CSV kosong atau tidak ditemukan!'
+                }), 404
+
+            # CSV langsung ditulis ke format tujuan, dikompres sekali, lalu di-cache
+            body = serializer.compress(encode(table), encoding)
+            response_cache.put(cache_key, blob.generation, body)
+
+        # Klien dengan If-None-Match yang sama mendapat 304 selama blob belum berubah
+        response = Response(body, status=200, mimetype=mimetype)
+        response.set_etag(etag)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept, Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
 
     except ValueError as ve:
         # Jika terjadi error selama mengakses data
@@ -82,6 +252,205 @@ def get_sensor_data():
         }), 500
 
 
+def get_sensor_range():
+    """
+    Query rentang waktu dengan paginasi: /api/sensors?from=&to=&limit=&cursor=&columns=&device=&interpolate=
+    Data hot store dibaca lewat indeks SQLite; untuk data lama hanya partisi yang beririsan dengan
+    rentang yang dibuka; `columns` (mis. amonia,suhu)
+    membatasi kolom yang dibaca dari arsip kolom, `device` memilih perangkat (kandang).
+    `interpolate` mengisi titik di antara baris dalam satu halaman (tidak dihitung dalam `limit`).
+    """
+    try:
+        start = parse_time_param('from')
+        end = parse_time_param('to', end_of_day=True)
+        limit = request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+        if limit is None or limit < 1 or limit > MAX_PAGE_LIMIT:
+            raise ValueError(f"Parameter 'limit' harus antara 1 - {MAX_PAGE_LIMIT}")
+        columns = None
+        if request.args.get('columns'):
+            columns = [column.strip() for column in request.args['columns'].split(',')]
+            unknown = [column for column in columns if column not in PARTITION_HEADER]
+            if unknown:
+                raise ValueError(f"Kolom tidak dikenal: {', '.join(unknown)}")
+        step = parse_interpolate_param()
+    except ValueError as ve:
+        return jsonify({
+            'status': 'error',
+            'message': str(ve)
+        }), 400
+
+    try:
+        records, next_cursor = storage.query(
+            start, end, limit, request.args.get('cursor'), columns, request.args.get('device')
+        )
+        if step is not None:
+            records = list(compression.interpolate(records, step, INTERPOLATE_MAX_GAP))
+        return jsonify({
+            'status': 'success',
+            'data': records,
+            'next_cursor': next_cursor
+        }), 200
+
+    except ValueError as ve:
+        return jsonify({
+            'status': 'error',
+            'message': str(ve)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"Unexpected error: {str(e)}"
+        }), 500
+
+
+@app.route('/api/sensors/export', methods=['GET'])
+def export_sensor_range():
+    """
+    Ekspor rentang panjang sebagai NDJSON (satu record per baris): /api/sensors/export?from=&to=&columns=&device=&interpolate=
+    Partisi harian lama diunduh paralel, disambung dengan data hot store, lalu dialirkan urut
+    timestamp tanpa paginasi. `device` boleh
+    berisi beberapa perangkat dipisah koma; record digabung urut waktu dengan kolom `device`.
+    `interpolate` mengisi titik setiap N detik per perangkat sebelum digabung.
+    """
+    try:
+        start = parse_time_param('from')
+        if start is None:
+            raise ValueError("Parameter 'from' wajib diisi")
+        end = parse_time_param('to', end_of_day=True)
+        columns = None
+        if request.args.get('columns'):
+            columns = [column.strip() for column in request.args['columns'].split(',')]
+            unknown = [column for column in columns if column not in PARTITION_HEADER]
+            if unknown:
+                raise ValueError(f"Kolom tidak dikenal: {', '.join(unknown)}")
+        device_ids = [device.strip() for device in request.args.get('device', '').split(',') if device.strip()]
+        step = parse_interpolate_param()
+    except ValueError as ve:
+        return jsonify({
+            'status': 'error',
+            'message': str(ve)
+        }), 400
+
+    transform = None
+    if step is not None:
+        transform = lambda records: compression.interpolate(records, step, INTERPOLATE_MAX_GAP)
+    try:
+        records = storage.stream(start, end, columns, device_ids or (None,), transform)
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"Unexpected error: {str(e)}"
+        }), 500
+
+    def generate():
+        # Baris dikirim per potongan agar respons mengalir tanpa menahan seluruh rentang di memori
+        lines = []
+        for record in records:
+            lines.append(app.json.dumps(record))
+            if len(lines) >= 1000:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def read_cached_blob(bucket, name):
+    """Membaca objek lewat cache respons (revalidasi dengan generation). None jika tidak ada."""
+    blob = bucket.get_blob(name)
+    if blob is None:
+        return None
+    cache_key = f"{bucket.name}/{name}"
+    data = response_cache.get(cache_key, blob.generation)
+    if data is None:
+        data = blob.download_as_bytes()
+        response_cache.put(cache_key, blob.generation, data)
+    return data
+
+
+@app.route('/api/sensors/rollup', methods=['GET'])
+def get_sensor_rollup():
+    """
+    Endpoint agregat untuk grafik: /api/sensors/rollup?resolution=minute|hour|day&from=&to=&metrics=&device=
+    Setiap titik berisi min, max, mean, count dan nilai terakhir per metrik.
+    """
+    try:
+        resolution = request.args.get('resolution', 'hour')
+        if resolution not in ROLLUP_DEFAULT_RANGE:
+            raise ValueError(f"Resolusi harus salah satu dari: {', '.join(ROLLUP_DEFAULT_RANGE)}")
+        names = METRICS
+        if request.args.get('metrics'):
+            names = [metric.strip() for metric in request.args['metrics'].split(',')]
+            unknown = [metric for metric in names if metric not in METRICS]
+            if unknown:
+                raise ValueError(f"Metrik tidak dikenal: {', '.join(unknown)}")
+        end = parse_time_param('to', end_of_day=True)
+        start = parse_time_param('from')
+    except ValueError as ve:
+        return jsonify({
+            'status': 'error',
+            'message': str(ve)
+        }), 400
+
+    try:
+        end_epoch = int(TIMEZONE.localize(datetime.strptime(end, "%Y-%m-%d %H:%M:%S")).timestamp()) if end \
+            else int(datetime.now(TIMEZONE).timestamp())
+        start_epoch = int(TIMEZONE.localize(datetime.strptime(start, "%Y-%m-%d %H:%M:%S")).timestamp()) if start \
+            else end_epoch - ROLLUP_DEFAULT_RANGE[resolution]
+        bucket = get_bucket(PARTITION_BUCKET_NAME)
+        points = load_rollups(
+            bucket, resolution, start_epoch, end_epoch, names,
+            read_blob=lambda name: read_cached_blob(bucket, name),
+            device_id=request.args.get('device')
+        )
+        return jsonify({
+            'status': 'success',
+            'resolution': resolution,
+            'data': points
+        }), 200
+
+    except ValueError as ve:
+        return jsonify({
+            'status': 'error',
+            'message': str(ve)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"Unexpected error: {str(e)}"
+        }), 500
+
+
+@app.route('/api/sensors/stream', methods=['GET'])
+def stream_sensor_data():
+    """
+    Server-Sent Events: setiap pembacaan baru dikirim begitu disimpan oleh bot.
+    Klien yang tersambung ulang melanjutkan dari header Last-Event-ID (atau ?last_event_id=);
+    ?device= menyaring satu perangkat.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+        hub = get_stream_hub()
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': "Last-Event-ID tidak valid!"
+        }), 400
+    except OSError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"Stream tidak tersedia: {str(e)}"
+        }), 503
+
+    events = hub.subscribe(last_event_id, request.args.get('device'))
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Nonaktifkan buffering proxy (nginx)
+    return response
+
+
 @app.route('/api/ping', methods=['GET'])
 def ping():
     """
@@ -96,4 +465,4 @@ def ping():
 if __name__ == '__main__':
     # Gunakan environment variable PORT, default ke 8080 jika tidak ada
     port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port)  # Pastikan Flask mendengarkan di PORT
+    app.run(host='0.0.0.0', port=port, threaded=True)  # Pastikan Flask mendengarkan di PORT
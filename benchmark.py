@@ -0,0 +1,599 @@
+"""
+Benchmark jalur penyimpanan dan penerimaan data sensor.
+Jalankan: python benchmark.py <nama> (tanpa argumen untuk menjalankan semua)
+Tambahkan --output hasil.json untuk menyimpan hasil agar bisa dibandingkan antar versi.
+"""
+import argparse
+import csv
+import json
+import subprocess
+import os
+import socket
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import local_storage
+import storage_session
+from data import upload_new_rows, CSV_HEADER
+from partition_writer import PartitionWriter, PARTITION_HEADER, partition_name, encode_rows
+from columnar import encode_columnar, decode_columnar
+
+ROWS_PER_DAY = 2880  # 1 baris setiap 30 detik
+
+
+def _sample_row(current_time, i):
+    return [current_time.strftime("%Y-%m-%d %H:%M:%S"), 28.5, 70.1, 12.0 + i % 40, "Relay OFF", "AUTO"]
+
+
+def _legacy_save(bucket, current_time, row, workdir):
+    """Algoritma lama save_to_gcs: unduh seluruh file, tambah satu baris, unggah ulang."""
+    name = partition_name(current_time)
+    blob = bucket.blob(name)
+    local_file = os.path.join(workdir, "legacy.csv")
+    try:
+        blob.download_to_filename(local_file)
+        with open(local_file, "r") as f:
+            existing_data = list(csv.reader(f))
+    except FileNotFoundError:
+        existing_data = [PARTITION_HEADER]
+    existing_data.append(row)
+    with open(local_file, "w", newline="") as f:
+        csv.writer(f).writerows(existing_data)
+    blob.upload_from_filename(local_file)
+
+
+def bench_partition():
+    """Biaya penulisan baris ke-1 vs baris ke-2880 dalam satu hari (algoritma lama vs append-only)."""
+    start = datetime(2025, 1, 1)
+    checkpoints = (1, 1440, ROWS_PER_DAY)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {}
+        for label in ("legacy", "append"):
+            client = local_storage.Client(os.path.join(workdir, label))
+            bucket = client.bucket("all-data-sensor-bucket")
+            # flush_rows=1 adalah kasus terburuk: setiap baris langsung diunggah
+            writer = PartitionWriter(bucket, flush_rows=1)
+            costs = {}
+            for i in range(1, ROWS_PER_DAY + 1):
+                current_time = start + timedelta(seconds=30 * (i - 1))
+                row = _sample_row(current_time, i)
+                up, down = client.bytes_uploaded, client.bytes_downloaded
+                t0 = time.perf_counter()
+                if label == "legacy":
+                    _legacy_save(bucket, current_time, row, workdir)
+                else:
+                    writer.append(current_time, row)
+                elapsed = time.perf_counter() - t0
+                if i in checkpoints:
+                    costs[i] = (elapsed * 1e6, client.bytes_uploaded - up + client.bytes_downloaded - down)
+            results[label] = (costs, client.bytes_uploaded + client.bytes_downloaded)
+
+    print(f"{'metode':<8} {'baris':>6} {'waktu (us)':>12} {'byte transfer':>14}")
+    for label, (costs, total) in results.items():
+        for i, (us, nbytes) in costs.items():
+            print(f"{label:<8} {i:>6} {us:>12.1f} {nbytes:>14}")
+        print(f"{label:<8} {'total':>6} {'':>12} {total:>14}")
+    return {
+        label: {"rows": {i: {"us": us, "bytes": nbytes} for i, (us, nbytes) in costs.items()}, "total_bytes": total}
+        for label, (costs, total) in results.items()
+    }
+
+
+def bench_csv_upload():
+    """Byte yang diunggah per baris oleh data.save_to_csv harus tetap datar sepanjang hari."""
+    checkpoints = (1, 1440, ROWS_PER_DAY)
+    with tempfile.TemporaryDirectory() as workdir:
+        client = local_storage.Client(os.path.join(workdir, "bucket"))
+        storage_session.set_client(client)
+        local_file = os.path.join(workdir, "data_sensor.csv")
+        start = datetime(2025, 1, 1)
+        results = {}
+        print(f"{'baris':>6} {'byte upload':>12} {'byte/baris (kumulatif)':>24}")
+        for i in range(1, ROWS_PER_DAY + 1):
+            current_time = start + timedelta(seconds=30 * (i - 1))
+            with open(local_file, "a", newline="") as f:
+                writer = csv.writer(f)
+                if i == 1:
+                    writer.writerow(CSV_HEADER)
+                writer.writerow([current_time.strftime("%Y-%m-%d %H:%M:%S"), 12.0, 28.5, 70.1])
+            nbytes = upload_new_rows(local_file, "data-sensor-bucket", "bench_data_sensor.csv")
+            if i in checkpoints:
+                stats = storage_session.get_upload_stats("bench_data_sensor.csv").snapshot()
+                print(f"{i:>6} {nbytes:>12} {stats['bytes_per_row']:>24.1f}")
+                results[i] = {"bytes": nbytes, "bytes_per_row": stats["bytes_per_row"]}
+        storage_session.set_client(None)
+    return results
+
+
+def _timed(func, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def bench_columnar():
+    """Ukuran file dan waktu muat satu partisi harian: CSV vs arsip kolom."""
+    start = datetime(2025, 1, 1)
+    rows = []
+    for i in range(ROWS_PER_DAY):
+        row = _sample_row(start + timedelta(seconds=30 * i), i)
+        row[4] = "Relay ON" if i % 4 == 0 else "Relay OFF"
+        rows.append([str(value) for value in row])
+    csv_bytes = encode_rows(rows, PARTITION_HEADER)
+    col_bytes = encode_columnar(PARTITION_HEADER, rows)
+
+    def load_csv():
+        reader = csv.reader(csv_bytes.decode("utf-8").splitlines())
+        next(reader)
+        return [(row[0], float(row[1]), float(row[2]), float(row[3]), row[4], row[5]) for row in reader]
+
+    results = [
+        ("csv (modul csv)", len(csv_bytes), _timed(load_csv)),
+        ("kolom (semua)", len(col_bytes), _timed(lambda: decode_columnar(col_bytes))),
+        ("kolom (timestamp, amonia)", len(col_bytes), _timed(lambda: decode_columnar(col_bytes, {"timestamp", "amonia"}))),
+    ]
+    try:
+        import io
+        import pandas as pd
+        results.insert(1, ("csv (pandas)", len(csv_bytes), _timed(lambda: pd.read_csv(io.BytesIO(csv_bytes)))))
+    except ImportError:
+        pass
+
+    print(f"{'format':<28} {'ukuran (byte)':>14} {'waktu muat (ms)':>16}")
+    for label, size, ms in results:
+        print(f"{label:<28} {size:>14} {ms:>16.3f}")
+    return {label: {"bytes": size, "load_ms": ms} for label, size, ms in results}
+
+
+def _run_ingest_load(count, bridged):
+    """Producer thread mengirim `count` pesan sensor; mengembalikan (detik, pesan diproses)."""
+    import asyncio
+    import json
+    import threading
+    from ingest import IngestBridge
+    from ring_buffer import RingBuffer
+
+    payload = b'{"suhu": 28.5, "kelembapan": 70.1, "amonia": 12.0}'
+    history = RingBuffer(count)
+    processed = [0]
+
+    def handle(topic, data, recv_ts):
+        history.append(json.loads(data.decode("utf-8")), recv_ts)
+        processed[0] += 1
+
+    async def legacy_handle(topic, data, recv_ts):
+        handle(topic, data, recv_ts)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        bridge = IngestBridge(loop, handle)
+        consumer = loop.create_task(bridge.run())
+
+        def produce():
+            for _ in range(count):
+                if bridged:
+                    bridge.put("sensor/data", payload)
+                else:
+                    # Pola lama: satu run_coroutine_threadsafe per pesan
+                    asyncio.run_coroutine_threadsafe(legacy_handle("sensor/data", payload, time.time()), loop)
+
+        start = time.perf_counter()
+        producer = threading.Thread(target=produce)
+        producer.start()
+        while producer.is_alive() or processed[0] < count:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        consumer.cancel()
+        return elapsed
+
+    elapsed = asyncio.run(main())
+    return elapsed, processed[0]
+
+
+def bench_ingest():
+    """Throughput pesan MQTT sintetis dari thread jaringan ke event loop: per pesan vs batch."""
+    count = 100000
+    results = {}
+    print(f"{'jalur':<30} {'pesan':>8} {'detik':>8} {'pesan/detik':>12}")
+    for label, bridged in (("run_coroutine_threadsafe", False), ("IngestBridge (batch)", True)):
+        elapsed, processed = _run_ingest_load(count, bridged)
+        print(f"{label:<30} {processed:>8} {elapsed:>8.3f} {processed / elapsed:>12.0f}")
+        results[label] = processed / elapsed
+    return results
+
+
+def bench_stream():
+    """Ratusan subscriber SSE pada satu StreamHub: event terkirim dan waktu CPU per event."""
+    import threading
+    from stream import StreamHub, StreamPublisher, start_listener
+    from pipeline import make_reading
+
+    subscribers, events = 500, 200
+    hub = StreamHub(replay_size=events)
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    start_listener(hub, port=port)
+    publisher = StreamPublisher(port=port)
+    received = [0] * subscribers
+
+    def consume(i):
+        for chunk in hub.subscribe(keepalive=1):
+            received[i] += chunk.count(b"event: reading")
+            if received[i] >= events:
+                break
+
+    threads = [threading.Thread(target=consume, args=(i,), daemon=True) for i in range(subscribers)]
+    for thread in threads:
+        thread.start()
+    while hub.subscribers < subscribers:
+        time.sleep(0.01)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for i in range(events):
+        publisher.publish_batch([make_reading(28.5, 70.1, 12.0 + i % 40, "Relay OFF", "AUTO")])
+        time.sleep(0.002)
+    for thread in threads:
+        thread.join(timeout=10)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    delivered = sum(received)
+    print(f"subscriber: {subscribers}, event: {events}, frame terkirim: {delivered}/{subscribers * events}")
+    print(f"waktu CPU per event: {cpu / events * 1000:.3f} ms "
+          f"({cpu / delivered * 1e6:.1f} µs per subscriber per event), waktu total {wall:.2f} detik")
+    return {
+        "subscribers": subscribers,
+        "events": events,
+        "delivered": delivered,
+        "cpu_ms_per_event": cpu / events * 1000,
+        "wall_seconds": wall,
+    }
+
+
+def _peak_memory_kb(func):
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_serialize(rows=100000):
+    """/api/sensors pada `rows` baris: pandas + dict per baris vs serializer (records, columns, msgpack)."""
+    import gzip
+    import serializer
+
+    start = datetime(2025, 1, 1)
+    lines = [",".join(CSV_HEADER)]
+    for i in range(rows):
+        timestamp = (start + timedelta(seconds=30 * i)).strftime("%Y-%m-%d %H:%M:%S")
+        lines.append(f"{timestamp},{12.0 + i % 40},28.5,70.1")
+    text = "\n".join(lines) + "\n"
+
+    def legacy():
+        # Jalur lama app.py: pandas.read_csv -> dict per baris -> json
+        import io
+        import pandas as pd
+
+        data = pd.read_csv(io.StringIO(text))
+        return json.dumps({"status": "success", "data": data.to_dict(orient="records")}).encode("utf-8")
+
+    paths = [(name, lambda encode=encode: encode(serializer.parse_csv(text)))
+             for name, (encode, _) in serializer.ENCODERS.items()]
+    try:
+        import pandas  # noqa: F401
+        paths.insert(0, ("pandas (lama)", legacy))
+    except ImportError:
+        pass
+
+    results = {}
+    print(f"{'jalur':<16} {'waktu (ms)':>11} {'memori puncak (KiB)':>20} {'body (byte)':>12} {'gzip':>10} {'br':>10}")
+    for label, func in paths:
+        body = func()
+        result = {
+            "ms": _timed(func, repeat=3),
+            "peak_kb": _peak_memory_kb(func),
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, compresslevel=serializer.GZIP_LEVEL)),
+            "br_bytes": len(serializer.compress(body, "br")) if "br" in serializer.available_encodings() else None,
+        }
+        results[label] = result
+        br = "-" if result["br_bytes"] is None else result["br_bytes"]
+        print(f"{label:<16} {result['ms']:>11.1f} {result['peak_kb']:>20.0f} {result['bytes']:>12} "
+              f"{result['gzip_bytes']:>10} {br:>10}")
+    return results
+
+
+class _SlowBucket:
+    """Bucket lokal dengan jeda per permintaan metadata, meniru round trip ke GCS."""
+
+    def __init__(self, bucket, delay):
+        self.bucket = bucket
+        self.delay = delay
+        self.name = bucket.name
+
+    def get_blob(self, name):
+        time.sleep(self.delay)
+        return self.bucket.get_blob(name)
+
+
+def bench_multiday(days=30, delay=0.1):
+    """Ekspor `days` partisi harian dengan latensi storage `delay` detik: berurutan vs PartitionReader."""
+    from partition_index import PartitionIndex, read_partition
+    from partition_reader import PartitionReader
+
+    start = datetime(2025, 1, 1)
+    with tempfile.TemporaryDirectory() as workdir:
+        bucket = local_storage.Client(workdir).bucket("all-data-sensor-bucket")
+        index = PartitionIndex(bucket)
+        for day in range(days):
+            rows = [[str(value) for value in _sample_row(start + timedelta(days=day, seconds=30 * i), i)]
+                    for i in range(ROWS_PER_DAY)]
+            name = partition_name(start + timedelta(days=day))
+            bucket.blob(name).upload_from_string(encode_rows(rows, PARTITION_HEADER))
+            index.update(name, rows)
+        index.bucket = _SlowBucket(bucket, delay)
+
+        def sequential():
+            return sum(len(read_partition(index.bucket, name)) for name in index.overlapping())
+
+        reader = PartitionReader(workers=8)
+        results = {}
+        for label, func in (("berurutan", sequential), ("paralel (8 thread)", lambda: sum(1 for _ in reader.stream(index)))):
+            t0 = time.perf_counter()
+            rows = func()
+            results[label] = {"ms": (time.perf_counter() - t0) * 1000, "rows": rows}
+        reader.shutdown()
+
+    print(f"{days} partisi, latensi {delay * 1000:.0f} ms per permintaan")
+    print(f"{'metode':<20} {'waktu (ms)':>11} {'baris':>8}")
+    for label, result in results.items():
+        print(f"{label:<20} {result['ms']:>11.1f} {result['rows']:>8}")
+    return results
+
+
+def bench_alerts(readings=100000):
+    """Biaya evaluasi AlertEngine per pembacaan untuk jumlah perangkat dan aturan yang berbeda."""
+    from alert_engine import AlertEngine, AlertRule
+
+    results = {}
+    print(f"{'perangkat':>10} {'aturan/metrik':>14} {'us/pembacaan':>13} {'peringatan':>11}")
+    for devices, rules_per_metric in ((1, 2), (100, 2), (500, 2), (500, 20)):
+        events = []
+        rules = []
+        for metric in ("amonia", "suhu", "kelembapan"):
+            for i in range(rules_per_metric):
+                kind = "rate" if i % 2 else "level"
+                rules.append(AlertRule(f"{metric}_{i}", metric, 10 + i if kind == "rate" else 30 + i,
+                                       kind=kind, alpha=0.3, sustain=i, window=300))
+        engine = AlertEngine(events.append, rules)
+        device_ids = [f"esp{i:03d}" for i in range(devices)]
+        t0 = time.perf_counter()
+        for n in range(readings):
+            reading = {"suhu": 28.5, "kelembapan": 70.1, "amonia": 20.0 + (n // devices) % 20}
+            engine.evaluate(device_ids[n % devices], reading, 1000.0 + n / devices)
+        us = (time.perf_counter() - t0) / readings * 1e6
+        results[f"{devices}x{rules_per_metric}"] = {"us_per_reading": us, "events": len(events)}
+        print(f"{devices:>10} {rules_per_metric:>14} {us:>13.2f} {len(events):>11}")
+    return results
+
+
+def _drifting_readings(interval, seed=1):
+    """Satu hari pembacaan sintetis: tren lambat + derau sensor, relay mengikuti ambang amonia 30."""
+    import math
+    import random
+    from pipeline import make_reading, TIMEZONE
+
+    rng = random.Random(seed)
+    start = TIMEZONE.localize(datetime(2025, 1, 1))
+    readings = []
+    for i in range(86400 // interval):
+        t = i * interval
+        amonia = 20 + 12 * math.sin(t / 6000) + rng.gauss(0, 0.15)
+        readings.append(make_reading(
+            round(28 + 2 * math.sin(t / 9000) + rng.gauss(0, 0.05), 2),
+            round(70 + 5 * math.sin(t / 15000) + rng.gauss(0, 0.3), 1),
+            round(amonia, 2),
+            "Relay ON" if amonia > 30 else "Relay OFF", "AUTO",
+            timestamp=start + timedelta(seconds=t),
+        ))
+    return readings
+
+
+def bench_compression():
+    """Baris dan byte yang ditulis per hari tanpa vs dengan StorageCompressor, serta galat rekonstruksi."""
+    from compression import StorageCompressor, interpolate, NUMERIC_METRICS
+    from config import COMPRESSION_TOLERANCES, COMPRESSION_MAX_INTERVAL, AMONIA_AMBANG_BATAS
+
+    def to_row(reading):
+        return [reading["timestamp"].strftime("%Y-%m-%d %H:%M:%S"), reading["suhu"], reading["kelembapan"],
+                reading["amonia"], reading["relay_status"], reading["relay_mode"]]
+
+    results = {}
+    print(f"{'interval':>9} {'baris mentah':>13} {'baris simpan':>13} {'KB mentah':>10} {'KB simpan':>10} "
+          f"{'rasio':>6} {'us/baca':>8}  galat maks")
+    for interval in (5, 30):
+        readings = _drifting_readings(interval)
+        stored = []
+        compressor = StorageCompressor(
+            [stored.extend], COMPRESSION_TOLERANCES, COMPRESSION_MAX_INTERVAL,
+            thresholds=lambda device: {"amonia": [AMONIA_AMBANG_BATAS, AMONIA_AMBANG_BATAS * 0.9]},
+        )
+        t0 = time.perf_counter()
+        for k in range(0, len(readings), 20):  # Ukuran batch WalReplayer pada umumnya
+            compressor(readings[k:k + 20])
+        compressor.flush()
+        us = (time.perf_counter() - t0) / len(readings) * 1e6
+
+        raw_bytes = len(encode_rows([to_row(r) for r in readings]))
+        stored_bytes = len(encode_rows([to_row(r) for r in stored]))
+        records = [dict(r, timestamp=r["timestamp"].strftime("%Y-%m-%d %H:%M:%S")) for r in stored]
+        rebuilt = {r["timestamp"]: r for r in interpolate(records, interval, COMPRESSION_MAX_INTERVAL)}
+        errors = {}
+        for metric in NUMERIC_METRICS:
+            errors[metric] = max(
+                abs(rebuilt[r["timestamp"].strftime("%Y-%m-%d %H:%M:%S")][metric] - r[metric]) for r in readings
+            )
+        relay_kept = sum(
+            1 for a, b in zip(readings, readings[1:]) if a["relay_status"] != b["relay_status"]
+            and any(s["timestamp"] == b["timestamp"] for s in stored)
+        )
+        results[f"{interval}s"] = {
+            "raw_rows": len(readings), "stored_rows": len(stored),
+            "raw_bytes": raw_bytes, "stored_bytes": stored_bytes,
+            "ratio": raw_bytes / stored_bytes, "us_per_reading": us,
+            "max_error": errors, "relay_changes_kept": relay_kept,
+        }
+        print(f"{interval:>8}s {len(readings):>13} {len(stored):>13} {raw_bytes / 1024:>10.1f} "
+              f"{stored_bytes / 1024:>10.1f} {raw_bytes / stored_bytes:>5.1f}x {us:>8.1f}  "
+              + ", ".join(f"{metric} {error:.2f}/{COMPRESSION_TOLERANCES[metric]:g}" for metric, error in errors.items()))
+    return results
+
+
+def bench_hot_store(days=7, devices=10, delay=0.05):
+    """
+    Query rentang data terbaru: hot store SQLite (indeks perangkat + timestamp) vs partisi harian di
+    object store dengan latensi `delay` detik per permintaan; juga laju insert per baris vs per batch.
+    """
+    from partition_index import PartitionIndex
+    from pipeline import make_reading, TIMEZONE
+    from storage_backend import ObjectStoreBackend, SQLiteBackend
+
+    end = datetime.now(TIMEZONE).replace(microsecond=0)
+    start = end - timedelta(days=days)
+    readings = [
+        make_reading(28.5, 70.1, 12.0 + i % 40, "Relay OFF", "AUTO", start + timedelta(seconds=30 * i),
+                     device_id=f"kandang{device}")
+        for i in range(days * ROWS_PER_DAY) for device in range(devices)
+    ]
+    with tempfile.TemporaryDirectory() as workdir:
+        bucket = local_storage.Client(workdir).bucket("all-data-sensor-bucket")
+        index = PartitionIndex(bucket)
+        writer = PartitionWriter(bucket, index=index)
+        for reading in readings:
+            row = [reading["timestamp"].strftime("%Y-%m-%d %H:%M:%S"), reading["suhu"], reading["kelembapan"],
+                   reading["amonia"], reading["relay_status"], reading["relay_mode"]]
+            writer.append(reading["timestamp"], row, reading["device"], flush=False)
+        writer.flush()
+        index.bucket = _SlowBucket(bucket, delay)
+        store = ObjectStoreBackend(bucket=bucket)
+        store._index = index
+
+        hot = SQLiteBackend(os.path.join(workdir, "hot.db"), days=days)
+        single = readings[:2000]
+        t0 = time.perf_counter()
+        for reading in single:
+            hot.write_batch([reading])
+        per_row = len(single) / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for i in range(len(single), len(readings), 100):
+            hot.write_batch(readings[i:i + 100])
+        batched = (len(readings) - len(single)) / (time.perf_counter() - t0)
+
+        device = f"kandang{devices // 2}"
+        queries = {
+            "1 jam terakhir": lambda backend: backend.query(
+                (end - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"), None, 500, None, None, device)[0],
+            "24 jam, halaman 1": lambda backend: backend.query(
+                (end - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S"), None, 500, None, None, device)[0],
+            "ekspor 3 hari": lambda backend: sum(1 for _ in backend.stream(
+                (end - timedelta(days=3)).strftime("%Y-%m-%d %H:%M:%S"), None, ["amonia"], (device,))),
+        }
+        results = {"rows": len(readings), "insert_rows_per_s": {"per_row": per_row, "batch_100": batched}}
+        print(f"{len(readings)} baris ({devices} perangkat x {days} hari), latensi object store {delay * 1000:.0f} ms")
+        print(f"insert SQLite: {per_row:.0f} baris/detik per baris, {batched:.0f} baris/detik per batch 100")
+        print(f"{'query':<20} {'object store (ms)':>18} {'sqlite (ms)':>12}")
+        for label, query in queries.items():
+            assert query(store) == query(hot), label  # Record sama; format cursor berbeda per backend
+            results[label] = {"object_store_ms": _timed(lambda: query(store), repeat=3),
+                              "sqlite_ms": _timed(lambda: query(hot))}
+            print(f"{label:<20} {results[label]['object_store_ms']:>18.1f} {results[label]['sqlite_ms']:>12.2f}")
+        hot.close()
+        store.close()
+    return results
+
+
+def bench_e2e(args=None):
+    """Uji beban end-to-end dengan armada ESP32 simulasi, broker MQTT, GCS dan Discord tiruan."""
+    import load_test
+
+    options = {}
+    if args is not None:
+        options = dict(devices=args.devices, rate=args.rate, duration=args.duration,
+                       sample_interval=args.sample_interval)
+    results = load_test.run(**options)
+    pipeline = results["pipeline"]
+    print(f"armada: {pipeline['devices']} perangkat x {pipeline['rate_per_device']} pesan/detik")
+    print(f"pesan terkirim/diproses: {pipeline['messages_sent']}/{pipeline['messages_processed']} "
+          f"({pipeline['ingest_throughput']:.0f} pesan/detik)")
+    print(f"pembacaan ditangkap: {pipeline['rows_captured']}, melebihi laju: {pipeline['rows_rate_limited']}")
+    print(f"baris tersimpan: {pipeline['rows_persisted']}, latensi pesan -> tersimpan "
+          f"p50 {pipeline['latency_p50_ms']:.1f} ms, p99 {pipeline['latency_p99_ms']:.1f} ms")
+    print(f"pesan Discord: {pipeline['discord_messages']}")
+    print(f"perintah relay: {pipeline['commands_confirmed']} dikonfirmasi, {pipeline['commands_failed']} gagal, "
+          f"round trip p50 {pipeline['command_p50_ms']:.1f} ms, p99 {pipeline['command_p99_ms']:.1f} ms")
+    print(f"{'riwayat (baris)':>16} {'csv penuh (ms)':>15} {'csv cache (ms)':>15} {'1 jam (ms)':>11} {'rollup (ms)':>12}")
+    for row in results["api"]:
+        print(f"{row['history_rows']:>16} {row['full_csv_cold_ms']:>15.1f} {row['full_csv_cached_ms']:>15.1f} "
+              f"{row['range_last_hour_ms']:>11.1f} {row['rollup_hour_ms']:>12.1f}")
+    print(f"puncak RSS: {results['peak_rss_kb'] / 1024:.1f} MiB")
+    return results
+
+
+BENCHMARKS = {
+    "partition": bench_partition,
+    "csv_upload": bench_csv_upload,
+    "columnar": bench_columnar,
+    "ingest": bench_ingest,
+    "stream": bench_stream,
+    "serialize": bench_serialize,
+    "multiday": bench_multiday,
+    "alerts": bench_alerts,
+    "compression": bench_compression,
+    "hot_store": bench_hot_store,
+    "e2e": bench_e2e,
+}
+
+
+def _version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sistem pengendali amonia")
+    parser.add_argument("names", nargs="*", help=f"benchmark yang dijalankan: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="file JSON untuk menyimpan hasil")
+    parser.add_argument("--devices", type=int, default=20, help="e2e: jumlah ESP32 simulasi")
+    parser.add_argument("--rate", type=float, default=2.0, help="e2e: pesan per detik per perangkat")
+    parser.add_argument("--duration", type=float, default=10.0, help="e2e: lama pengiriman (detik)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="e2e: interval monitor_system_task (detik)")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"benchmark tidak dikenal: {', '.join(unknown)}")
+
+    results = {}
+    for name in args.names or list(BENCHMARKS):
+        print(f"=== {name}")
+        benchmark = BENCHMARKS[name]
+        results[name] = benchmark(args) if benchmark is bench_e2e else benchmark()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "version": _version(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "results": results,
+            }, f, indent=2)
+        print(f"✅ Hasil disimpan: {args.output}")
@@ -0,0 +1,181 @@
+import asyncio
+from collections import deque
+from datetime import datetime
+import metrics
+from pipeline import make_reading, TIMEZONE
+
+READINGS = metrics.counter("capture_readings_total", "Pesan data sensor per hasil penangkapan", ("result",))
+BATCH_SIZE = metrics.histogram(
+    "capture_batch_size", "Jumlah pembacaan per micro-batch ke pipeline persistensi",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+SEQUENCE_FIELDS = ("seq", "sequence")
+DEVICE_TIME_FIELDS = ("ts", "timestamp")
+MIN_DEVICE_EPOCH = 1577836800  # 2020-01-01: nilai lebih kecil dianggap waktu sejak boot (tanpa NTP)
+# Timestamp penyimpanan (CSV, partisi, hot store, arsip kolom) beresolusi 1 detik dan menjadi kunci baris
+# per perangkat, jadi paling banyak satu pembacaan per perangkat per detik yang bisa disimpan
+MAX_STORED_RATE = 1.0
+
+
+def device_time(value):
+    """Timestamp dari payload ESP32 (epoch detik/milidetik atau ISO 8601) -> epoch detik, atau None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        epoch = value / 1000 if value > 1e11 else float(value)
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        epoch = (parsed if parsed.tzinfo else TIMEZONE.localize(parsed)).timestamp()
+    else:
+        return None
+    return epoch if epoch >= MIN_DEVICE_EPOCH else None
+
+
+class _DeviceCapture:
+    """State penangkapan satu perangkat: kunci pesan terakhir (deduplikasi), token laju dan detik terakhir."""
+
+    __slots__ = ("recent", "seen", "tokens", "updated", "second")
+
+    def __init__(self, burst):
+        self.recent = deque()
+        self.seen = set()
+        self.tokens = float(burst)
+        self.updated = None
+        self.second = None  # Detik (epoch) pembacaan terakhir yang ditangkap
+
+
+class ReadingCapture:
+    """
+    Menangkap setiap pesan sensor saat diterima (bukan sampel monitor_system_task 30 detik sekali).
+    Pembacaan diberi timestamp saat diterima bot. Pesan ganda (QoS 1 dikirim ulang, ESP32 mengulang
+    publish) dikenali dari `seq` atau timestamp perangkat; timestamp perangkat ikut di pembacaan
+    (`device_ts`, tercatat di WAL) tetapi tidak disimpan di CSV, partisi maupun hot store.
+    Laju tersimpan per perangkat dibatasi token bucket `max_rate` pembacaan/detik (maks. MAX_STORED_RATE,
+    1 Hz) dan satu pembacaan per detik timestamp penyimpanan; firmware boleh publish lebih cepat,
+    kelebihannya dihitung sebagai melebihi laju dan tidak disimpan, tetapi tetap masuk ring buffer
+    dan mesin peringatan. Pembacaan dikirim ke pipeline per micro-batch (`put_many`).
+    Semua method dipanggil dari event loop.
+    """
+
+    def __init__(self, put_many, batch_size=50, flush_interval=1.0, max_rate=1.0, burst=5, dedup_window=64):
+        if max_rate and max_rate > MAX_STORED_RATE:
+            raise ValueError(f"Laju penangkapan maksimal {MAX_STORED_RATE:g} pembacaan/detik per perangkat "
+                             f"(timestamp penyimpanan beresolusi 1 detik), bukan {max_rate:g}")
+        self.put_many = put_many
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_rate = max_rate  # None/0: tanpa token bucket (tetap satu per detik)
+        self.burst = burst
+        self.dedup_window = dedup_window
+        self._devices = {}  # perangkat -> _DeviceCapture
+        self._batch = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.captured = 0
+        self.duplicates = 0
+        self.rate_limited = 0
+        self.batches = 0
+
+    def offer(self, device_id, data, recv_ts, relay_status=None, relay_mode=None):
+        """Satu pesan sensor yang sudah di-parse. Mengembalikan True jika pembacaan akan disimpan."""
+        suhu, kelembapan, amonia = data.get("suhu"), data.get("kelembapan"), data.get("amonia")
+        if suhu is None or kelembapan is None or amonia is None:
+            READINGS.labels("incomplete").inc()
+            return False
+        state = self._devices.get(device_id)
+        if state is None:
+            state = self._devices[device_id] = _DeviceCapture(self.burst)
+
+        raw_time = next((data[field] for field in DEVICE_TIME_FIELDS if field in data), None)
+        key = next((("seq", data[field]) for field in SEQUENCE_FIELDS if field in data), None)
+        if key is None and raw_time is not None:
+            key = ("ts", raw_time)
+        if key is not None:
+            if key in state.seen:
+                self.duplicates += 1
+                READINGS.labels("duplicate").inc()
+                return False
+            state.seen.add(key)
+            state.recent.append(key)
+            if len(state.recent) > self.dedup_window:
+                state.seen.discard(state.recent.popleft())
+
+        # Detik yang sama dengan pembacaan tersimpan sebelumnya akan dibuang penulis partisi (kunci baris)
+        second = int(recv_ts)
+        if state.second is not None and second <= state.second:
+            self.rate_limited += 1
+            READINGS.labels("rate_limited").inc()
+            return False
+
+        if self.max_rate:
+            if state.updated is not None:
+                state.tokens = min(self.burst, state.tokens + max(0.0, recv_ts - state.updated) * self.max_rate)
+            state.updated = recv_ts
+            if state.tokens < 1:
+                self.rate_limited += 1
+                READINGS.labels("rate_limited").inc()
+                return False
+            state.tokens -= 1
+        state.second = second
+
+        reading = make_reading(
+            suhu, kelembapan, amonia, relay_status, relay_mode,
+            timestamp=datetime.fromtimestamp(recv_ts, TIMEZONE), device_id=device_id,
+        )
+        device_ts = device_time(raw_time)
+        if device_ts is not None:
+            reading["device_ts"] = device_ts
+        self._batch.append(reading)
+        self.captured += 1
+        READINGS.labels("captured").inc()
+        if len(self._batch) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        """Mengirim micro-batch yang terkumpul ke pipeline persistensi."""
+        batch, self._batch = self._batch, []
+        if batch:
+            self.batches += 1
+            BATCH_SIZE.observe(len(batch))
+            await self.put_many(batch)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Menghentikan loop flush lalu mengirim sisa micro-batch."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        """Loop flush: saat batch penuh atau setiap `flush_interval` detik."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Error saat mengirim pembacaan ke pipeline: {e}")
+
+    def forget(self, device_id):
+        self._devices.pop(device_id, None)
+
+    def stats(self):
+        return {
+            "captured": self.captured,
+            "duplicates": self.duplicates,
+            "rate_limited": self.rate_limited,
+            "pending": len(self._batch),
+            "batches": self.batches,
+        }
@@ -0,0 +1,189 @@
+import asyncio
+import io
+import multiprocessing
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import numpy as np
+import pytz
+import metrics
+
+TIMEZONE = pytz.timezone("Asia/Jakarta")
+UNITS = {"amonia": "PPM", "suhu": "°C", "kelembapan": "%"}
+WINDOW_UNITS = {"m": 60, "h": 3600, "j": 3600, "d": 86400}  # menit, jam (h/j), hari
+MAX_WINDOW = 365 * 86400
+
+RENDER_SECONDS = metrics.histogram(
+    "chart_render_seconds", "Durasi menyiapkan data dan merender grafik (detik)",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+CACHE_REQUESTS = metrics.counter("chart_cache_requests_total", "Permintaan grafik per hasil cache", ("result",))
+
+
+def parse_window(text):
+    """'90m', '6h'/'6j', '7d' -> detik; angka tanpa satuan dianggap menit (seperti !history)."""
+    match = re.fullmatch(r"(\d+)([mhjd]?)", text.strip().lower())
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"Rentang waktu tidak valid: '{text}' (contoh: 90m, 6h, 7d)")
+    seconds = int(match.group(1)) * WINDOW_UNITS.get(match.group(2), 60)
+    if seconds > MAX_WINDOW:
+        raise ValueError("Rentang waktu maksimal 365 hari")
+    return seconds
+
+
+def format_window(seconds):
+    for suffix, size in (("d", 86400), ("h", 3600)):
+        if seconds % size == 0:
+            return f"{seconds // size}{suffix}"
+    return f"{seconds // 60}m"
+
+
+def rollup_resolution(seconds):
+    """Resolusi rollup terkecil yang tetap menghasilkan jumlah titik wajar untuk rentang tersebut."""
+    if seconds <= 2 * 86400:
+        return "minute"
+    if seconds <= 90 * 86400:
+        return "hour"
+    return "day"
+
+
+def downsample(timestamps, values, bucket_seconds):
+    """
+    Mengelompokkan pembacaan ring buffer (urut waktu) ke bucket `bucket_seconds` detik:
+    {"timestamps": [...], "metrics": {metrik: {"mean", "min", "max"}}}. NaN diabaikan.
+    """
+    if len(timestamps) == 0:
+        return None
+    ids = (timestamps // bucket_seconds).astype(np.int64)
+    keys, starts = np.unique(ids, return_index=True)
+    series = {"timestamps": ((keys + 0.5) * bucket_seconds).tolist(), "metrics": {}}
+    for metric, column in values.items():
+        valid = ~np.isnan(column)
+        counts = np.add.reduceat(valid.astype(np.int64), starts)
+        if not counts.any():
+            continue
+        totals = np.add.reduceat(np.where(valid, column, 0.0), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(counts > 0, totals / counts, np.nan)
+        series["metrics"][metric] = {
+            "mean": mean.tolist(),
+            "min": np.fmin.reduceat(column, starts).tolist(),
+            "max": np.fmax.reduceat(column, starts).tolist(),
+        }
+    return series if series["metrics"] else None
+
+
+def rollup_series(points, metric_names, resolution_seconds):
+    """Titik dari load_rollups -> format seri yang sama dengan downsample()."""
+    if not points:
+        return None
+    series = {"timestamps": [], "metrics": {name: {"mean": [], "min": [], "max": []} for name in metric_names}}
+    for point in points:
+        start = TIMEZONE.localize(datetime.strptime(point["timestamp"], "%Y-%m-%d %H:%M:%S")).timestamp()
+        series["timestamps"].append(start + resolution_seconds / 2)
+        for name in metric_names:
+            stats = point.get(name) or {}
+            for field in ("mean", "min", "max"):
+                value = stats.get(field)
+                series["metrics"][name][field].append(np.nan if value is None else value)
+    series["metrics"] = {
+        name: columns for name, columns in series["metrics"].items() if not all(np.isnan(columns["mean"]))
+    }
+    return series if series["metrics"] else None
+
+
+def render_png(series, title, threshold=None):
+    """
+    Merender seri menjadi PNG (bytes). Dijalankan di proses worker: matplotlib diimpor di sini
+    dengan backend Agg (tanpa display) sehingga proses bot tidak pernah memuatnya.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.dates as mdates
+    from matplotlib.figure import Figure
+
+    names = list(series["metrics"])
+    times = [datetime.fromtimestamp(epoch, TIMEZONE) for epoch in series["timestamps"]]
+    figure = Figure(figsize=(9, 2.6 * len(names) + 0.6), dpi=100)
+    axes = figure.subplots(len(names), 1, sharex=True, squeeze=False)[:, 0]
+    for ax, name in zip(axes, names):
+        columns = series["metrics"][name]
+        ax.fill_between(times, columns["min"], columns["max"], alpha=0.2, linewidth=0, label="min-maks")
+        ax.plot(times, columns["mean"], linewidth=1.4, label="rata-rata")
+        if name == "amonia" and threshold is not None:
+            ax.axhline(threshold, color="tab:red", linestyle="--", linewidth=1, label=f"ambang {threshold:g}")
+        ax.set_ylabel(f"{name.capitalize()} ({UNITS.get(name, '')})")
+        ax.grid(True, alpha=0.3)
+        ax.legend(loc="upper left", fontsize=8)
+    axes[-1].xaxis.set_major_formatter(mdates.DateFormatter("%d/%m %H:%M", tz=TIMEZONE))
+    figure.autofmt_xdate()
+    figure.suptitle(title)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class ChartRenderer:
+    """
+    Render grafik di proses worker terpisah (event loop bot tidak pernah tertahan).
+    Hasil PNG di-cache per (perangkat, metrik, rentang, bucket terbaru) dengan eviksi LRU;
+    permintaan identik yang datang bersamaan menunggu render yang sama.
+    """
+
+    def __init__(self, workers=1, cache_size=32):
+        self.workers = workers
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # key -> PNG bytes
+        self._inflight = {}  # key -> task render yang sedang berjalan
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn: worker tidak mewarisi thread bot (MQTT, WAL) seperti pada fork
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def get(self, key, build):
+        """
+        PNG untuk `key`. `build()` -> (seri, judul, ambang) dijalankan di thread hanya saat cache miss;
+        mengembalikan None jika tidak ada data.
+        """
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            CACHE_REQUESTS.labels("hit").inc()
+            return png
+        task = self._inflight.get(key)
+        if task is None:
+            CACHE_REQUESTS.labels("miss").inc()
+            task = self._inflight[key] = asyncio.ensure_future(self._render(key, build))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            CACHE_REQUESTS.labels("shared").inc()
+        return await asyncio.shield(task)
+
+    async def _render(self, key, build):
+        start = time.perf_counter()
+        series, title, threshold = await asyncio.to_thread(build)
+        if series is None:
+            return None
+        try:
+            png = await asyncio.get_running_loop().run_in_executor(
+                self._executor(), render_png, series, title, threshold
+            )
+        except BrokenProcessPool:
+            self._pool = None  # Worker mati: pool dibuat ulang pada permintaan berikutnya
+            raise
+        RENDER_SECONDS.observe(time.perf_counter() - start)
+        self._cache[key] = png
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return png
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
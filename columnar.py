@@ -0,0 +1,153 @@
+import csv
+import json
+import struct
+import sys
+from array import array
+from datetime import datetime
+import pytz
+
+# Format arsip kolom: MAGIC, panjang header (uint32 LE), header JSON, lalu blok data per kolom
+MAGIC = b"SCOL1\n"
+TIMEZONE = "Asia/Jakarta"
+ARCHIVE_PREFIX = "archive/"
+
+# Tipe kolom: kode typecode array.array
+TIMESTAMP_COLUMNS = ("timestamp",)
+FLOAT_COLUMNS = ("suhu", "kelembapan", "amonia")
+# Kolom lain (status relay, mode relay) disimpan sebagai kode uint8 + kamus
+
+
+def archive_name(partition_name):
+    """YYYY/MM/data_DD.csv -> archive/YYYY/MM/data_DD.col"""
+    return ARCHIVE_PREFIX + partition_name[:-len(".csv")] + ".col"
+
+
+def partition_of(name):
+    """Kebalikan archive_name: archive/YYYY/MM/data_DD.col -> YYYY/MM/data_DD.csv"""
+    if name.startswith(ARCHIVE_PREFIX):
+        return name[len(ARCHIVE_PREFIX):-len(".col")] + ".csv"
+    return name
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def encode_columnar(header, rows, timezone=TIMEZONE):
+    """
+    Mengubah baris CSV menjadi arsip kolom: timestamp epoch int64, pembacaan float32,
+    status/mode relay sebagai kode uint8 dengan kamus nilai.
+    """
+    tz = pytz.timezone(timezone)
+    positions = {name: i for i, name in enumerate(header)}
+    blocks = []
+    columns = []
+
+    for name in header:
+        i = positions[name]
+        if name in TIMESTAMP_COLUMNS:
+            values = array("q", (
+                int(tz.localize(datetime.strptime(row[i], "%Y-%m-%d %H:%M:%S")).timestamp()) for row in rows
+            ))
+            meta = {"name": name, "type": "q"}
+        elif name in FLOAT_COLUMNS:
+            values = array("f", (_to_float(row[i]) for row in rows))
+            meta = {"name": name, "type": "f"}
+        else:
+            dictionary = {}
+            values = array("B", (dictionary.setdefault(row[i], len(dictionary)) for row in rows))
+            if len(dictionary) > 255:
+                raise ValueError(f"Kolom '{name}' memiliki terlalu banyak nilai unik untuk kamus uint8")
+            meta = {"name": name, "type": "B", "dictionary": list(dictionary)}
+        data = values.tobytes()
+        meta["length"] = len(data)
+        columns.append(meta)
+        blocks.append(data)
+
+    offset = 0
+    for meta in columns:
+        meta["offset"] = offset
+        offset += meta["length"]
+
+    header_bytes = json.dumps({"rows": len(rows), "timezone": timezone, "columns": columns}).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(blocks)
+
+
+def read_header(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Bukan file arsip kolom yang valid!")
+    (length,) = struct.unpack_from("<I", data, len(MAGIC))
+    start = len(MAGIC) + 4
+    return json.loads(bytes(data[start:start + length])), start + length
+
+
+def decode_columnar(data, columns=None):
+    """
+    Membaca arsip kolom dan hanya men-decode kolom yang diminta.
+    Mengembalikan dict nama kolom -> array (kolom kamus dikembalikan sebagai list string).
+    """
+    data = memoryview(data)
+    header, body = read_header(data)
+    result = {}
+    for meta in header["columns"]:
+        if columns is not None and meta["name"] not in columns:
+            continue
+        values = array(meta["type"])
+        start = body + meta["offset"]
+        values.frombytes(data[start:start + meta["length"]])
+        if "dictionary" in meta:
+            dictionary = meta["dictionary"]
+            values = [dictionary[code] for code in values]
+        result[meta["name"]] = values
+    return result
+
+
+def format_timestamps(epochs, timezone=TIMEZONE):
+    """Mengubah epoch kembali ke string "YYYY-MM-DD HH:MM:SS" waktu lokal."""
+    tz = pytz.timezone(timezone)
+    return [datetime.fromtimestamp(epoch, tz).strftime("%Y-%m-%d %H:%M:%S") for epoch in epochs]
+
+
+def compact_partition(bucket, name):
+    """Mengompaksi satu partisi CSV harian menjadi arsip kolom. Mengembalikan nama arsip."""
+    reader = csv.reader(bucket.blob(name).download_as_text().splitlines())
+    header = next(reader)
+    rows = sorted((row for row in reader if row), key=lambda row: row[0])
+    target = archive_name(name)
+    bucket.blob(target).upload_from_string(encode_columnar(header, rows), content_type="application/octet-stream")
+    return target
+
+
+def compact_closed_partitions(index, today):
+    """
+    Mengompaksi semua partisi yang sudah ditutup (sebelum hari `today`, format YYYY-MM-DD)
+    dan belum memiliki arsip. Nama arsip dicatat di manifest partisi.
+    """
+    compacted = []
+    for name, entry in sorted(dict(index.partitions).items()):
+        if entry.get("archive") or entry["max_ts"][:10] >= today:
+            continue
+        try:
+            target = compact_partition(index.bucket, name)
+            index.mark_archived(name, target)
+            compacted.append(name)
+            print(f"✅ Partisi dikompaksi: {name} -> {target}")
+        except Exception as e:
+            print(f"❌ Gagal mengompaksi partisi {name}: {e}")
+    if compacted:
+        index.save()
+    return compacted
+
+
+if __name__ == "__main__":
+    # Kompaksi manual; jangan dijalankan bersamaan dengan bot karena manifest ditulis ulang
+    from storage_session import get_bucket
+    from partition_index import PartitionIndex
+    bucket_name = sys.argv[1] if len(sys.argv) > 1 else "all-data-sensor-bucket"
+    index = PartitionIndex(get_bucket(bucket_name))
+    index.load()
+    today = datetime.now(pytz.timezone(TIMEZONE)).strftime("%Y-%m-%d")
+    compact_closed_partitions(index, today)
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+import metrics
+
+ROUNDTRIP_SECONDS = metrics.histogram(
+    "command_roundtrip_seconds", "Waktu dari publish perintah sampai dikonfirmasi ESP32 (detik)", ("command",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+COMMANDS = metrics.counter("commands_total", "Perintah ke ESP32 per hasil", ("command", "result"))
+RETRIES = metrics.counter("command_retries_total", "Perintah yang dikirim ulang karena belum dikonfirmasi", ("command",))
+LATENCY_ALPHA = 0.2  # Bobot EWMA latensi per perangkat
+ECHO_MEMORY = 256  # Jumlah payload JSON terakhir yang diingat untuk mengenali pantulan broker
+
+
+def _parse(message):
+    try:
+        return json.loads(message)
+    except ValueError:
+        return message.strip()
+
+
+def expect_relay(command):
+    """Konfirmasi perintah esp32/relay: notifikasi relay dengan status (ON/OFF) atau mode (AUTO/MANUAL) baru."""
+    if command in ("ON", "OFF"):
+        field, value = "status", f"Relay {command}"
+    else:
+        field, value = "mode", command
+    return lambda kind, data: kind == "status" and isinstance(data, dict) and data.get(field) == value
+
+
+def expect_setting(command, duration_ms):
+    """Konfirmasi relay/setting: ESP32 mengirim balik durasi yang diterapkan untuk `command`."""
+    def match(kind, data):
+        if kind != "setting" or not isinstance(data, dict) or data.get("command") != command:
+            return False
+        try:
+            return int(float(data.get("duration"))) == duration_ms
+        except (TypeError, ValueError):
+            return False
+    return match
+
+
+def expect_ammonia(value):
+    """Konfirmasi relay/ammonia: ESP32 mengirim balik ambang yang diterapkan (angka atau {"value": ...})."""
+    def match(kind, data):
+        if kind != "ammonia":
+            return False
+        try:
+            return float(data.get("value") if isinstance(data, dict) else data) == float(value)
+        except (TypeError, ValueError):
+            return False
+    return match
+
+
+class CommandResult:
+    __slots__ = ("cid", "confirmed", "attempts", "latency")
+
+    def __init__(self, cid, confirmed, attempts, latency):
+        self.cid = cid
+        self.confirmed = confirmed
+        self.attempts = attempts
+        self.latency = latency  # Detik sejak publish pertama sampai konfirmasi (None jika gagal)
+
+
+class _Command:
+    __slots__ = ("cid", "device_id", "name", "expect", "future", "started")
+
+    def __init__(self, cid, device_id, name, expect, future):
+        self.cid = cid
+        self.device_id = device_id
+        self.name = name
+        self.expect = expect
+        self.future = future
+        self.started = time.monotonic()
+
+
+class CommandBus:
+    """
+    Perintah ke ESP32 dengan konfirmasi. Payload JSON diberi correlation id (`cid`); konfirmasi dicocokkan
+    dengan pesan yang kembali di relay/notifications atau topik setting: `cid` yang sama jika firmware
+    mengirimnya balik, selain itu `expect(jenis, data)` (status/nilai yang diterapkan) untuk perintah
+    tertua perangkat tersebut, jadi firmware lama yang tidak mengenal `cid` tetap bisa mengonfirmasi.
+    Pantulan payload milik bot sendiri (bot ikut berlangganan topik setting) diabaikan sebanyak payload
+    itu dipublish; salinan berikutnya berasal dari ESP32 dan dihitung sebagai konfirmasi.
+    Perintah yang belum dikonfirmasi dalam `timeout` detik dikirim ulang sampai `retries` kali.
+    Semua method dipanggil dari event loop.
+    """
+
+    def __init__(self, publish, timeout=5.0, retries=2):
+        self.publish = publish  # publish(template, payload, device_id) -> True jika langsung terkirim
+        self.timeout = timeout
+        self.retries = retries
+        self._pending = {}  # perangkat -> [_Command] urut waktu kirim
+        self._by_cid = {}
+        self._devices = {}  # perangkat -> [terkonfirmasi, gagal, latensi terakhir, EWMA latensi]
+        self._published = OrderedDict()  # payload JSON ber-cid -> pantulan broker yang masih ditunggu
+
+    async def send(self, device_id, name, template, payload, expect):
+        """Publish `payload` (str atau dict) lalu menunggu konfirmasi. Mengembalikan CommandResult."""
+        loop = asyncio.get_running_loop()
+        cid, payload = self._stamp(payload)
+        command = _Command(cid, device_id, name, expect, loop.create_future())
+        self._pending.setdefault(device_id, []).append(command)
+        self._by_cid[cid] = command
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    RETRIES.labels(name).inc()
+                    print(f"⚠ Perintah {name} ({cid}) belum dikonfirmasi, dikirim ulang ({attempt}/{self.retries})")
+                # Perintah bersifat idempoten (mengatur state), pengiriman ulang memakai payload dan cid yang sama
+                self._publish(template, payload, device_id)
+                try:
+                    latency = await asyncio.wait_for(asyncio.shield(command.future), self.timeout)
+                except asyncio.TimeoutError:
+                    continue
+                return CommandResult(cid, True, attempt + 1, latency)
+            COMMANDS.labels(name, "timeout").inc()
+            self._stats(device_id)[1] += 1
+            return CommandResult(cid, False, self.retries + 1, None)
+        finally:
+            self._discard(command)
+
+    def post(self, device_id, template, payload):
+        """Publish tanpa menunggu konfirmasi (mis. pengaturan awal); pantulannya tetap dikenali."""
+        return self._publish(template, self._stamp(payload)[1], device_id)
+
+    def _stamp(self, payload):
+        """Correlation id baru; payload dict diberi `cid`."""
+        cid = uuid.uuid4().hex[:12]
+        if isinstance(payload, dict):
+            payload = json.dumps(dict(payload, cid=cid))
+        return cid, payload
+
+    def _publish(self, template, payload, device_id):
+        """Publish dan mencatat satu pantulan broker yang akan diabaikan untuk payload JSON ber-cid."""
+        if payload.startswith("{"):
+            self._published[payload] = self._published.get(payload, 0) + 1
+            self._published.move_to_end(payload)
+            while len(self._published) > ECHO_MEMORY:
+                self._published.popitem(last=False)
+        return self.publish(template, payload, device_id)
+
+    def on_message(self, device_id, kind, message):
+        """
+        Dipanggil untuk setiap pesan status/setting/ammonia. Mengembalikan True jika pesan hanyalah
+        pantulan perintah bot sendiri (bukan state dari ESP32).
+        """
+        echoes = self._published.get(message)
+        if echoes:
+            # Pantulan broker; firmware yang memantulkan payload apa adanya mengirim salinan tambahan
+            if echoes > 1:
+                self._published[message] = echoes - 1
+            else:
+                del self._published[message]
+            return True
+        pending = self._pending.get(device_id)
+        if not pending:
+            return False
+        data = _parse(message)
+        command = self._by_cid.get(data.get("cid")) if isinstance(data, dict) else None
+        if command is not None:
+            self._confirm(command)
+            return False
+        for command in pending:
+            if not command.future.done() and command.expect(kind, data):
+                self._confirm(command)
+                break
+        return False
+
+    def _confirm(self, command):
+        if command.future.done():
+            return
+        latency = time.monotonic() - command.started
+        ROUNDTRIP_SECONDS.labels(command.name).observe(latency)
+        COMMANDS.labels(command.name, "confirmed").inc()
+        stats = self._stats(command.device_id)
+        stats[0] += 1
+        stats[2] = latency
+        stats[3] = latency if stats[3] is None else stats[3] + LATENCY_ALPHA * (latency - stats[3])
+        command.future.set_result(latency)
+
+    def _discard(self, command):
+        self._by_cid.pop(command.cid, None)
+        pending = self._pending.get(command.device_id)
+        if pending is not None:
+            pending.remove(command)
+            if not pending:
+                del self._pending[command.device_id]
+
+    def _stats(self, device_id):
+        stats = self._devices.get(device_id)
+        if stats is None:
+            stats = self._devices[device_id] = [0, 0, None, None]
+        return stats
+
+    def latency(self, device_id):
+        """Ringkasan respons perangkat: jumlah terkonfirmasi/gagal, latensi terakhir dan rata-rata (detik)."""
+        confirmed, failed, last, average = self._devices.get(device_id, (0, 0, None, None))
+        return {"confirmed": confirmed, "failed": failed, "last": last, "average": average}
+
+    def forget(self, device_id):
+        self._devices.pop(device_id, None)
+
+    def pending(self):
+        return len(self._by_cid)
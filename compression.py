@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta
+import metrics
+from device_registry import DEFAULT_DEVICE_ID
+
+READINGS = metrics.counter("compression_readings_total", "Pembacaan yang masuk tahap kompresi per hasil", ("result",))
+NUMERIC_METRICS = ("suhu", "kelembapan", "amonia")
+STATE_FIELDS = ("relay_status", "relay_mode")
+
+
+class _Door:
+    """State swinging door satu perangkat: titik jangkar terakhir yang disimpan dan titik yang ditahan."""
+
+    __slots__ = ("anchor", "anchor_ts", "held", "held_ts", "slopes")
+
+    def __init__(self, reading, ts):
+        self.anchor = reading
+        self.anchor_ts = ts
+        self.held = None  # Pembacaan terakhir di dalam koridor (disimpan jika pintu tertutup)
+        self.held_ts = None
+        self.slopes = {}  # metrik -> [kemiringan bawah, kemiringan atas] dari jangkar
+
+    def copy(self):
+        door = _Door(self.anchor, self.anchor_ts)
+        door.held = self.held
+        door.held_ts = self.held_ts
+        door.slopes = {metric: list(bounds) for metric, bounds in self.slopes.items()}
+        return door
+
+
+class StorageCompressor:
+    """
+    Tahap kompresi swinging-door di depan sink penyimpanan (CSV lama dan partisi GCS).
+    Pembacaan yang dapat direkonstruksi dengan interpolasi linear antar titik tersimpan dalam
+    toleransi per metrik tidak ditulis: titik baru hanya ditahan jika garis dari jangkar ke titik
+    tersebut masih berada dalam koridor (irisan rentang kemiringan) semua titik sebelumnya. Selalu disimpan: pembacaan pertama perangkat, perubahan
+    status/mode relay, perpotongan ambang (`thresholds(perangkat)` -> {metrik: [nilai]}),
+    nilai kosong, dan minimal satu titik setiap `max_interval` detik.
+
+    State baru diterapkan setelah semua sink berhasil, sehingga batch yang dikirim ulang oleh
+    WalReplayer menghasilkan keputusan yang sama. Titik yang ditahan ditulis oleh `flush()`
+    saat bot berhenti; jika proses mati mendadak hanya segmen terakhir per perangkat yang kasar.
+    """
+
+    def __init__(self, sinks, tolerances, max_interval=900.0, thresholds=None):
+        self.sinks = sinks
+        self.tolerances = dict(tolerances)
+        self.max_interval = max_interval
+        self.thresholds = thresholds
+        self._doors = {}  # perangkat -> _Door
+        self.received = 0
+        self.stored = 0
+
+    def __call__(self, readings):
+        doors = {}
+        kept = []
+        for reading in readings:
+            device = reading.get("device", DEFAULT_DEVICE_ID)
+            door = doors.get(device)
+            if door is None:
+                door = self._doors.get(device)
+                door = door.copy() if door is not None else None
+            door, rows = self._step(device, door, reading)
+            doors[device] = door
+            kept.extend(rows)
+        self._ship(kept)
+        self._doors.update(doors)
+        self.received += len(readings)
+        self.stored += len(kept)
+        READINGS.labels("stored").inc(len(kept))
+        READINGS.labels("dropped").inc(max(0, len(readings) - len(kept)))
+
+    def _ship(self, rows):
+        for sink in self.sinks:
+            sink(rows)
+
+    def _step(self, device, door, reading):
+        ts = reading["timestamp"].timestamp()
+        if door is None:
+            return _Door(reading, ts), [reading]
+        if ts <= (door.held_ts or door.anchor_ts):
+            return door, []  # Sudah diproses (kiriman ulang) atau lebih lama dari titik terakhir
+
+        previous = door.held or door.anchor
+        if self._must_keep(device, door, previous, reading, ts):
+            rows = [door.held, reading] if door.held is not None else [reading]
+            return _Door(reading, ts), rows
+
+        elapsed = ts - door.anchor_ts
+        slopes = {}
+        for metric, tolerance in self.tolerances.items():
+            value, origin = reading[metric], door.anchor[metric]
+            low = (value - tolerance - origin) / elapsed
+            high = (value + tolerance - origin) / elapsed
+            if door.held is not None:
+                bounds = door.slopes[metric]
+                if not bounds[0] <= (value - origin) / elapsed <= bounds[1]:
+                    # Garis jangkar -> pembacaan ini akan keluar toleransi untuk titik di antaranya:
+                    # pintu tertutup, titik yang ditahan disimpan dan menjadi jangkar baru
+                    held = door.held
+                    door, rows = self._step(device, _Door(held, door.held_ts), reading)
+                    return door, [held] + rows
+                low, high = max(low, bounds[0]), min(high, bounds[1])
+            slopes[metric] = [low, high]
+
+        door.slopes = slopes
+        door.held = reading
+        door.held_ts = ts
+        return door, []
+
+    def _must_keep(self, device, door, previous, reading, ts):
+        if ts - door.anchor_ts >= self.max_interval:
+            return True
+        if any(reading.get(field) != previous.get(field) for field in STATE_FIELDS):
+            return True
+        values = [(reading.get(metric), previous.get(metric), door.anchor.get(metric)) for metric in self.tolerances]
+        if any(not _is_number(value) for triple in values for value in triple):
+            return True
+        if self.thresholds is not None:
+            for metric, levels in self.thresholds(device).items():
+                value, before = reading.get(metric), previous.get(metric)
+                if _is_number(value) and _is_number(before):
+                    if any((before < level) != (value < level) for level in levels):
+                        return True
+        return False
+
+    def flush(self):
+        """Menulis titik yang masih ditahan (dipanggil saat bot berhenti)."""
+        held = []
+        for device, door in list(self._doors.items()):
+            if door.held is not None:
+                held.append(door.held)
+                self._doors[device] = _Door(door.held, door.held_ts)
+        if held:
+            self._ship(held)
+            self.stored += len(held)
+            READINGS.labels("stored").inc(len(held))
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "stored": self.stored,
+            "ratio": self.received / self.stored if self.stored else 0.0,
+        }
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and value == value
+
+
+def _parse(timestamp):
+    return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+
+
+def interpolate(records, step, max_gap, metrics=NUMERIC_METRICS):
+    """
+    Generator: record tersimpan (urut waktu, timestamp "YYYY-MM-DD HH:MM:SS") ditambah titik setiap
+    `step` detik di antara dua record yang berjarak tidak lebih dari `max_gap` detik. Metrik angka
+    diinterpolasi linear, kolom lain mengikuti record sebelumnya; titik buatan diberi "interpolated": True.
+    """
+    previous = previous_time = None
+    for record in records:
+        current_time = _parse(record["timestamp"])
+        if previous is not None:
+            gap = (current_time - previous_time).total_seconds()
+            if step < gap <= max_gap:
+                offset = step
+                while offset < gap:
+                    point = dict(previous)
+                    point["timestamp"] = (previous_time + timedelta(seconds=offset)).strftime("%Y-%m-%d %H:%M:%S")
+                    fraction = offset / gap
+                    for metric in metrics:
+                        start, end = previous.get(metric), record.get(metric)
+                        if _is_number(start) and _is_number(end):
+                            point[metric] = round(start + (end - start) * fraction, 4)
+                    point["interpolated"] = True
+                    yield point
+                    offset += step
+        yield record
+        previous, previous_time = record, current_time
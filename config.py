@@ -10,12 +10,95 @@ CHANNEL_NAME: Final[str] = os.getenv("CHANNEL_NAME")  # Nama saluran Discord (op
 
 # ESP32 Config
 AMONIA_AMBANG_BATAS = 30  # Ambang batas Amonia untuk memicu notifikasi otomatis
+ESP32_OFFLINE_TIMEOUT = 60  # Detik tanpa pesan sebelum ESP32 dianggap offline
+DEVICE_OFFLINE_TIMEOUTS = {}  # Batas waktu khusus per perangkat, contoh: {"kandang2": 120}
+
+# Storage Config
+GCS_FLUSH_ROWS = 10  # Jumlah baris yang ditampung sebelum diunggah sebagai satu chunk
+GCS_FLUSH_INTERVAL = 300  # Batas waktu (detik) sebelum baris tertunda diunggah
+# Backend data sensor: "gcs", "local" (object store di folder STORAGE_LOCAL_ROOT) atau
+# "sqlite" (hot store untuk HOT_STORE_DAYS hari terakhir, lebih lama dipindah ke STORAGE_ARCHIVE)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+STORAGE_ARCHIVE = os.getenv("STORAGE_ARCHIVE", "gcs")  # Object store tujuan data lama hot store: gcs atau local
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", "storage")  # Folder bucket untuk backend local
+HOT_STORE_PATH = os.getenv("HOT_STORE_PATH", "hot_store.db")  # File SQLite hot store (dibaca juga oleh app.py)
+HOT_STORE_DAYS = 7  # Jumlah hari penuh terakhir yang disimpan di hot store
+
+# Write-Ahead Log Config
+WAL_DIR = "wal"  # Folder segmen write-ahead log
+WAL_SEGMENT_BYTES = 4 * 1024 * 1024  # Ukuran maksimal satu segmen
+WAL_MAX_BYTES = 256 * 1024 * 1024  # Batas total ukuran WAL; segmen tertua dibuang jika terlampaui
+WAL_REPLAY_BATCH = 100  # Jumlah data per batch saat mengirim isi WAL ke penyimpanan
+
+# Notification Config
+NOTIFY_COALESCE_WINDOW = 60  # Peringatan sejenis dalam jendela ini (detik) digabung menjadi satu pesan
+NOTIFY_RATE = 1.0  # Laju pengiriman maksimal per channel (pesan/detik)
+NOTIFY_BURST = 5  # Jumlah pesan yang boleh dikirim beruntun sebelum dibatasi
+
+# Alert Config
+AMONIA_ALERT_RULE = "amonia_tinggi"  # Aturan yang diatur oleh !set_ammonia
+ALERT_RULES = [  # Aturan bawaan; perubahan lewat !alert_set disimpan ke ALERT_RULES_PATH
+    # Amonia (EWMA) di atas ambang minimal 10 detik; selesai setelah turun di bawah 90% ambang
+    {"name": AMONIA_ALERT_RULE, "metric": "amonia", "enter": AMONIA_AMBANG_BATAS, "alpha": 0.3, "sustain": 10},
+    # Amonia naik lebih dari 10 PPM per 5 menit, bertahan minimal 1 menit
+    {"name": "amonia_naik_cepat", "metric": "amonia", "kind": "rate", "enter": 10, "exit": 2, "window": 300,
+     "sustain": 60},
+]
+ALERT_REPEAT_INTERVAL = 30  # Jeda minimal (detik) pengulangan peringatan yang masih aktif
+ALERT_RULES_PATH = "alert_rules.json"  # File aturan peringatan yang diubah saat runtime
+
+# Compression Config
+# Toleransi (satuan metrik) kompresi swinging-door sebelum disimpan ke CSV/GCS; {} untuk menonaktifkan
+COMPRESSION_TOLERANCES = {"suhu": 0.2, "kelembapan": 1.0, "amonia": 0.5}
+COMPRESSION_MAX_INTERVAL = 900  # Minimal satu pembacaan per perangkat disimpan setiap sekian detik
+
+# Metrics Config
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Alamat endpoint /metrics (Prometheus) milik bot
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))  # Port endpoint /metrics; 0 untuk menonaktifkan
+
+# Chart Config
+CHART_WORKERS = 1  # Jumlah proses worker untuk render grafik
+CHART_CACHE_SIZE = 32  # Jumlah gambar grafik yang disimpan di cache
+CHART_POINTS = 240  # Target jumlah titik per grafik (data di memori dikelompokkan per bucket)
+CHART_MIN_BUCKET = 10  # Lebar bucket minimal (detik)
+CHART_DEFAULT_WINDOW = "6h"  # Rentang default !chart
+
+# History Config
+HISTORY_CAPACITY = 17280  # Jumlah pembacaan per perangkat di ring buffer (24 jam untuk interval 5 detik)
+
+# Capture Config
+# "event": setiap pesan sensor disimpan saat diterima; "snapshot": sampel monitor_system_task (30 detik) seperti dulu
+CAPTURE_MODE = "event"
+# Pembacaan tersimpan per perangkat per detik, maksimal 1 (timestamp penyimpanan beresolusi 1 detik; nilai
+# lebih besar ditolak saat bot dibuat); 0 tanpa token bucket. Firmware boleh publish lebih cepat
+CAPTURE_MAX_RATE = 1.0
+CAPTURE_BURST = 5  # Pembacaan beruntun yang masih diterima di atas laju di bawah 1 Hz (jitter jaringan)
+CAPTURE_BATCH_SIZE = 50  # Jumlah pembacaan per micro-batch ke pipeline
+CAPTURE_FLUSH_INTERVAL = 1.0  # Batas waktu (detik) sebelum micro-batch yang belum penuh dikirim
+CAPTURE_DEDUP_WINDOW = 64  # Jumlah seq/timestamp perangkat terakhir yang diingat untuk deduplikasi
+
+# Persistence Pipeline Config
+PIPELINE_MAXSIZE = 1000  # Kapasitas antrean data yang menunggu disimpan
+PIPELINE_BATCH_SIZE = 20  # Jumlah data maksimal per batch penyimpanan
+PIPELINE_POLICY = "drop_oldest"  # Kebijakan saat antrean penuh: drop_oldest, block, spill
+PIPELINE_WORKERS = 1  # Jumlah worker thread penyimpanan
+PIPELINE_SPILL_PATH = "pipeline_spill.jsonl"  # File spill untuk kebijakan "spill"
 
 # MQTT Config
 MQTT_BROKER: Final[str] = os.getenv("MQTT_BROKER") # MQTT Broker link
 MQTT_PORT: Final[int] = int(os.getenv("MQTT_PORT")) # Port untuk koneksi TLS
 MQTT_USER: Final[str] = os.getenv("MQTT_USER") # MQTT User
 MQTT_PASSWORD: Final[str] = os.getenv("MQTT_PASSWORD") #MQTT password
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "amonia-bot")  # ID tetap agar session persisten di broker
+MQTT_CONTROL_QOS = 1  # QoS untuk perintah dan topik kontrol (at-least-once)
+MQTT_RECONNECT_MIN_DELAY = 1.0  # Jeda awal koneksi ulang (detik), berlipat ganda setiap percobaan gagal
+MQTT_RECONNECT_MAX_DELAY = 60.0  # Jeda koneksi ulang maksimal (detik)
+MQTT_OUTBOUND_BUFFER = 1000  # Jumlah perintah yang ditahan selama koneksi terputus
+COMMAND_TIMEOUT = 5.0  # Batas waktu (detik) menunggu konfirmasi ESP32 per percobaan
+COMMAND_RETRIES = 2  # Jumlah pengiriman ulang perintah yang belum dikonfirmasi
+# False untuk firmware yang tidak melaporkan status/nilai setelah perintah: mode dan ambang tetap dicatat
+# bot walaupun tidak dikonfirmasi (seperti sebelum ada konfirmasi)
+COMMAND_REQUIRE_ACK = os.getenv("COMMAND_REQUIRE_ACK", "1") not in ("0", "false", "False")
 MQTT_RELAY_STATUS_TOPIC = "relay/notifications"  # Topik untuk pemberitahuan relay
 MQTT_RELAY_CONTROL_TOPIC = "esp32/relay"  # Topik kontrol relay
 MQTT_SENSOR_DATA_TOPIC =  "sensor/data" # Topik data sensor
@@ -24,6 +107,18 @@ MQTT_AMMONIA_THRESHOLD_TOPIC = "relay/ammonia"; # Topik ambang batas amonia
 MQTT_HEARTBEAT_TOPIC = "esp32/heartbeat"; # Topik heartbeat 
 MQTT_RESTART_TOPIC = "esp32/restart"; # Topik restart
 
+# Multi-device: "+" pada topik di bawah adalah ID perangkat (kandang)
+MQTT_DEVICE_RELAY_STATUS_TOPIC = "relay/+/notifications"
+MQTT_DEVICE_RELAY_CONTROL_TOPIC = "esp32/+/relay"
+MQTT_DEVICE_SENSOR_DATA_TOPIC = "sensor/+/data"
+MQTT_DEVICE_RELAY_SETTING_TOPIC = "relay/+/setting"
+MQTT_DEVICE_AMMONIA_THRESHOLD_TOPIC = "relay/+/ammonia"
+MQTT_DEVICE_HEARTBEAT_TOPIC = "esp32/+/heartbeat"
+MQTT_DEVICE_RESTART_TOPIC = "esp32/+/restart"
+INGEST_BATCH_SIZE = 500  # Jumlah pesan MQTT yang diproses per giliran event loop
+INGEST_MAX_PENDING = 100000  # Batas antrean pesan MQTT yang belum diproses
+MAX_DEVICES = 500  # Batas jumlah perangkat yang disimpan di registry
+
 
 
 
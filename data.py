@@ -1,48 +1,125 @@
 import csv
-from datetime import datetime
-from google.cloud import storage  # Google Cloud Storage library
-import pytz  # Library untuk timezone-aware datetime
+import os
+import threading
+from storage_session import get_bucket, append_object, get_upload_stats
+from pipeline import make_reading
+from device_registry import DEFAULT_DEVICE_ID
+
+CSV_HEADER = ["timestamp", "amonia", "suhu", "kelembapan"]
+
+# Offset (byte) file lokal yang sudah berhasil diunggah, per file tujuan
+_uploaded_offsets = {}
+_upload_lock = threading.Lock()
+# Timestamp baris terakhir per file lokal, agar pengiriman ulang dari WAL tidak menulis baris ganda
+_last_timestamps = {}
+
+
+def _last_timestamp(local_file):
+    """Timestamp baris terakhir di file lokal (dibaca dari ekor file), atau None."""
+    if local_file not in _last_timestamps:
+        last = None
+        if os.path.exists(local_file):
+            with open(local_file, "rb") as f:
+                f.seek(max(0, os.path.getsize(local_file) - 4096))
+                lines = f.read().splitlines()
+            if lines and not lines[-1].startswith(b"timestamp"):
+                last = lines[-1].split(b",", 1)[0].decode("utf-8")
+        _last_timestamps[local_file] = last
+    return _last_timestamps[local_file]
+
+
+def _resume_offset(blob, local_file):
+    """
+    Menentukan offset awal upload saat proses baru mulai.
+    Objek di bucket adalah sumber kebenaran: jika ukurannya tidak melebihi file lokal,
+    upload dilanjutkan dari ukuran tersebut. Jika file lokal lebih kecil (mis. /tmp terhapus),
+    file lokal dianggap baru sehingga hanya header yang dilewati.
+    """
+    remote = blob.bucket.get_blob(blob.name)
+    if remote is None:
+        return 0
+    local_size = os.path.getsize(local_file)
+    if remote.size <= local_size:
+        return remote.size
+    with open(local_file, "rb") as f:
+        return len(f.readline())
+
+
+def upload_new_rows(local_file, bucket_name, filename):
+    """
+    Mengunggah hanya baris yang ditambahkan sejak upload terakhir yang berhasil.
+    Mengembalikan jumlah byte yang diunggah.
+    """
+    with _upload_lock:
+        bucket = get_bucket(bucket_name)
+        key = (bucket_name, filename)
+        offset = _uploaded_offsets.get(key)
+        if offset is None:
+            offset = _resume_offset(bucket.blob(filename), local_file)
+
+        with open(local_file, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        if not data:
+            return 0
+
+        nbytes = append_object(bucket, filename, data, exists=offset > 0)
+        _uploaded_offsets[key] = offset + nbytes
+        rows = data.count(b"\n") - (1 if offset == 0 else 0)  # header tidak dihitung
+        get_upload_stats(filename).record(nbytes, rows)
+        return nbytes
+
+
+def save_to_csv_batch(readings, bucket_name="data-sensor-bucket", filename="data_sensor.csv"):
+    """
+    Menyimpan beberapa data sensor sekaligus ke file CSV lokal, lalu mengunggah
+    baris-baris baru tersebut dalam satu upload. Error diteruskan ke pemanggil.
+    File lama ini hanya berisi data perangkat default (tanpa kolom perangkat).
+    Baris yang tidak lebih baru dari baris terakhir file dilewati (idempoten untuk replay WAL);
+    baris lokal yang gagal diunggah sebelumnya ikut diunggah pada panggilan berikutnya.
+    """
+    # File CSV sementara di lokal
+    local_file = "/tmp/" + filename
+
+    last = _last_timestamp(local_file)
+    readings = [
+        reading for reading in readings
+        if reading.get("device", DEFAULT_DEVICE_ID) == DEFAULT_DEVICE_ID
+        and (last is None or reading["timestamp"].strftime("%Y-%m-%d %H:%M:%S") > last)
+    ]
+    if not readings:
+        if os.path.exists(local_file):
+            upload_new_rows(local_file, bucket_name, filename)
+        return
+
+    # Cek apakah file lokal sudah ada untuk menentukan apakah diperlukan header
+    file_exists = os.path.exists(local_file)
+
+    # Menulis data ke file CSV
+    with open(local_file, mode="a", newline="") as file:
+        writer = csv.writer(file)
+        if not file_exists:  # Tambahkan header jika file belum ada
+            writer.writerow(CSV_HEADER)
+        for reading in readings:
+            timestamp = reading["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
+            writer.writerow([timestamp, reading["amonia"], reading["suhu"], reading["kelembapan"]])
+    _last_timestamps[local_file] = timestamp
+
+    print(f"✅ Data tersimpan di lokal: {local_file}")
+
+    # Upload hanya baris baru ke Google Cloud Storage (append dengan compose)
+    nbytes = upload_new_rows(local_file, bucket_name, filename)
+    print(f"✅ Data berhasil diunggah ke Google Cloud Storage: {bucket_name}/{filename} (+{nbytes} byte)")
+
 
 # Fungsi untuk menyimpan data ke file CSV dan langsung mengunggahnya ke Google Cloud Storage
 def save_to_csv(suhu, kelembapan, amonia, bucket_name="data-sensor-bucket", filename="data_sensor.csv"):
     """
-    Menyimpan satu baris data sensor ke file CSV dan langsung mengunggahnya 
+    Menyimpan satu baris data sensor ke file CSV dan langsung mengunggahnya
     ke Google Cloud Storage secara real-time.
     """
     try:
-        # File CSV sementara di lokal
-        local_file = "/tmp/" + filename
-
-        # Cek apakah file lokal sudah ada untuk menentukan apakah diperlukan header
-        file_exists = False
-        try:
-            with open(local_file, "r") as _:
-                file_exists = True
-        except FileNotFoundError:
-            file_exists = False
-
-        # Menulis data ke file CSV
-        with open(local_file, mode="a", newline="") as file:
-            writer = csv.writer(file)
-            if not file_exists:  # Tambahkan header jika file belum ada
-                writer.writerow(["timestamp", "amonia", "suhu", "kelembapan"])
-            
-            # Membuat timestamp timezone-aware sesuai timezone lokal atau UTC
-            local_timezone = pytz.timezone("Asia/Jakarta")  # Ganti timezone sesuai kebutuhan Anda
-            timestamp = datetime.now(local_timezone).strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Tambahkan data baru dengan timestamp saat ini
-            writer.writerow([timestamp, amonia, suhu, kelembapan])
-
-        print(f"✅ Data tersimpan di lokal: {local_file}")
-
-        # Upload file CSV ke Google Cloud Storage
-        client = storage.Client()  # Inisialisasi Google Cloud Storage client
-        bucket = client.bucket(bucket_name)  # Akses bucket tertentu
-        blob = bucket.blob(filename)  # Tentukan nama file di bucket
-        blob.upload_from_filename(local_file)  # Unggah file dari lokal ke bucket
-        print(f"✅ Data berhasil diunggah ke Google Cloud Storage: {bucket_name}/{filename}")
-
+        # Timestamp timezone-aware Asia/Jakarta diisi oleh make_reading
+        save_to_csv_batch([make_reading(suhu, kelembapan, amonia)], bucket_name, filename)
     except Exception as e:
         print(f"❌ Terjadi kesalahan saat menyimpan atau mengunggah data: {e}")
-
@@ -0,0 +1,83 @@
+import re
+import threading
+from collections import OrderedDict
+
+# ID perangkat untuk topik lama tanpa ID (sensor/data, relay/notifications, ...)
+DEFAULT_DEVICE_ID = "default"
+# ID perangkat dipakai di nama objek dan path lokal (devices/<id>/...), jadi dibatasi ke karakter aman
+DEVICE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class DeviceState:
+    """State ringkas satu ESP32. __slots__ menjaga memori tetap kecil untuk ratusan perangkat."""
+
+    __slots__ = (
+        "device_id",
+        "sensor_data",
+        "relay_status",
+        "relay_mode",
+        "relay_on_duration",
+        "relay_off_duration",
+        "ammonia_threshold",
+        "last_message_time",
+        "is_online",
+        "history",
+    )
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.sensor_data = {}
+        self.relay_status = None
+        self.relay_mode = None
+        self.relay_on_duration = None
+        self.relay_off_duration = None
+        self.ammonia_threshold = None
+        self.last_message_time = None  # Waktu terakhir penerimaan pesan dari perangkat ini
+        self.is_online = False
+        self.history = None  # RingBuffer riwayat pembacaan, dibuat saat data sensor pertama masuk
+
+
+class DeviceRegistry:
+    """
+    Registry state per perangkat dengan lookup O(1) berdasarkan device id.
+    Jumlah perangkat dibatasi; perangkat yang paling lama tidak mengirim pesan dilepas lebih dulu.
+    Perangkat default (topik lama) tidak pernah dilepas.
+    """
+
+    def __init__(self, max_devices=500, on_evict=None):
+        self.max_devices = max_devices
+        self.on_evict = on_evict  # Dipanggil dengan device id saat state dilepas
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, device_id):
+        return self._devices.get(device_id)
+
+    def get_or_create(self, device_id):
+        """Mengambil state perangkat dan menandainya sebagai yang terbaru aktif."""
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = DeviceState(device_id)
+                if len(self._devices) > self.max_devices:
+                    # Perangkat default dilewati: state topik lama dipakai !info, !ping, !config tanpa argumen dan liveness
+                    evicted = next((key for key in self._devices if key != DEFAULT_DEVICE_ID), None)
+                    if evicted is not None:
+                        del self._devices[evicted]
+                        print(f"⚠ Registry perangkat penuh, state '{evicted}' dilepas.")
+                        if self.on_evict is not None:
+                            self.on_evict(evicted)
+            else:
+                self._devices.move_to_end(device_id)
+            return state
+
+    def devices(self):
+        """Salinan daftar state perangkat (aman diiterasi dari thread lain)."""
+        with self._lock:
+            return list(self._devices.values())
+
+    def __contains__(self, device_id):
+        return device_id in self._devices
+
+    def __len__(self):
+        return len(self._devices)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections import deque
+
+
+class IngestBridge:
+    """
+    Jembatan pesan dari thread jaringan paho ke event loop asyncio.
+    Thread paho hanya menambahkan tuple mentah (topic, payload, recv_ts) ke deque
+    (append atomik, tanpa lock); consumer di event loop menguras antrean per batch,
+    lalu memanggil `dispatch(topic, payload, recv_ts)` untuk setiap pesan.
+    Event loop hanya dibangunkan sekali per batch, bukan sekali per pesan.
+    """
+
+    def __init__(self, loop, dispatch, batch_size=500, max_pending=100000):
+        self.loop = loop
+        self.dispatch = dispatch
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self._scheduled = False  # True jika event loop sudah diminta bangun
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def put(self, topic, payload, recv_ts=None):
+        """Dipanggil dari thread paho: hanya enqueue, tanpa parsing."""
+        if len(self._queue) >= self.max_pending:
+            self._queue.popleft()  # Antrean penuh: pesan tertua dibuang
+            self.dropped += 1
+        self._queue.append((topic, payload, time.time() if recv_ts is None else recv_ts))
+        self.received += 1
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending(self):
+        return len(self._queue)
+
+    def drain(self):
+        """Memproses maksimal satu batch pesan. Mengembalikan jumlah pesan yang diproses."""
+        queue = self._queue
+        count = min(len(queue), self.batch_size)
+        for _ in range(count):
+            topic, payload, recv_ts = queue.popleft()
+            try:
+                self.dispatch(topic, payload, recv_ts)
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ Ingest: Error saat memproses pesan dari topik '{topic}': {e}")
+        if count:
+            self.processed += count
+            self.batches += 1
+        return count
+
+    async def run(self):
+        """Consumer di event loop: tunggu sinyal, kuras antrean per batch."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                if not self.drain():
+                    # Reset flag lalu cek ulang agar pesan yang masuk bersamaan tidak tertinggal
+                    self._scheduled = False
+                    if not self._queue:
+                        break
+                    continue
+                await asyncio.sleep(0)  # Beri giliran ke task lain di antara batch
+
+    def stats(self):
+        return {
+            "pending": len(self._queue),
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
@@ -0,0 +1,96 @@
+import asyncio
+import heapq
+import time
+
+
+class LivenessTracker:
+    """
+    Deteksi perangkat offline berbasis deadline.
+    Setiap pesan hanya menggeser deadline perangkat di dict (O(1)); heap berisi paling banyak
+    satu entri per perangkat dan baru disusun ulang saat entri teratas jatuh tempo (O(log n)).
+    Loop tidur sampai deadline terdekat sehingga diam jika tidak ada yang akan kedaluwarsa.
+    `on_offline(device_id)` dipanggil tepat sekali saat deadline lewat, `on_online(device_id)`
+    saat pesan berikutnya datang dari perangkat yang offline. Semua method dipanggil dari event loop.
+    """
+
+    def __init__(self, on_offline, on_online, timeout=60, timeouts=None):
+        self.on_offline = on_offline
+        self.on_online = on_online
+        self.timeout = timeout
+        self._timeouts = dict(timeouts or {})  # device id -> batas waktu khusus (detik)
+        self._deadlines = {}  # device id -> deadline terbaru (monotonic) untuk perangkat online
+        self._offline = set()
+        self._heap = []  # (deadline saat dijadwalkan, device id)
+        self._queued = set()  # Perangkat yang memiliki entri di heap
+        self._wakeup = asyncio.Event()
+
+    def timeout_for(self, device_id):
+        return self._timeouts.get(device_id, self.timeout)
+
+    def set_timeout(self, device_id, seconds):
+        """Mengatur batas waktu offline khusus untuk satu perangkat (berlaku pada pesan berikutnya)."""
+        self._timeouts[device_id] = seconds
+
+    def watch(self, device_id, now=None):
+        """Mulai memantau perangkat yang belum pernah mengirim pesan (deadline dihitung dari sekarang)."""
+        if device_id not in self._deadlines and device_id not in self._offline:
+            self._schedule(device_id, (time.monotonic() if now is None else now) + self.timeout_for(device_id))
+
+    def touch(self, device_id, now=None):
+        """Dipanggil untuk setiap pesan: memperpanjang deadline perangkat."""
+        deadline = (time.monotonic() if now is None else now) + self.timeout_for(device_id)
+        if device_id in self._deadlines:
+            self._deadlines[device_id] = deadline  # Entri heap lama diperbarui saat jatuh tempo
+            return
+        self._schedule(device_id, deadline)
+        if device_id in self._offline:
+            self._offline.discard(device_id)
+            self.on_online(device_id)
+
+    def forget(self, device_id):
+        """Berhenti memantau perangkat (mis. dilepas dari registry)."""
+        self._deadlines.pop(device_id, None)
+        self._offline.discard(device_id)
+
+    def is_online(self, device_id):
+        return device_id in self._deadlines
+
+    def _schedule(self, device_id, deadline):
+        self._deadlines[device_id] = deadline
+        if device_id in self._queued:
+            return  # Entri lama masih di heap dan akan membaca deadline terbaru
+        self._queued.add(device_id)
+        if not self._heap or deadline < self._heap[0][0]:
+            self._wakeup.set()  # Deadline baru lebih awal dari yang sedang ditunggu loop
+        heapq.heappush(self._heap, (deadline, device_id))
+
+    def expire(self, now=None):
+        """Memproses semua deadline yang sudah lewat. Mengembalikan detik sampai deadline berikutnya."""
+        now = time.monotonic() if now is None else now
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            scheduled, device_id = heapq.heappop(heap)
+            deadline = self._deadlines.get(device_id)
+            if deadline is None:
+                self._queued.discard(device_id)
+                continue  # Sudah dilupakan
+            if deadline > now:
+                heapq.heappush(heap, (deadline, device_id))  # Deadline sudah diperpanjang oleh pesan baru
+                continue
+            del self._deadlines[device_id]
+            self._queued.discard(device_id)
+            self._offline.add(device_id)
+            try:
+                self.on_offline(device_id)
+            except Exception as e:
+                print(f"❌ Error saat memproses perangkat offline {device_id}: {e}")
+        return heap[0][0] - now if heap else None
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self.expire()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
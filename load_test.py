@@ -0,0 +1,335 @@
+"""
+Uji beban end-to-end: armada ESP32 simulasi -> MQTTHandler -> ReadingCapture -> WAL ->
+penyimpanan -> API. Broker MQTT, Google Cloud Storage dan channel Discord diganti tiruan lokal.
+Jalankan lewat: python benchmark.py e2e [--devices N] [--rate R] [--duration D] [--output hasil.json]
+"""
+import asyncio
+import itertools
+import json
+import os
+import queue
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+from functools import partial
+from types import SimpleNamespace
+from unittest import mock
+
+# config.py membutuhkan variabel lingkungan ini; nilai tiruan cukup untuk uji beban
+os.environ.setdefault("CHANNEL_ID", "1")
+os.environ.setdefault("MQTT_PORT", "8883")
+
+import paho.mqtt.client as mqtt
+import local_storage
+import storage_session
+
+
+class FakeMQTTClient:
+    """
+    Pengganti paho.mqtt.Client: pesan yang dipublikasikan armada simulasi diantrekan lalu
+    dikirim ke `on_message` dari thread jaringan MQTTSession lewat loop(), seperti pada paho.
+    Perintah relay dari bot langsung dijawab notifikasi relay seperti firmware ESP32, melewati
+    antrean yang sama dengan data sensor.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.published = 0  # Perintah yang dikirim bot ke perangkat
+        self._inbox = queue.SimpleQueue()
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def connect(self, host, port=1883, keepalive=60):
+        self.on_connect(self, None, None, 0, None)
+
+    def disconnect(self):
+        self._inbox.put(None)
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+        parts = topic.split("/")
+        if len(parts) == 3 and parts[0] == "esp32" and parts[2] == "relay":
+            field = "status" if payload in ("ON", "OFF") else "mode"
+            status = {"status": "Relay OFF", "mode": "MANUAL", "affirmation": payload}
+            status[field] = f"Relay {payload}" if field == "status" else payload
+            self.deliver(f"relay/{parts[1]}/notifications", json.dumps(status).encode())
+
+    def deliver(self, topic, payload):
+        """Dipanggil armada simulasi: pesan masuk dari broker."""
+        self._inbox.put((topic, payload))
+
+    def loop(self, timeout=1.0):
+        """Mengirim pesan yang sudah masuk ke on_message; 0 selama koneksi tetap terbuka."""
+        try:
+            item = self._inbox.get(timeout=timeout)
+            while True:
+                if item is None:
+                    self.on_disconnect(self, None, None, 0, None)
+                    return mqtt.MQTT_ERR_NO_CONN
+                topic, payload = item
+                self.on_message(self, None, SimpleNamespace(topic=topic, payload=payload))
+                item = self._inbox.get_nowait()
+        except queue.Empty:
+            return mqtt.MQTT_ERR_SUCCESS
+
+
+class StubChannel:
+    """Channel Discord tiruan: hanya menghitung pesan yang dikirim."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, content):
+        self.sent += 1
+
+
+class Fleet:
+    """
+    Armada ESP32 simulasi: `devices` perangkat, masing-masing `rate` pesan/detik.
+    Nilai suhu unik per pesan sehingga waktu kirim bisa dicocokkan dengan data yang tersimpan.
+    """
+
+    def __init__(self, client, devices, rate):
+        self.client = client
+        self.devices = [f"esp{i:03d}" for i in range(devices)]
+        self.rate = rate
+        self.sent_at = {}  # (perangkat, suhu) -> waktu kirim (perf_counter)
+        self.sent = 0
+
+    def publish_for(self, duration):
+        interval = 1.0 / (self.rate * len(self.devices))
+        start = time.perf_counter()
+        for seq in itertools.count():
+            due = start + seq * interval
+            if due - start >= duration:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            device = self.devices[seq % len(self.devices)]
+            suhu = round(25 + seq / 1e6, 6)
+            payload = json.dumps({"suhu": suhu, "kelembapan": 70.0, "amonia": 10.0 + seq % 30}).encode()
+            self.sent_at[(device, suhu)] = time.perf_counter()
+            self.client.deliver(f"sensor/{device}/data", payload)
+            self.sent += 1
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def _send_commands(bot, devices, duration, interval=0.2):
+    """Perintah relay bergiliran ke armada selama uji beban: (latensi konfirmasi, jumlah gagal)."""
+    from command_bus import expect_relay
+    from config import MQTT_DEVICE_RELAY_CONTROL_TOPIC
+
+    latencies, failed = [], 0
+    deadline = time.perf_counter() + duration
+    for n in itertools.count():
+        if time.perf_counter() >= deadline:
+            break
+        command = "ON" if n % 2 == 0 else "OFF"
+        result = await bot.command_bus.send(
+            f"esp{n % devices:03d}", f"relay_{command.lower()}", MQTT_DEVICE_RELAY_CONTROL_TOPIC, command,
+            expect_relay(command),
+        )
+        if result.confirmed:
+            latencies.append(result.latency)
+        else:
+            failed += 1
+        await asyncio.sleep(interval)
+    return latencies, failed
+
+
+async def _run_pipeline(workdir, devices, rate, duration, sample_interval, commit_rows, commit_interval):
+    import main
+    import mqtt_handler
+    from data import save_to_csv_batch
+
+    channel = StubChannel()
+    fleet = None
+    with mock.patch.object(mqtt_handler.mqtt, "Client", FakeMQTTClient), \
+            mock.patch.object(main, "WAL_DIR", os.path.join(workdir, "wal")), \
+            mock.patch.object(main, "METRICS_PORT", 0):
+        bot = main.AmoniaBot()
+        await bot._async_setup_hook()  # Inisialisasi loop tanpa login ke Discord
+        bot.get_channel = lambda channel_id: channel
+
+        # File CSV lama ditulis ke /tmp/bench_data_sensor.csv agar tidak menimpa data bot
+        sinks = bot.compressor.sinks if bot.compressor is not None else bot.replayer.sinks
+        sinks[0] = partial(save_to_csv_batch, filename="bench_data_sensor.csv")
+        bot.replayer.commit_rows = commit_rows
+        bot.replayer.commit_interval = commit_interval
+
+        # Latensi pesan -> baris tersimpan diukur saat commit ke object store berhasil
+        shipped, latencies = [], []
+        bot.replayer.sinks.append(lambda readings: shipped.extend((r["device"], r["suhu"]) for r in readings))
+        commit = bot.replayer.commit
+
+        def timed_commit():
+            commit()
+            now = time.perf_counter()
+            for key in shipped:
+                sent = fleet.sent_at.get(key) if fleet is not None else None
+                if sent is not None:
+                    latencies.append(now - sent)
+            shipped.clear()
+
+        bot.replayer.commit = timed_commit
+        await bot.setup_hook()
+        bot.monitor_system_task.change_interval(seconds=sample_interval)
+        fleet = Fleet(bot.mqtt_handler.client, devices, rate)
+
+        start = time.perf_counter()
+        # Perintah dikirim selama armada aktif: latensi konfirmasi mencakup antrean ingest yang sibuk
+        commander = asyncio.ensure_future(_send_commands(bot, devices, duration))
+        await asyncio.to_thread(fleet.publish_for, duration)
+        command_latencies, commands_failed = await commander
+        # Tunggu antrean ingest kosong agar throughput mencakup seluruh pesan
+        while bot.mqtt_handler.ingest.pending():
+            await asyncio.sleep(0.01)
+        ingest_elapsed = time.perf_counter() - start
+        await asyncio.sleep(sample_interval * 2)
+
+        bot.monitor_system_task.cancel()
+        bot.compaction_task.cancel()
+        await bot.capture.stop()
+        await asyncio.to_thread(bot.pipeline.stop)
+        await asyncio.to_thread(bot.replayer.stop)
+        await bot.notifier.stop()
+        bot.mqtt_handler.session.stop()
+        bot.wal.close()
+        ingest = bot.mqtt_handler.ingest.stats()
+        capture = bot.capture.stats()
+
+    return {
+        "devices": devices,
+        "rate_per_device": rate,
+        "messages_sent": fleet.sent,
+        "messages_processed": ingest["processed"],
+        "ingest_throughput": ingest["processed"] / ingest_elapsed,
+        "rows_captured": capture["captured"],
+        "rows_rate_limited": capture["rate_limited"],
+        "rows_persisted": len(latencies),
+        "latency_p50_ms": (_percentile(latencies, 50) or 0) * 1000,
+        "latency_p99_ms": (_percentile(latencies, 99) or 0) * 1000,
+        "discord_messages": channel.sent,
+        "commands_confirmed": len(command_latencies),
+        "commands_failed": commands_failed,
+        "command_p50_ms": (_percentile(command_latencies, 50) or 0) * 1000,
+        "command_p99_ms": (_percentile(command_latencies, 99) or 0) * 1000,
+    }
+
+
+def _seed_history(storage, bucket_name, rows):
+    """Mengisi riwayat `rows` baris (30 detik sekali, berakhir sekarang) lewat jalur penyimpanan bot."""
+    from data import save_to_csv_batch
+    from pipeline import make_reading, TIMEZONE
+    from save_data import update_rollups_batch, commit_gcs
+
+    end = datetime.now(TIMEZONE).replace(microsecond=0)
+    start = end - timedelta(seconds=30 * rows)
+    batch = []
+    for i in range(rows):
+        batch.append(make_reading(28.5, 70.1, 10.0 + i % 30, "Relay OFF", "AUTO", start + timedelta(seconds=30 * (i + 1))))
+        if len(batch) == 1000 or i == rows - 1:
+            save_to_csv_batch(batch, filename="bench_api_sensor.csv")
+            storage.write_batch(batch)
+            update_rollups_batch(batch, bucket_name)
+            batch = []
+    storage.commit()
+    commit_gcs()
+    return end
+
+
+def _api_latency(client, path, repeat=5):
+    """Waktu respons terbaik dari `repeat` permintaan (ms)."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        best = min(best, time.perf_counter() - t0)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path}: HTTP {response.status_code}")
+    return best * 1000
+
+
+def _reset_storage(root):
+    """Storage tiruan baru (None: kembali ke GCS) dan cache penulis yang kosong."""
+    import data
+    import save_data
+
+    storage_session.set_client(local_storage.Client(root) if root is not None else None)
+    save_data._writers.clear()
+    save_data._rollups.clear()
+    data._uploaded_offsets.clear()
+    data._last_timestamps.clear()
+    if os.path.exists("/tmp/bench_api_sensor.csv"):
+        os.remove("/tmp/bench_api_sensor.csv")
+
+
+def _run_api(workdir, history_sizes):
+    import app as api
+    from save_data import save_to_gcs_batch, commit_gcs
+    from storage_backend import create_backend
+
+    results = []
+    client = api.app.test_client()
+    with mock.patch.object(api, "CSV_FILE_NAME", "bench_api_sensor.csv"):
+        for size in history_sizes:
+            # Riwayat dibangun ulang dari nol untuk setiap ukuran
+            _reset_storage(os.path.join(workdir, f"api-{size}"))
+            # Backend API yang sama dengan bot (hot store SQLite baru per ukuran), ditulis lewat jalur bot
+            api.storage = create_backend(
+                api.STORAGE_BACKEND, archive=api.STORAGE_ARCHIVE, path=os.path.join(workdir, f"api-{size}.db"),
+                write=save_to_gcs_batch, commit=commit_gcs, client=storage_session.get_client(),
+            )
+            end = _seed_history(api.storage, api.PARTITION_BUCKET_NAME, size)
+            last_hour = (end - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S")
+            results.append({
+                "history_rows": size,
+                # Permintaan pertama setelah data berubah (cache respons kosong), lalu dari cache
+                "full_csv_cold_ms": _api_latency(client, "/api/sensors", repeat=1),
+                "full_csv_cached_ms": _api_latency(client, "/api/sensors"),
+                "range_last_hour_ms": _api_latency(client, f"/api/sensors?from={last_hour}"),
+                "rollup_hour_ms": _api_latency(client, "/api/sensors/rollup?resolution=hour"),
+            })
+    return results
+
+
+def run(devices=20, rate=2.0, duration=10.0, sample_interval=1.0, commit_rows=10, commit_interval=2.0,
+        history_sizes=(1000, 10000, 50000)):
+    """Menjalankan seluruh skenario dan mengembalikan hasil sebagai dict."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        _reset_storage(os.path.join(workdir, "gcs"))
+        os.chdir(workdir)  # Salinan lokal partisi ditulis relatif terhadap folder kerja
+        try:
+            pipeline = asyncio.run(_run_pipeline(
+                workdir, devices, rate, duration, sample_interval, commit_rows, commit_interval
+            ))
+            api = _run_api(workdir, history_sizes)
+        finally:
+            os.chdir(cwd)
+            _reset_storage(None)
+            if os.path.exists("/tmp/bench_data_sensor.csv"):
+                os.remove("/tmp/bench_data_sensor.csv")
+    return {"pipeline": pipeline, "api": api, "peak_rss_kb": peak_rss_kb()}
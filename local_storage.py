@@ -0,0 +1,155 @@
+import os
+import shutil
+import threading
+
+
+class Blob:
+    """
+    Pengganti lokal untuk google.cloud.storage.Blob yang disimpan sebagai file biasa.
+    Hanya subset API yang dipakai bot dan API yang diimplementasikan.
+    """
+
+    def __init__(self, name, bucket):
+        self.name = name
+        self.bucket = bucket
+        self.generation = None
+        self.etag = None
+        self.size = None
+        self.updated = None
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.root, self.name)
+
+    def exists(self, client=None):
+        return os.path.isfile(self.path)
+
+    def reload(self, client=None):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Objek '{self.name}' tidak ditemukan di bucket '{self.bucket.name}'")
+        self.generation = st.st_mtime_ns
+        self.size = st.st_size
+        self.etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+        self.updated = st.st_mtime
+
+    def upload_from_string(self, data, content_type="text/plain"):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(data)
+        self.bucket.client.count_upload(len(data))
+        self.reload()
+
+    def upload_from_filename(self, filename, content_type=None):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        shutil.copyfile(filename, self.path)
+        self.reload()
+        self.bucket.client.count_upload(self.size)
+
+    def download_as_bytes(self, start=None, end=None):
+        self.reload()
+        with open(self.path, "rb") as f:
+            if start:
+                f.seek(start)
+            data = f.read() if end is None else f.read(end - (start or 0) + 1)
+        self.bucket.client.count_download(len(data))
+        return data
+
+    def download_as_text(self, start=None, end=None, encoding="utf-8"):
+        return self.download_as_bytes(start=start, end=end).decode(encoding)
+
+    def download_to_filename(self, filename):
+        data = self.download_as_bytes()
+        with open(filename, "wb") as f:
+            f.write(data)
+
+    def compose(self, sources):
+        """Menggabungkan beberapa objek menjadi objek ini (setara GCS compose, server-side)."""
+        if len(sources) > 32:
+            raise ValueError("Compose maksimal 32 objek sumber")
+        # Jika sumber pertama adalah objek ini sendiri, cukup append sisanya (O(ukuran chunk))
+        if sources and sources[0].name == self.name and self.exists():
+            mode, sources = "ab", sources[1:]
+        else:
+            mode = "wb"
+        datas = []
+        for source in sources:
+            with open(source.path, "rb") as f:
+                datas.append(f.read())
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, mode) as f:
+            for data in datas:
+                f.write(data)
+        self.bucket.client.count_compose()
+        self.reload()
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Objek '{self.name}' tidak ditemukan di bucket '{self.bucket.name}'")
+
+
+class Bucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.root = os.path.join(client.root, name)
+
+    def blob(self, blob_name):
+        return Blob(blob_name, self)
+
+    def get_blob(self, blob_name):
+        blob = Blob(blob_name, self)
+        if not blob.exists():
+            return None
+        blob.reload()
+        return blob
+
+    def list_blobs(self, prefix=None):
+        return self.client.list_blobs(self, prefix=prefix)
+
+
+class Client:
+    """
+    Pengganti lokal untuk google.cloud.storage.Client berbasis filesystem.
+    Setiap bucket adalah direktori di bawah `root`.
+    Menghitung byte upload/download dan operasi compose agar biaya penulisan bisa diukur.
+    """
+
+    def __init__(self, root="local_bucket"):
+        self.root = root
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+        self.compose_count = 0
+        self._lock = threading.Lock()
+
+    def bucket(self, bucket_name):
+        return Bucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name, prefix=None):
+        bucket = bucket_or_name if isinstance(bucket_or_name, Bucket) else self.bucket(bucket_or_name)
+        blobs = []
+        for dirpath, _, filenames in os.walk(bucket.root):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(dirpath, filename), bucket.root).replace(os.sep, "/")
+                if prefix is None or name.startswith(prefix):
+                    blob = Blob(name, bucket)
+                    blob.reload()
+                    blobs.append(blob)
+        return iter(sorted(blobs, key=lambda b: b.name))
+
+    def count_upload(self, nbytes):
+        with self._lock:
+            self.bytes_uploaded += nbytes
+
+    def count_download(self, nbytes):
+        with self._lock:
+            self.bytes_downloaded += nbytes
+
+    def count_compose(self):
+        with self._lock:
+            self.compose_count += 1
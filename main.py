@@ -2,12 +2,31 @@ import discord
 from discord.ext import commands, tasks
 from config import *
 from mqtt_handler import MQTTHandler
-from data import save_to_csv
-from save_data import save_to_gcs
+from device_registry import DEFAULT_DEVICE_ID
+from data import save_to_csv_batch
+from save_data import save_to_gcs_batch, update_rollups_batch, flush_gcs, commit_gcs, compact_gcs
+from pipeline import PersistencePipeline, make_reading
+from capture import ReadingCapture
+from command_bus import CommandBus, expect_relay, expect_setting, expect_ammonia
+from notifier import NotificationScheduler
+from stream import StreamPublisher
+from wal import WriteAheadLog, WalReplayer
+from alert_engine import AlertEngine, AlertRule, REPEAT, RESOLVED
+from compression import StorageCompressor
+from storage_backend import create_backend, object_store_kind
+from chart import ChartRenderer, UNITS, parse_window, format_window, downsample, rollup_series, rollup_resolution
+from rollup import load_rollups, RESOLUTIONS
+from save_data import get_rollup_engine
+from functools import partial
+import metrics
+import local_storage
+import storage_session
 import logging
 from datetime import datetime
-import json
+import asyncio
 import shutil
+import time
+import io
 import os
 
 class AmoniaBot(commands.Bot):
@@ -17,13 +36,81 @@ class AmoniaBot(commands.Bot):
         intents.message_content = True
         super().__init__(command_prefix="!", intents=intents)
 
-        # Inisialisasi variabel mode default
-        self.current_mode = None
+        # Inisialisasi variabel mode default (mode relay per perangkat)
+        self.current_modes = {}
         self.relay_on_duration = None
         self.relay_off_duration = None
         self.mqtt_handler = None
+        self.command_bus = None
         self.ammonia_threshold = None
 
+        # Pipeline persistensi: I/O file dan jaringan dijalankan di luar event loop.
+        # Setiap data ditulis lebih dulu ke write-ahead log lokal (fsync per batch)
+        self.wal = WriteAheadLog(WAL_DIR, segment_bytes=WAL_SEGMENT_BYTES, max_bytes=WAL_MAX_BYTES)
+        self.pipeline = PersistencePipeline(
+            [self.wal.append_batch],
+            maxsize=PIPELINE_MAXSIZE,
+            batch_size=PIPELINE_BATCH_SIZE,
+            policy=PIPELINE_POLICY,
+            workers=PIPELINE_WORKERS,
+            spill_path=PIPELINE_SPILL_PATH,
+        )
+        # Setiap pesan sensor ditangkap saat diterima dan dikirim ke pipeline per micro-batch
+        self.capture = ReadingCapture(
+            self.pipeline.put_many_async,
+            batch_size=CAPTURE_BATCH_SIZE,
+            flush_interval=CAPTURE_FLUSH_INTERVAL,
+            max_rate=CAPTURE_MAX_RATE,
+            burst=CAPTURE_BURST,
+            dedup_window=CAPTURE_DEDUP_WINDOW,
+        )
+        # Peringatan dievaluasi untuk setiap pembacaan sensor (aturan bisa diubah saat runtime)
+        self.alerts = AlertEngine(
+            self.on_alert, [AlertRule(**rule) for rule in ALERT_RULES],
+            repeat_interval=ALERT_REPEAT_INTERVAL, path=ALERT_RULES_PATH
+        )
+        # Object store lokal: client bersama seluruh proses diganti folder STORAGE_LOCAL_ROOT (sebelum
+        # bucket pertama dibuat) agar CSV lama, rollup dan kompaksi ikut tersimpan di tempat yang sama
+        # dengan partisi; app.py melakukan langkah yang sama dengan konfigurasi yang sama
+        storage_client = None
+        if object_store_kind(STORAGE_BACKEND, STORAGE_ARCHIVE) == "local":
+            storage_client = local_storage.Client(STORAGE_LOCAL_ROOT)
+            storage_session.set_client(storage_client)
+        # Backend data sensor (hot store SQLite di depan object store secara default); CSV lama
+        # perangkat default tetap ditulis langsung untuk /api/sensors tanpa parameter
+        self.storage = create_backend(
+            STORAGE_BACKEND, archive=STORAGE_ARCHIVE, path=HOT_STORE_PATH, days=HOT_STORE_DAYS,
+            write=save_to_gcs_batch, commit=commit_gcs, client=storage_client,
+        )
+        # Pembacaan yang bisa direkonstruksi dalam toleransi tidak ditulis ke penyimpanan; perubahan relay
+        # dan perpotongan ambang peringatan selalu disimpan. Rollup dan stream tetap menerima semua data
+        storage_sinks = [save_to_csv_batch, self.storage.write_batch]
+        self.compressor = None
+        if COMPRESSION_TOLERANCES:
+            self.compressor = StorageCompressor(
+                storage_sinks, COMPRESSION_TOLERANCES, max_interval=COMPRESSION_MAX_INTERVAL,
+                thresholds=self.alerts.thresholds,
+            )
+            storage_sinks = [self.compressor]
+        # Replayer mengirim isi WAL ke penyimpanan; sink terakhir meneruskan data ke stream langsung di app.py
+        self.stream_publisher = StreamPublisher()
+        self.replayer = WalReplayer(
+            self.wal,
+            [*storage_sinks, update_rollups_batch, self.stream_publisher.publish_batch],
+            commit=commit_gcs,
+            batch_size=WAL_REPLAY_BATCH,
+            commit_rows=GCS_FLUSH_ROWS,
+            commit_interval=GCS_FLUSH_INTERVAL,
+        )
+
+        # Semua pesan keluar ke Discord lewat satu antrean yang menggabungkan peringatan berulang
+        self.notifier = NotificationScheduler(
+            self, window=NOTIFY_COALESCE_WINDOW, rate=NOTIFY_RATE, burst=NOTIFY_BURST
+        )
+        self.metrics_server = None
+        # Grafik !chart dirender di proses worker dan di-cache per bucket waktu
+        self.chart_renderer = ChartRenderer(workers=CHART_WORKERS, cache_size=CHART_CACHE_SIZE)
+
         # Daftar perintah yang tersedia
         self.available_commands = [
             "mode", "manual", "auto", "info", 
@@ -31,52 +118,116 @@ class AmoniaBot(commands.Bot):
         ]
 
     async def setup_hook(self):
+        self.notifier.start()
+
         # Inisialisasi MQTT handler
         self.mqtt_handler = MQTTHandler(self)
-        self.mqtt_handler.client.loop_start()
+        # Perintah ke ESP32 menunggu konfirmasi (correlation id, timeout dan pengiriman ulang)
+        self.command_bus = CommandBus(self.mqtt_handler.publish, timeout=COMMAND_TIMEOUT, retries=COMMAND_RETRIES)
+        self.mqtt_handler.session.start()
+
+        # Memulai worker penyimpanan dan pengiriman ulang WAL (termasuk sisa data sebelum restart)
+        self.pipeline.start()
+        self.replayer.start()
+        self.capture.start()
+
+        # Endpoint /metrics (Prometheus) untuk antrean dan hot path bot
+        self.register_metrics()
+        if METRICS_PORT:
+            try:
+                self.metrics_server = metrics.start_http_server(METRICS_PORT, METRICS_HOST)
+                print(f"📊 Metrik tersedia di http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+            except OSError as e:
+                print(f"❌ Gagal menjalankan endpoint metrik: {e}")
         
         # Menerapkan mode default
         await self.set_default_settings()
 
         # Memulai monitoring task
         self.monitor_system_task.start()
+        self.compaction_task.start()
+
+    def register_metrics(self):
+        """Kedalaman antrean dan penghitung yang sudah ada dibaca saat scrape, tanpa biaya di hot path."""
+        ingest = self.mqtt_handler.ingest
+        depths = metrics.gauge("queue_depth", "Jumlah item yang menunggu di antrean", ("queue",))
+        depths.labels("ingest").set_function(ingest.pending)
+        depths.labels("capture").set_function(lambda: self.capture.stats()["pending"])
+        depths.labels("pipeline").set_function(lambda: self.pipeline.stats()["queue_depth"])
+        depths.labels("pipeline_spill").set_function(lambda: self.pipeline.stats()["spill_depth"])
+        depths.labels("notifications").set_function(lambda: self.notifier.stats()["pending"])
+        depths.labels("mqtt_outbound").set_function(lambda: self.mqtt_handler.session.stats()["buffered"])
+        depths.labels("commands").set_function(self.command_bus.pending)
+        metrics.gauge("wal_backlog_bytes", "Data WAL yang belum dikonfirmasi (byte)").set_function(self.wal.backlog_bytes)
+        metrics.gauge("wal_size_bytes", "Ukuran total segmen WAL (byte)").set_function(self.wal.size_bytes)
+        metrics.counter("wal_dropped_bytes_total", "Byte WAL yang dibuang karena batas ukuran").set_function(
+            lambda: self.wal.dropped_bytes
+        )
+        metrics.counter("wal_replay_failures_total", "Kegagalan pengiriman isi WAL").set_function(
+            lambda: self.replayer.failures
+        )
+        dropped = metrics.counter("queue_dropped_total", "Item yang dibuang karena antrean penuh", ("queue",))
+        dropped.labels("ingest").set_function(lambda: ingest.dropped)
+        dropped.labels("pipeline").set_function(lambda: self.pipeline.dropped)
+        metrics.gauge("devices_known", "Perangkat di registry").set_function(lambda: len(self.mqtt_handler.devices))
+
+    def chart_series(self, names, seconds, bucket_seconds, device_id, threshold):
+        """
+        Data grafik (dijalankan di thread): ring buffer di memori jika mencakup seluruh rentang,
+        selain itu rollup menit/jam/hari (termasuk bucket yang belum disimpan ke bucket).
+        """
+        label = self.mqtt_handler.device_label(device_id)
+        title = f"Sensor{label} {format_window(seconds)} terakhir"
+        now = time.time()
+        window = self.mqtt_handler.get_history_window(seconds, device_id)
+        memory = None
+        if window is not None:
+            timestamps, values = window
+            memory = downsample(timestamps, {name: values[name] for name in names}, bucket_seconds)
+            if memory is not None and timestamps[0] <= now - seconds + bucket_seconds:
+                return memory, title, threshold
+
+        resolution = rollup_resolution(seconds)
+        engine = get_rollup_engine()
+        points = load_rollups(
+            engine.bucket, resolution, int(now - seconds), int(now), names,
+            read_blob=engine.read_period, device_id=device_id,
+        )
+        series = rollup_series(points, names, RESOLUTIONS[resolution])
+        return (series or memory), title, threshold
 
     async def set_default_settings(self):
         """Mengatur ulang mode default."""
-        if self.current_mode is None and self.relay_on_duration is None and self.relay_off_duration is None:
+        if DEFAULT_DEVICE_ID not in self.current_modes and self.relay_on_duration is None and self.relay_off_duration is None:
             try:
                 # Atur nilai default di dalam bot
-                self.current_mode = "AUTO"
+                self.current_modes[DEFAULT_DEVICE_ID] = "AUTO"
                 self.relay_on_duration = 30
                 self.relay_off_duration = 30
                 self.ammonia_threshold = 30
 
                 # Kirim pesan MQTT untuk mengatur mode auto ke ESP32
-                self.mqtt_handler.client.publish(MQTT_RELAY_CONTROL_TOPIC,  self.current_mode)
+                self.command_bus.post(DEFAULT_DEVICE_ID, MQTT_DEVICE_RELAY_CONTROL_TOPIC, self.current_modes[DEFAULT_DEVICE_ID])
 
                 # Kirim pesan MQTT untuk ambang batas ammonia
-                data_ammonia = json.dumps({
+                self.command_bus.post(DEFAULT_DEVICE_ID, MQTT_DEVICE_AMMONIA_THRESHOLD_TOPIC, {
                     "key" : "begin",
                     "value": self.ammonia_threshold
-                    
                 })
-                self.mqtt_handler.client.publish(MQTT_AMMONIA_THRESHOLD_TOPIC,   data_ammonia)
 
                 # Kirim durasi relay ON ke ESP32
-                data_on = json.dumps({
+                self.command_bus.post(DEFAULT_DEVICE_ID, MQTT_DEVICE_RELAY_SETTING_TOPIC, {
                     "command": "relay_on",
                     "duration": self.relay_on_duration * 1000,  # Dalam milidetik
                     "key" : "begin"
                 })
-                self.mqtt_handler.client.publish(MQTT_RELAY_SETTING_TOPIC, data_on)
 
                 # Kirim durasi relay OFF ke ESP32
-                data_off = json.dumps({
+                self.command_bus.post(DEFAULT_DEVICE_ID, MQTT_DEVICE_RELAY_SETTING_TOPIC, {
                     "command": "relay_off",
                     "duration": self.relay_off_duration * 1000, # Dalam milidetik
                     "key" : "begin"
                 })
-                self.mqtt_handler.client.publish(MQTT_RELAY_SETTING_TOPIC, data_off)
                 print("✅ Sistem berhasil diatur ke mode default: AUTO dengan durasi ON=30s, OFF=30s")
 
             except Exception as e:
@@ -84,11 +235,28 @@ class AmoniaBot(commands.Bot):
         else:
             print("⚠ Sistem sudah diatur. Melewati inisialisasi ulang mode default.")
 
-    # MQTT Handler
-    async def on_mqtt_disconnect(self, client, userdata, rc):
-        logging.warning("MQTT Disconnected. Mencoba reconnect...")
-        await self.mqtt_handler.connect()
-    
+    def get_current_mode(self, device_id=DEFAULT_DEVICE_ID):
+        """Mode relay terakhir yang diperintahkan bot untuk perangkat tertentu."""
+        return self.current_modes.get(device_id)
+
+    async def close(self):
+        # Kuras antrean lalu unggah baris yang masih tertunda sebelum bot berhenti
+        await self.capture.stop()
+        await asyncio.to_thread(self.pipeline.stop)
+        await asyncio.to_thread(self.replayer.stop)
+        if self.compressor is not None:
+            await asyncio.to_thread(self.compressor.flush)
+        await asyncio.to_thread(flush_gcs)
+        self.storage.close()
+        if self.mqtt_handler is not None:
+            await asyncio.to_thread(self.mqtt_handler.session.stop)
+        await self.notifier.stop()
+        self.chart_renderer.shutdown()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server = None
+        await super().close()
+
     # Menangani pesan yang tidak valid
     async def on_command_error(self, ctx, error):
         if isinstance(error, commands.CommandNotFound):
@@ -104,45 +272,100 @@ class AmoniaBot(commands.Bot):
 
     @tasks.loop(seconds=30)
     async def monitor_system_task(self):
-        try:
-            is_esp_online = self.mqtt_handler.get_is_esp_online()
-            relay_status, relay_mode = self.mqtt_handler.get_relay_status_data()
-            suhu, kelembapan, amonia = self.mqtt_handler.get_sensor_data()
-            if all(x is not None for x in [suhu, kelembapan, amonia]):
-                if is_esp_online:
-                    save_to_csv(suhu, kelembapan, amonia)
-                    save_to_gcs(suhu, kelembapan, amonia, relay_status, relay_mode)
-                    print(f"📊 Monitoring: Amonia={amonia}PPM, Suhu={suhu}°C, Kelembapan={kelembapan}%")
-                
-                if amonia > AMONIA_AMBANG_BATAS:
-                    await self.send_notification(amonia, suhu, kelembapan)
-            else:
-                print("⚠ Tidak Dapat Membaca Data Sensor.")
-        except Exception as e:
-            print(f"❌ Error dalam monitor_system_task: {e}")
+        for device_id in self.mqtt_handler.get_device_ids():
+            try:
+                label = self.mqtt_handler.device_label(device_id)
+                is_esp_online = self.mqtt_handler.get_is_esp_online(device_id)
+                relay_status, relay_mode = self.mqtt_handler.get_relay_status_data(device_id)
+                suhu, kelembapan, amonia = self.mqtt_handler.get_sensor_data(device_id)
+                if all(x is not None for x in [suhu, kelembapan, amonia]):
+                    if is_esp_online:
+                        # Mode "event": setiap pembacaan sudah disimpan saat diterima (ReadingCapture)
+                        if CAPTURE_MODE != "event":
+                            # Hanya dimasukkan ke antrean; penyimpanan dilakukan oleh worker pipeline
+                            await self.pipeline.put_async(
+                                make_reading(suhu, kelembapan, amonia, relay_status, relay_mode, device_id=device_id)
+                            )
+                        print(f"📊 Monitoring{label}: Amonia={amonia}PPM, Suhu={suhu}°C, Kelembapan={kelembapan}%")
+                else:
+                    print(f"⚠ Tidak Dapat Membaca Data Sensor{label}.")
+            except Exception as e:
+                print(f"❌ Error dalam monitor_system_task: {e}")
 
-    async def send_notification(self, amonia, suhu, kelembapan):
+    @tasks.loop(hours=6)
+    async def compaction_task(self):
+        # Hari yang keluar dari jendela hot store dipindahkan ke object store lebih dulu, lalu
+        # partisi CSV yang sudah ditutup diubah ke arsip kolom di thread terpisah
+        await asyncio.to_thread(self.storage.maintain)
+        await asyncio.to_thread(compact_gcs)
+
+    def on_alert(self, event):
+        """Dipanggil AlertEngine (di event loop) saat peringatan aktif, berulang, atau selesai."""
         try:
-            channel = self.get_channel(CHANNEL_ID)
-            if channel:
-                await channel.send(
-                    f"-----------------------------\n"
-                    f"🚨 Peringatan! Amonia tinggi terdeteksi!\n"
-                    f"💩 Amonia: {amonia} PPM\n"
-                    f"🌡 Suhu: {suhu}°C\n"
-                    f"💧 Kelembapan: {kelembapan}%\n"
-                    f"✅ Pastikan kondisi ruangan tetap aman."
+            reading = event.reading
+            label = self.mqtt_handler.device_label(event.device_id)
+            kind = "amonia" if event.rule.name == AMONIA_ALERT_RULE else event.rule.name
+            if event.state == RESOLVED:
+                content = (f"-----------------------------\n"
+                           f"✅ Kondisi{label} kembali normal: {event.rule.metric} = {event.raw} ({event.rule.name})")
+            elif kind == "amonia":
+                content = self.ammonia_message(
+                    reading.get("amonia"), reading.get("suhu"), reading.get("kelembapan"), event.device_id
                 )
+            else:
+                content = (f"-----------------------------\n"
+                           f"🚨 Peringatan{label}! {event.rule.name}: {event.rule.describe()}\n"
+                           f"• Nilai saat ini: {event.value:.2f} ({event.rule.metric} = {event.raw})")
+            # Peringatan pertama dan pemulihan adalah perubahan status; pengulangan digabung oleh notifier
+            self.notifier.notify(
+                CHANNEL_ID, content, kind=kind, device_id=event.device_id, transition=event.state != REPEAT
+            )
         except Exception as e:
-            print(f"❌ Error dalam send_notification: {e}")
+            print(f"❌ Error dalam on_alert: {e}")
+
+    def ammonia_message(self, amonia, suhu, kelembapan, device_id=DEFAULT_DEVICE_ID):
+        return (
+            f"-----------------------------\n"
+            f"🚨 Peringatan{self.mqtt_handler.device_label(device_id)}! Amonia tinggi terdeteksi!\n"
+            f"💩 Amonia: {amonia} PPM\n"
+            f"🌡 Suhu: {suhu}°C\n"
+            f"💧 Kelembapan: {kelembapan}%\n"
+            f"✅ Pastikan kondisi ruangan tetap aman."
+        )
 
     async def setup(self):
         await self.add_cog(CommandsCog(self))
 
+# Opsi !alert_set -> konversi nilai
+ALERT_OPTIONS = {
+    "metric": str, "kind": str, "op": str, "enter": float, "exit": float,
+    "alpha": float, "window": float, "sustain": float, "device": str,
+}
+
+
 class CommandsCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def send_command(self, ctx, device, name, template, payload, expect, success):
+        """
+        Mengirim perintah lewat command bus lalu melaporkan apakah ESP32 benar-benar menerapkannya.
+        Mengembalikan True jika state boleh dicatat: dikonfirmasi, atau COMMAND_REQUIRE_ACK dimatikan.
+        """
+        label = self.bot.mqtt_handler.device_label(device)
+        result = await self.bot.command_bus.send(device, name, template, payload, expect)
+        if result.confirmed:
+            retried = f", {result.attempts} percobaan" if result.attempts > 1 else ""
+            await ctx.send(f"{success}\n• Dikonfirmasi ESP32{label} dalam {result.latency * 1000:.0f} ms{retried}")
+        else:
+            status = "online" if self.bot.mqtt_handler.get_is_esp_online(device) else "offline"
+            if not COMMAND_REQUIRE_ACK:
+                await ctx.send(f"{success}\n• ⚠ Tanpa konfirmasi ESP32{label} ({status}) setelah {result.attempts} percobaan")
+                return True
+            await ctx.send(f"❌ ESP32{label} ({status}) tidak mengonfirmasi perintah **{name}** setelah "
+                           f"{result.attempts} percobaan. Perintah mungkin belum diterapkan.")
+        return result.confirmed
+
     @commands.command(name="guide")
     async def help_command(self, ctx):
         """Menampilkan bantuan penggunaan bot"""
@@ -154,8 +377,10 @@ class CommandsCog(commands.Cog):
                 help_text += f"• !{command.name}  -  {command.help}\n"
         help_text += (
             "\n*Catatan:*\n- Perintah !relay_on dan !relay_off hanya berfungsi dalam mode manual\n"
+            "- Tambahkan ID perangkat di akhir perintah untuk kandang lain, contoh: **!info kandang2** (lihat **!devices**)\n"
             "- Bot akan memberi peringatan otomatis jika level amonia tinggi dalam mode otomatis\n"
-            "- **!set_ammonia** mengatur ambang batas amonia saat mode otomatis\n"
+            "- **!set_ammonia** mengatur ambang batas amonia saat mode otomatis (termasuk peringatan bot)\n"
+            "- **!alert_set** mengatur aturan peringatan (EWMA, hysteresis, laju perubahan, durasi) per perangkat\n"
             "- **!set_relay_on** dan **!set_relay_off** hanya mengatur ON/OFF relay saat mode otomatis\n"
             "- **!set_relay_on**, **!set_relay_off**, **!set_ammonia** hanya dapat digunakan dalam mode manual\n"
             "- Dashboard pemantauan sistem: http://pengendaliamonia.hammamalfarisy.com"
@@ -163,63 +388,65 @@ class CommandsCog(commands.Cog):
         await ctx.send(help_text)
 
     @commands.command(name="manual")
-    async def mode_manual(self, ctx):
+    async def mode_manual(self, ctx, device: str = DEFAULT_DEVICE_ID):
         """Aktifkan mode manual"""
         try:
-            self.bot.current_mode = "MANUAL"
-            self.bot.mqtt_handler.client.publish(MQTT_RELAY_CONTROL_TOPIC, self.bot.current_mode )
-            await ctx.send("✅ Mode relay diubah ke **Manual**.\n"
-                           "• Setting untuk mode **Otomatis** diperbolehkan.\n"
-                           "• Gunakan **!relay_on** atau **!relay_off** untuk mengontrol relay."
-                           )
+            # Mode dicatat hanya jika ESP32 mengonfirmasi perubahan
+            if await self.send_command(ctx, device, "manual", MQTT_DEVICE_RELAY_CONTROL_TOPIC, "MANUAL",
+                                       expect_relay("MANUAL"),
+                                       "✅ Mode relay diubah ke **Manual**.\n"
+                                       "• Setting untuk mode **Otomatis** diperbolehkan.\n"
+                                       "• Gunakan **!relay_on** atau **!relay_off** untuk mengontrol relay."):
+                self.bot.current_modes[device] = "MANUAL"
         except Exception as e:
             await ctx.send(f"❌ Gagal mengubah mode: {str(e)}")
 
     @commands.command(name="auto")
-    async def mode_auto(self, ctx):
+    async def mode_auto(self, ctx, device: str = DEFAULT_DEVICE_ID):
         """Aktifkan mode otomatis"""
         try:
-            self.bot.current_mode = "AUTO"
-            self.bot.mqtt_handler.client.publish(MQTT_RELAY_CONTROL_TOPIC, self.bot.current_mode)
-            await ctx.send("✅ Mode relay diubah ke **Otomatis**.\nESP32 akan mengatur relay berdasarkan level NH3.")
+            if await self.send_command(ctx, device, "auto", MQTT_DEVICE_RELAY_CONTROL_TOPIC, "AUTO", expect_relay("AUTO"),
+                                       "✅ Mode relay diubah ke **Otomatis**.\n"
+                                       "ESP32 akan mengatur relay berdasarkan level NH3."):
+                self.bot.current_modes[device] = "AUTO"
         except Exception as e:
             await ctx.send(f"❌ Gagal mengubah mode: {str(e)}")
 
     @commands.command(name="relay_on")
-    async def relay_on(self, ctx):
+    async def relay_on(self, ctx, device: str = DEFAULT_DEVICE_ID):
         """Nyalakan relay (mode manual)"""
         try:
-            if self.bot.current_mode != "MANUAL":
+            if self.bot.get_current_mode(device) != "MANUAL":
                 await ctx.send("⚠ Relay hanya dapat dihidupkan dalam **Mode Manual**.\nUbah mode dengan perintah !manual.")
                 return
             
-            self.bot.mqtt_handler.client.publish(MQTT_RELAY_CONTROL_TOPIC, "ON")
-            await ctx.send("✅ Relay berhasil dihidupkan (**ON**) melalui perintah manual.")
+            await self.send_command(ctx, device, "relay_on", MQTT_DEVICE_RELAY_CONTROL_TOPIC, "ON", expect_relay("ON"),
+                                    "✅ Relay berhasil dihidupkan (**ON**) melalui perintah manual.")
         except Exception as e:
             await ctx.send(f"❌ Gagal menyalakan relay: {str(e)}")
 
     @commands.command(name="relay_off")
-    async def relay_off(self, ctx):
+    async def relay_off(self, ctx, device: str = DEFAULT_DEVICE_ID):
         """Matikan relay (mode manual)"""
         try:
-            if self.bot.current_mode != "MANUAL":
+            if self.bot.get_current_mode(device) != "MANUAL":
                 await ctx.send("⚠ Relay hanya dapat dimatikan dalam **Mode Manual**.\nUbah mode dengan perintah !manual.")
                 return
             
-            self.bot.mqtt_handler.client.publish(MQTT_RELAY_CONTROL_TOPIC, "OFF")
-            await ctx.send("✅ Relay berhasil dimatikan (**OFF**) melalui perintah manual.")
+            await self.send_command(ctx, device, "relay_off", MQTT_DEVICE_RELAY_CONTROL_TOPIC, "OFF", expect_relay("OFF"),
+                                    "✅ Relay berhasil dimatikan (**OFF**) melalui perintah manual.")
         except Exception as e:
             await ctx.send(f"❌ Gagal mematikan relay: {str(e)}")
 
     @commands.command(name="info")
-    async def info(self, ctx):
+    async def info(self, ctx, device: str = DEFAULT_DEVICE_ID):
         """Tampilkan data sensor terkini"""
         try:
-            is_esp_online = self.bot.mqtt_handler.get_is_esp_online()
+            is_esp_online = self.bot.mqtt_handler.get_is_esp_online(device)
             if not is_esp_online:
-                await ctx.send("❌ ESP32 Offline, data sensor tidak dapat diproses")
+                await ctx.send(f"❌ ESP32{self.bot.mqtt_handler.device_label(device)} Offline, data sensor tidak dapat diproses")
                 return
-            suhu, kelembapan, amonia = self.bot.mqtt_handler.get_sensor_data()
+            suhu, kelembapan, amonia = self.bot.mqtt_handler.get_sensor_data(device)
             if all(x is not None for x in [suhu, kelembapan, amonia]):
                 await ctx.send(
                     f"-----------------------------\n"
@@ -234,10 +461,10 @@ class CommandsCog(commands.Cog):
             await ctx.send(f"❌ Gagal mengambil data: {str(e)}")
     
     @commands.command(name="set_relay_on")
-    async def set_relay_on(self, ctx, duration: int):
-        """contoh : !set_relay_on  <detik>"""
+    async def set_relay_on(self, ctx, duration: int, device: str = DEFAULT_DEVICE_ID):
+        """contoh : !set_relay_on  <detik> [perangkat]"""
         try:
-            if self.bot.current_mode != "MANUAL":
+            if self.bot.get_current_mode(device) != "MANUAL":
                 await ctx.send("⚠ set_relay_on hanya dapat digunakan dalam **Mode Manual**.\nUbah mode dengan perintah !manual.")
                 return
 
@@ -245,22 +472,23 @@ class CommandsCog(commands.Cog):
                 await ctx.send("⚠ Durasi harus antara 5 - 1800 detik (5 detik - 30 menit).")
                 return
 
-            self.bot.relay_on_duration = duration
-            data_json = json.dumps({
-                            "command" : "relay_on",
-                            "duration" : str(duration*1000),
-                            "key" : "running"
-                        })
-            self.bot.mqtt_handler.client.publish(MQTT_RELAY_SETTING_TOPIC, data_json)
-            await ctx.send(f"✅ Durasi nyala relay berhasil diatur menjadi **{duration}** detik.")
+            data = {
+                "command" : "relay_on",
+                "duration" : str(duration*1000),
+                "key" : "running"
+            }
+            if await self.send_command(ctx, device, "set_relay_on", MQTT_DEVICE_RELAY_SETTING_TOPIC, data,
+                                       expect_setting("relay_on", duration * 1000),
+                                       f"✅ Durasi nyala relay berhasil diatur menjadi **{duration}** detik."):
+                self.bot.relay_on_duration = duration
         except Exception as e:
             await ctx.send(f"❌ Gagal setting relay: {str(e)}")
 
     @commands.command(name="set_relay_off")
-    async def set_relay_off(self, ctx, duration: int):
-        """contoh : !set_relay_off  <detik>"""
+    async def set_relay_off(self, ctx, duration: int, device: str = DEFAULT_DEVICE_ID):
+        """contoh : !set_relay_off  <detik> [perangkat]"""
         try:
-            if self.bot.current_mode != "MANUAL":
+            if self.bot.get_current_mode(device) != "MANUAL":
                 await ctx.send("⚠ !set_relay_off hanya dapat digunakan dalam ***Mode Manual***.\nUbah mode dengan perintah !manual.")
                 return
             
@@ -268,22 +496,23 @@ class CommandsCog(commands.Cog):
                 await ctx.send("⚠ Durasi harus antara 5 - 1800 detik (5 detik - 30 menit).")
                 return
 
-            self.bot.relay_off_duration = duration
-            data_json = json.dumps({
-                            "command" : "relay_off",
-                            "duration" : str(duration*1000),
-                            "key" : "running"
-                        })
-            self.bot.mqtt_handler.client.publish(MQTT_RELAY_SETTING_TOPIC, data_json)
-            await ctx.send(f"✅ Durasi cooldown relay berhasil diatur menjadi **{duration}** detik.")
+            data = {
+                "command" : "relay_off",
+                "duration" : str(duration*1000),
+                "key" : "running"
+            }
+            if await self.send_command(ctx, device, "set_relay_off", MQTT_DEVICE_RELAY_SETTING_TOPIC, data,
+                                       expect_setting("relay_off", duration * 1000),
+                                       f"✅ Durasi cooldown relay berhasil diatur menjadi **{duration}** detik."):
+                self.bot.relay_off_duration = duration
         except Exception as e:
             await ctx.send(f"❌ Gagal setting relay: {str(e)}")
 
     @commands.command(name="set_ammonia")
-    async def set_ammonia(self, ctx, value: float):
-        """contoh : !set_ammonia  <PPM>"""
+    async def set_ammonia(self, ctx, value: float, device: str = DEFAULT_DEVICE_ID):
+        """contoh : !set_ammonia  <PPM> [perangkat]"""
         try:
-            if self.bot.current_mode != "MANUAL":
+            if self.bot.get_current_mode(device) != "MANUAL":
                 await ctx.send("⚠ set_ammonia hanya dapat digunakan dalam **Mode Manual**.\nUbah mode dengan perintah !manual.")
                 return
             
@@ -291,25 +520,27 @@ class CommandsCog(commands.Cog):
                 await ctx.send("⚠ Nilai harus antara 10 - 300 PPM.")
                 return
 
-            self.bot.ammonia_threshold = value
-            data_json = json.dumps({
-                            "key" : "running",
-                            "value" : value
-                        })
-            self.bot.mqtt_handler.client.publish(MQTT_AMMONIA_THRESHOLD_TOPIC, data_json)
-            await ctx.send(f"✅ Ambang batas menjadi amonia **{value}** PPM.")
+            data = {
+                "key" : "running",
+                "value" : value
+            }
+            if await self.send_command(ctx, device, "set_ammonia", MQTT_DEVICE_AMMONIA_THRESHOLD_TOPIC, data,
+                                       expect_ammonia(value), f"✅ Ambang batas menjadi amonia **{value}** PPM."):
+                self.bot.ammonia_threshold = value
+                # Aturan peringatan amonia untuk perangkat ini ikut memakai ambang yang baru
+                self.bot.alerts.update_rule(AMONIA_ALERT_RULE, device=device, enter=value)
         except Exception as e:
             await ctx.send(f"❌ Gagal setting ambang batas ammonia: {str(e)}")
 
     @commands.command(name="config")
-    async def system_info(self, ctx):
+    async def system_info(self, ctx, device: str = DEFAULT_DEVICE_ID):
         """Menampilkan informasi sistem"""
         try:
-            is_esp_online = self.bot.mqtt_handler.get_is_esp_online()
-            ammonia_threshold = self.bot.mqtt_handler.get_ammonia_threshold()
-            relay_status, relay_mode = self.bot.mqtt_handler.get_relay_status_data()
-            relay_on_duration, relay_off_duration = self.bot.mqtt_handler.get_relay_setting_data()
-            ssid, ipaddress, wifi_status = self.bot.mqtt_handler.get_wifi_data()
+            is_esp_online = self.bot.mqtt_handler.get_is_esp_online(device)
+            ammonia_threshold = self.bot.mqtt_handler.get_ammonia_threshold(device)
+            relay_status, relay_mode = self.bot.mqtt_handler.get_relay_status_data(device)
+            relay_on_duration, relay_off_duration = self.bot.mqtt_handler.get_relay_setting_data(device)
+            ssid, ipaddress, wifi_status = self.bot.mqtt_handler.get_wifi_data(device)
             wifi_connection_status = "**Connected**" if is_esp_online else "Not Connected"
             await ctx.send(f"🛠️ *Informasi Sistem Pengendali Amonia* 🛠️\n"
                            f"• SSID: **{ssid}**\n"
@@ -324,20 +555,204 @@ class CommandsCog(commands.Cog):
             await ctx.send(f"❌ Terjadi kesalahan: {str(e)}")
 
     @commands.command(name="ping")
-    async def is_esp_online(self, ctx):
+    async def is_esp_online(self, ctx, device: str = DEFAULT_DEVICE_ID):
         """Cek apakah ESP32 online"""
         try:
-            is_esp_online = self.bot.mqtt_handler.get_is_esp_online()
+            is_esp_online = self.bot.mqtt_handler.get_is_esp_online(device)
             send_to_channel = "✅ Online" if is_esp_online else "❌ Offline"
-            await ctx.send(f"Status ESP32 : **{send_to_channel}**,")
+            latency = self.bot.command_bus.latency(device)
+            response = ""
+            if latency["confirmed"]:
+                response = (f"\n• Respons perintah: terakhir **{latency['last'] * 1000:.0f}** ms, "
+                            f"rata-rata {latency['average'] * 1000:.0f} ms ({latency['confirmed']} dikonfirmasi, "
+                            f"{latency['failed']} gagal)")
+            elif latency["failed"]:
+                response = f"\n• Respons perintah: {latency['failed']} perintah tidak dikonfirmasi"
+            await ctx.send(f"Status ESP32{self.bot.mqtt_handler.device_label(device)} : **{send_to_channel}**,{response}")
         except Exception as e:
             await ctx.send(f"❌ Gagal mengubah mode: {str(e)}")
     
+    @commands.command(name="devices")
+    async def list_devices(self, ctx):
+        """Menampilkan daftar perangkat ESP32 yang terdaftar"""
+        try:
+            lines = []
+            for device_id in self.bot.mqtt_handler.get_device_ids():
+                status = "✅ Online" if self.bot.mqtt_handler.get_is_esp_online(device_id) else "❌ Offline"
+                lines.append(f"• **{device_id}**: {status}")
+            await ctx.send("📡 *Daftar Perangkat*\n" + "\n".join(lines))
+        except Exception as e:
+            await ctx.send(f"❌ Terjadi kesalahan: {str(e)}")
+
+    @commands.command(name="history")
+    async def history(self, ctx, minutes: int = 60, device: str = DEFAULT_DEVICE_ID):
+        """Menampilkan tren sensor N menit terakhir (contoh: !history 30)"""
+        try:
+            if minutes <= 0:
+                await ctx.send("❌ Jumlah menit harus lebih dari 0!")
+                return
+            stats = self.bot.mqtt_handler.get_history_stats(minutes, device)
+            label = self.bot.mqtt_handler.device_label(device)
+            if not stats or all(value is None for value in stats.values()):
+                await ctx.send(f"⚠ Belum ada data sensor{label} dalam {minutes} menit terakhir.")
+                return
+            units = {"amonia": "PPM", "suhu": "°C", "kelembapan": "%"}
+            icons = {"amonia": "💩", "suhu": "🌡", "kelembapan": "💧"}
+            lines = [f"📈 *Tren Sensor{label} {minutes} Menit Terakhir*"]
+            for metric, unit in units.items():
+                value = stats.get(metric)
+                if value is None:
+                    lines.append(f"{icons[metric]} {metric.capitalize()}: tidak ada data")
+                    continue
+                slope = f"{value['slope']:+.2f} {unit}/jam" if value["slope"] is not None else "-"
+                lines.append(
+                    f"{icons[metric]} {metric.capitalize()}: min **{value['min']:.2f}**, maks **{value['max']:.2f}**, "
+                    f"rata-rata **{value['mean']:.2f}** {unit}, tren **{slope}** ({value['count']} data)"
+                )
+            await ctx.send("\n".join(lines))
+        except Exception as e:
+            await ctx.send(f"❌ Terjadi kesalahan: {str(e)}")
+
+    @commands.command(name="chart")
+    async def chart(self, ctx, metric: str = "semua", window: str = CHART_DEFAULT_WINDOW, device: str = DEFAULT_DEVICE_ID):
+        """Grafik sensor dalam rentang waktu (contoh: !chart amonia 6h, !chart semua 7d)"""
+        try:
+            metric = metric.lower()
+            if metric in ("semua", "all"):
+                names = list(UNITS)
+            elif metric in UNITS:
+                names = [metric]
+            else:
+                await ctx.send("❌ Metrik tidak dikenal! Pilih: amonia, suhu, kelembapan, semua")
+                return
+            try:
+                seconds = parse_window(window)
+            except ValueError as e:
+                await ctx.send(f"❌ {e}")
+                return
+
+            # Kunci cache berganti setiap bucket baru sehingga permintaan ulang dalam bucket yang sama gratis
+            bucket_seconds = max(CHART_MIN_BUCKET, seconds // CHART_POINTS)
+            threshold = self.bot.mqtt_handler.get_ammonia_threshold(device) or self.bot.ammonia_threshold
+            key = (device, tuple(names), seconds, int(time.time() // bucket_seconds), threshold)
+            png = await self.bot.chart_renderer.get(
+                key, partial(self.bot.chart_series, names, seconds, bucket_seconds, device, threshold)
+            )
+            if png is None:
+                label = self.bot.mqtt_handler.device_label(device)
+                await ctx.send(f"⚠ Belum ada data sensor{label} dalam {format_window(seconds)} terakhir.")
+                return
+            filename = f"chart_{metric}_{format_window(seconds)}.png"
+            await ctx.send(file=discord.File(io.BytesIO(png), filename=filename))
+        except Exception as e:
+            await ctx.send(f"❌ Gagal membuat grafik: {str(e)}")
+
+    @commands.command(name="alerts")
+    async def alert_rules(self, ctx, device: str = None):
+        """Daftar aturan peringatan dan peringatan yang sedang aktif"""
+        try:
+            rules = sorted(self.bot.alerts.rules(), key=lambda rule: (rule.name, rule.device or ""))
+            if device is not None:
+                rules = [rule for rule in rules if rule.device in (None, device)]
+            lines = ["🚨 *Aturan Peringatan*"]
+            for rule in rules:
+                scope = f" [{rule.device}]" if rule.device else ""
+                lines.append(f"• **{rule.name}**{scope}: {rule.describe()}")
+            active = [
+                f"• **{name}**{self.bot.mqtt_handler.device_label(device_id)}: {value:.2f}"
+                for name, device_id, value in self.bot.alerts.active() if device in (None, device_id)
+            ]
+            lines.append("\n*Aktif:*\n" + ("\n".join(active) if active else "• Tidak ada"))
+            await ctx.send("\n".join(lines))
+        except Exception as e:
+            await ctx.send(f"❌ Terjadi kesalahan: {str(e)}")
+
+    @commands.command(name="alert_set")
+    async def alert_set(self, ctx, name: str, *options: str):
+        """contoh : !alert_set suhu_tinggi metric=suhu enter=35 exit=33 alpha=0.3 sustain=60 [kind=rate window=300 op=< device=kandang2]"""
+        try:
+            changes = {}
+            for option in options:
+                key, sep, value = option.partition("=")
+                if not sep or key not in ALERT_OPTIONS:
+                    await ctx.send(f"❌ Opsi tidak dikenal: {option} (pilihan: {', '.join(ALERT_OPTIONS)})")
+                    return
+                changes[key] = ALERT_OPTIONS[key](value)
+            device = changes.pop("device", None)
+            if self.bot.alerts.get_rule(name, device) is not None:
+                rule = self.bot.alerts.update_rule(name, device, **changes)
+            else:
+                if "metric" not in changes or "enter" not in changes:
+                    await ctx.send("❌ Aturan baru membutuhkan metric= dan enter=")
+                    return
+                rule = AlertRule(name, device=device, **changes)
+                self.bot.alerts.set_rule(rule)
+            scope = f" untuk {device}" if device else ""
+            await ctx.send(f"✅ Aturan **{rule.name}**{scope}: {rule.describe()}")
+        except ValueError as e:
+            await ctx.send(f"❌ {str(e)}")
+        except Exception as e:
+            await ctx.send(f"❌ Gagal mengatur aturan peringatan: {str(e)}")
+
+    @commands.command(name="alert_delete")
+    async def alert_delete(self, ctx, name: str, device: str = None):
+        """contoh : !alert_delete <nama> [perangkat]"""
+        try:
+            if self.bot.alerts.remove_rule(name, device):
+                await ctx.send(f"✅ Aturan **{name}** dihapus.")
+            else:
+                await ctx.send(f"⚠ Aturan **{name}** tidak ditemukan.")
+        except Exception as e:
+            await ctx.send(f"❌ Terjadi kesalahan: {str(e)}")
+
+    @commands.command(name="storage")
+    async def storage_info(self, ctx):
+        """Menampilkan status antrean penyimpanan data"""
+        try:
+            stats = self.bot.pipeline.stats()
+            ingest = self.bot.mqtt_handler.ingest.stats()
+            notify = self.bot.notifier.stats()
+            wal = self.bot.replayer.stats()
+            session = self.bot.mqtt_handler.session.stats()
+            capture = self.bot.capture.stats()
+            backend = await asyncio.to_thread(self.bot.storage.stats)
+            if backend["backend"] == "sqlite":
+                backend = (f"**sqlite** ({backend['rows']} baris sejak {backend['oldest'] or '-'}, "
+                           f"data sebelum {backend['aged_until']} di {backend['archive']})")
+            else:
+                backend = f"**{backend['backend']}**"
+            compression = "nonaktif"
+            if self.bot.compressor is not None:
+                packed = self.bot.compressor.stats()
+                compression = (f"**{packed['stored']}** dari {packed['received']} data ditulis "
+                               f"(rasio {packed['ratio']:.1f}x)")
+            await ctx.send(f"💾 *Status Penyimpanan Data*\n"
+                           f"• Pesan MQTT: **{ingest['processed']}** diproses, antre {ingest['pending']}, "
+                           f"dibuang {ingest['dropped']}\n"
+                           f"• Penangkapan ({CAPTURE_MODE}): **{capture['captured']}** pembacaan, "
+                           f"duplikat {capture['duplicates']}, melebihi laju {capture['rate_limited']}\n"
+                           f"• Koneksi MQTT: **{'terhubung' if session['connected'] else 'terputus'}**, "
+                           f"{session['reconnects']}x pulih (terakhir {session['last_reconnect_seconds']:.1f} detik), "
+                           f"perintah tertahan {session['buffered']}, hilang {session['dropped']}\n"
+                           f"• WAL: belum terkirim **{wal['backlog_bytes'] / 1024:.1f}** KB "
+                           f"(total {wal['size_bytes'] / 1024:.1f} KB, gagal kirim {wal['failures']})\n"
+                           f"• Notifikasi: **{notify['sent']}** terkirim, antre {notify['pending']}, "
+                           f"digabung {notify['coalesced']}, latensi maks {notify['max_latency']:.1f} detik\n"
+                           f"• Antrean: **{stats['queue_depth']}/{stats['queue_maxsize']}** (spill: {stats['spill_depth']})\n"
+                           f"• Tersimpan: **{stats['flushed']}** data dalam {stats['batches']} batch\n"
+                           f"• Backend: {backend}\n"
+                           f"• Kompresi: {compression}\n"
+                           f"• Dibuang: **{stats['dropped']}**, gagal: **{stats['failed']}**\n"
+                           f"• Latensi flush terakhir: **{stats['last_flush_latency'] * 1000:.0f}** ms "
+                           f"(maks {stats['max_flush_latency'] * 1000:.0f} ms)\n")
+        except Exception as e:
+            await ctx.send(f"❌ Terjadi kesalahan: {str(e)}")
+
     @commands.command(name="reboot")
-    async def esp_restart(self, ctx):
+    async def esp_restart(self, ctx, device: str = DEFAULT_DEVICE_ID):
         """Restart ESP32 dan disconnect wifi"""
         try:
-            self.bot.mqtt_handler.client.publish(MQTT_RESTART_TOPIC, "restart")
+            self.bot.mqtt_handler.publish(MQTT_DEVICE_RESTART_TOPIC, "restart", device)
             await ctx.send(f"✅ ESP32 akan direstart dalam **5** detik")
         except Exception as e:
             await ctx.send(f"❌ Gagal mengubah mode: {str(e)}")
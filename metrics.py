@@ -0,0 +1,300 @@
+from bisect import bisect_left
+import threading
+import weakref
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Owner:
+    """Penanda list milik satu thread; dilepas bersama data threading.local saat thread selesai."""
+
+    __slots__ = ("cell", "__weakref__")
+
+    def __init__(self, cell):
+        self.cell = cell
+
+
+class _Cells:
+    """
+    Nilai per thread: setiap thread menulis ke list miliknya sendiri tanpa lock.
+    Lock hanya dipakai sekali per thread saat list dibuat dan saat thread selesai (nilainya dilipat ke
+    total dasar, sehingga thread per permintaan di app.py tidak menumpuk list); pembacaan menjumlahkan
+    total dasar dan list thread yang masih hidup.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._cells = {}  # id(list) -> list thread yang masih hidup
+        self._base = [0.0] * size
+        self._lock = threading.Lock()
+
+    def cell(self):
+        try:
+            return self._local.owner.cell
+        except AttributeError:
+            return self._new_cell()
+
+    def _new_cell(self):
+        cell = [0.0] * self.size
+        with self._lock:
+            self._cells[id(cell)] = cell
+        owner = self._local.owner = _Owner(cell)
+        weakref.finalize(owner, self._retire, cell)
+        return cell
+
+    def _retire(self, cell):
+        with self._lock:
+            if self._cells.pop(id(cell), None) is not None:
+                for i, value in enumerate(cell):
+                    self._base[i] += value
+
+    def totals(self):
+        with self._lock:
+            totals = list(self._base)
+            cells = list(self._cells.values())
+        for cell in cells:
+            for i, value in enumerate(cell):
+                totals[i] += value
+        return totals
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Child metrik untuk kombinasi label tertentu (dibuat sekali, lalu dipakai ulang)."""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _label_text(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(dict(self._children).items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    # Metrik tanpa label langsung memakai child dengan label kosong
+    def __getattr__(self, name):
+        if name in ("inc", "set", "set_function", "observe", "time"):
+            return getattr(self.labels(), name)
+        raise AttributeError(name)
+
+
+class _CounterChild:
+    __slots__ = ("_cells", "_function")
+
+    def __init__(self):
+        self._cells = _Cells(1)
+        self._function = None
+
+    def inc(self, amount=1):
+        self._cells.cell()[0] += amount
+
+    def set_function(self, function):
+        """Mengambil nilai dari penghitung yang sudah ada (mis. atribut stats()) saat scrape."""
+        self._function = function
+
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return self._cells.totals()[0]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _render_child(self, values, child):
+        try:
+            value = child.value()
+        except Exception:
+            return []  # Sumber nilai belum siap; lewati pada scrape ini
+        return [f"{self.name}{self._label_text(values)} {_format(value)}"]
+
+
+class _GaugeChild:
+    __slots__ = ("_value", "_function")
+
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+
+    def set(self, value):
+        self._value = value
+
+    def set_function(self, function):
+        """Nilai dihitung saat scrape (mis. kedalaman antrean) sehingga tidak ada biaya di hot path."""
+        self._function = function
+
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def _render_child(self, values, child):
+        try:
+            value = child.value()
+        except Exception:
+            return []  # Sumber nilai belum siap; lewati pada scrape ini
+        return [f"{self.name}{self._label_text(values)} {_format(value)}"]
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(perf_counter() - self._start)
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_cells")
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # Satu slot per bucket (non-kumulatif), lalu jumlah dan banyaknya observasi
+        self._cells = _Cells(len(buckets) + 2)
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[bisect_left(self._buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def time(self):
+        """Context manager untuk mengukur durasi blok kode."""
+        return _Timer(self)
+
+    def totals(self):
+        return self._cells.totals()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values, child):
+        totals = child.totals()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, totals):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._label_text(values, ('le', _format(bound)))} {_format(cumulative)}")
+        lines.append(f"{self.name}_bucket{self._label_text(values, ('le', '+Inf'))} {_format(totals[-1])}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_format(totals[-2])}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {_format(totals[-1])}")
+        return lines
+
+
+def _format(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Kumpulan metrik satu proses; `render()` menghasilkan format teks Prometheus."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registry bawaan proses (bot atau API)
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def start_http_server(port, host="0.0.0.0", registry=REGISTRY):
+    """Menjalankan endpoint /metrics di thread daemon (untuk proses bot)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrape berkala tidak perlu dicetak
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -1,188 +1,304 @@
 import paho.mqtt.client as mqtt
 from config import *
-import asyncio 
+from device_registry import DeviceRegistry, DEFAULT_DEVICE_ID, DEVICE_ID_PATTERN
+from ring_buffer import RingBuffer
+from ingest import IngestBridge
+from liveness import LivenessTracker
+from mqtt_session import MQTTSession
+import asyncio
 import json
 import time
+import metrics
+
+MESSAGES = metrics.counter("mqtt_messages_total", "Pesan MQTT yang diproses per jenis topik", ("topic",))
+HANDLE_SECONDS = metrics.histogram(
+    "mqtt_handle_seconds", "Durasi pemrosesan satu pesan MQTT di event loop (detik)", ("topic",),
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+HANDLE_ERRORS = metrics.counter("mqtt_handle_errors_total", "Pesan MQTT yang gagal diproses")
+
+# Topik lama (tanpa ID perangkat) -> jenis pesan, untuk perangkat "default"
+LEGACY_TOPICS = {
+    MQTT_SENSOR_DATA_TOPIC: "sensor",
+    MQTT_HEARTBEAT_TOPIC: "heartbeat",
+    MQTT_AMMONIA_THRESHOLD_TOPIC: "ammonia",
+    MQTT_RELAY_SETTING_TOPIC: "setting",
+    MQTT_RELAY_STATUS_TOPIC: "status",
+}
+
+# Topik per perangkat -> jenis pesan
+DEVICE_TOPICS = {
+    MQTT_DEVICE_SENSOR_DATA_TOPIC: "sensor",
+    MQTT_DEVICE_HEARTBEAT_TOPIC: "heartbeat",
+    MQTT_DEVICE_AMMONIA_THRESHOLD_TOPIC: "ammonia",
+    MQTT_DEVICE_RELAY_SETTING_TOPIC: "setting",
+    MQTT_DEVICE_RELAY_STATUS_TOPIC: "status",
+}
+
+# Jenis pesan yang dapat mengonfirmasi perintah bot (lihat CommandBus)
+CONFIRM_KINDS = ("status", "setting", "ammonia")
+
+# Data sensor dan heartbeat cukup QoS 0 (pesan berikutnya segera menyusul); topik lain memakai QoS kontrol
+SUBSCRIBE_QOS = {"sensor": 0, "heartbeat": 0}
+
+# Topik kontrol per perangkat -> padanan topik lama untuk perangkat "default"
+LEGACY_CONTROL_TOPICS = {
+    MQTT_DEVICE_RELAY_CONTROL_TOPIC: MQTT_RELAY_CONTROL_TOPIC,
+    MQTT_DEVICE_RELAY_SETTING_TOPIC: MQTT_RELAY_SETTING_TOPIC,
+    MQTT_DEVICE_AMMONIA_THRESHOLD_TOPIC: MQTT_AMMONIA_THRESHOLD_TOPIC,
+    MQTT_DEVICE_RESTART_TOPIC: MQTT_RESTART_TOPIC,
+}
+
+
+def device_topic(template, device_id=DEFAULT_DEVICE_ID):
+    """Topik kontrol untuk perangkat tertentu, mis. esp32/+/relay -> esp32/kandang1/relay."""
+    if device_id == DEFAULT_DEVICE_ID:
+        return LEGACY_CONTROL_TOPICS[template]
+    return template.replace("+", device_id)
+
 
 class MQTTHandler:
     def __init__(self, bot):
         self.bot = bot
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        self.sensor_data = {}
-        self.wifi_data = {}
-        self.relay_on_duration = None
-        self.relay_off_duration = None
-        self.relay_status = None
-        self.relay_mode = None
-        self.ammonia_threshold = None
-        self.last_message_time = None  # Menyimpan waktu terakhir penerimaan pesan
-        self.is_esp_online = True  # Status ESP32 (Online/Offline)
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=MQTT_CLIENT_ID, clean_session=False)
+        self.devices = DeviceRegistry(max_devices=MAX_DEVICES)
+        # Status online per perangkat berbasis deadline, tanpa polling
+        self.liveness = LivenessTracker(
+            self.on_device_offline, self.on_device_online,
+            timeout=ESP32_OFFLINE_TIMEOUT, timeouts=DEVICE_OFFLINE_TIMEOUTS
+        )
+        self.devices.on_evict = self.on_device_evicted
+        self.devices.get_or_create(DEFAULT_DEVICE_ID)  # ESP32 lama pada topik tanpa ID
+        self.liveness.watch(DEFAULT_DEVICE_ID)
+        # Routing topik per perangkat dengan lookup O(1): (segmen awal, segmen akhir) -> jenis pesan
+        self._device_routes = {
+            (topic.split("/")[0], topic.split("/")[2]): kind for topic, kind in DEVICE_TOPICS.items()
+        }
+        # Pesan dari thread paho diproses per batch di event loop bot
+        self.ingest = IngestBridge(bot.loop, self.handle_message, batch_size=INGEST_BATCH_SIZE, max_pending=INGEST_MAX_PENDING)
         self.setup_mqtt()
 
     def setup_mqtt(self):
         self.client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
         self.client.tls_set()
-        self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
-        self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
-
-        # Jalankan task heartbeat checker
-        asyncio.run_coroutine_threadsafe(self.check_esp32_status(), self.bot.loop)
-
-
-    def on_connect(self, client, userdata, flags, reason_code, properties):
-        if reason_code == 0:
-            print("✅ MQTT: Terhubung ke broker!")
-            client.subscribe(MQTT_RELAY_STATUS_TOPIC)
-            client.subscribe(MQTT_SENSOR_DATA_TOPIC)
-            client.subscribe(MQTT_RELAY_SETTING_TOPIC)
-            client.subscribe(MQTT_AMMONIA_THRESHOLD_TOPIC)
-            client.subscribe(MQTT_HEARTBEAT_TOPIC)
-        else:
-            print(f"❌ MQTT: Gagal terhubung ke broker dengan kode {reason_code}")
-    
-    async def check_esp32_status(self):
-        """Loop untuk memeriksa apakah ESP32 masih terhubung."""
-        already_notified_offline = False  # Untuk memastikan notifikasi offline hanya dikirim satu kali
-
-        while True:
-            try:
-                current_time = time.time()
-                if self.last_message_time is None:
-                    # Jika tidak ada pesan diterima sejak awal
-                    self.is_esp_online = False
-                else:
-                    # Hitung selisih waktu sejak pesan terakhir
-                    time_since_last_message = current_time - self.last_message_time
-                    self.is_esp_online = time_since_last_message <= 60
-
-                # Jika ESP32 terdeteksi offline
-                if not self.is_esp_online and not already_notified_offline:
-                    already_notified_offline = True  # Tandai bahwa notifikasi sudah dikirim
-                    channel = self.bot.get_channel(CHANNEL_ID)  # Ambil channel berdasarkan ID
-                    if channel:
-                        # Kirim notifikasi offline ke channel Discord
-                        asyncio.run_coroutine_threadsafe(
-                            channel.send(f"-----------------------------\n"
-                                f"⚠ **ESP32 tidak terhubung** ke broker MQTT selama lebih dari 60 detik. Pastikan perangkat online."
-                            ),
-                            self.bot.loop
-                        )
-                    else:
-                        print("⚠ Channel Discord tidak ditemukan!")
-                    print("⚠ ESP32 dalam kondisi OFFLINE.")
-
-                # Jika ESP32 kembali online
-                elif self.is_esp_online and already_notified_offline:
-                    already_notified_offline = False  # Reset flag notifikasi
-                    channel = self.bot.get_channel(CHANNEL_ID)
-                    if channel:
-                        # Kirim notifikasi kembali online ke channel Discord
-                        asyncio.run_coroutine_threadsafe(
-                            channel.send(
-                                "✅ **Sistem kembali online**. Sistem sekarang terhubung dengan broker MQTT. 🚀"
-                            ),
-                            self.bot.loop
-                        )
-                    print("✅ ESP32 dalam kondisi ONLINE.")
-
-            except Exception as e:
-                print(f"❌ Error saat memeriksa status ESP32: {e}")
-
-            # Tunggu sebelum pengecekan ulang
-            await asyncio.sleep(5)
+        # Koneksi, koneksi ulang dan buffer perintah dikelola session (dimulai lewat session.start())
+        subscriptions = [
+            (topic, SUBSCRIBE_QOS.get(kind, MQTT_CONTROL_QOS))
+            for topic, kind in list(LEGACY_TOPICS.items()) + list(DEVICE_TOPICS.items())
+        ]
+        self.session = MQTTSession(
+            self.client, MQTT_BROKER, MQTT_PORT, subscriptions,
+            min_delay=MQTT_RECONNECT_MIN_DELAY, max_delay=MQTT_RECONNECT_MAX_DELAY,
+            buffer_size=MQTT_OUTBOUND_BUFFER,
+        )
+
+        # Jalankan pelacak status online dan consumer pesan MQTT
+        asyncio.run_coroutine_threadsafe(self.liveness.run(), self.bot.loop)
+        asyncio.run_coroutine_threadsafe(self.ingest.run(), self.bot.loop)
+
+    def on_device_evicted(self, device_id):
+        self.liveness.forget(device_id)
+        self.bot.alerts.forget(device_id)
+        self.bot.capture.forget(device_id)
+        self.bot.command_bus.forget(device_id)
+
+    def on_device_offline(self, device_id):
+        """Dipanggil LivenessTracker tepat sekali saat deadline perangkat terlewati."""
+        state = self.devices.get(device_id)
+        if state is not None:
+            state.is_online = False
+        label = self.device_label(device_id)
+        self.send_to_channel(
+            f"-----------------------------\n"
+            f"⚠ **ESP32{label} tidak terhubung** ke broker MQTT selama lebih dari {self.liveness.timeout_for(device_id)} detik. Pastikan perangkat online.",
+            kind="connection", device_id=device_id
+        )
+        print(f"⚠ ESP32{label} dalam kondisi OFFLINE.")
+
+    def on_device_online(self, device_id):
+        """Dipanggil LivenessTracker saat perangkat yang offline kembali mengirim pesan."""
+        label = self.device_label(device_id)
+        self.send_to_channel(
+            f"✅ **Sistem{label} kembali online**. Sistem sekarang terhubung dengan broker MQTT. 🚀",
+            kind="connection", device_id=device_id
+        )
+        print(f"✅ ESP32{label} dalam kondisi ONLINE.")
+
+    def route(self, topic):
+        """Menentukan (jenis pesan, device id) dari topik tanpa memindai daftar topik."""
+        kind = LEGACY_TOPICS.get(topic)
+        if kind is not None:
+            return kind, DEFAULT_DEVICE_ID
+        parts = topic.split("/")
+        if len(parts) == 3:
+            kind = self._device_routes.get((parts[0], parts[2]))
+            if kind is not None:
+                if not DEVICE_ID_PATTERN.match(parts[1]):
+                    # ID dipakai di nama objek/path penyimpanan: '..', spasi, '%' dsb. ditolak
+                    print(f"⚠ Pesan dari topik '{topic}' diabaikan: ID perangkat tidak valid.")
+                    return None, None
+                return kind, parts[1]
+        return None, None
 
     def on_message(self, client, userdata, msg):
+        # Berjalan di thread jaringan paho: hanya enqueue, pemrosesan dilakukan di event loop
+        self.ingest.put(msg.topic, msg.payload)
+
+    def handle_message(self, topic, payload, recv_ts):
+        """Memproses satu pesan MQTT di event loop bot (dipanggil oleh IngestBridge)."""
+        start = time.perf_counter()
+        kind = None
         try:
-            self.last_message_time = time.time()
-            message = msg.payload.decode("utf-8")
-            channel = self.bot.get_channel(CHANNEL_ID)
-            print(f"📩 MQTT: Pesan dari topik '{msg.topic}': {message}")
-            
-            if msg.topic == MQTT_SENSOR_DATA_TOPIC:
-                self.sensor_data = json.loads(message)
-            elif msg.topic == MQTT_HEARTBEAT_TOPIC:
-                if channel:
-                    self.relay_alert(channel, message)
-                else:
-                    print(f"❌ channel tidak ditemukan")
-            elif msg.topic == MQTT_AMMONIA_THRESHOLD_TOPIC:
-                self.ammonia_threshold = float(message)
-            elif msg.topic == MQTT_RELAY_SETTING_TOPIC:
+            kind, device_id = self.route(topic)
+            if kind is None:
+                return
+            message = payload.decode("utf-8")
+            if kind in CONFIRM_KINDS and self.bot.command_bus.on_message(device_id, kind, message):
+                return  # Pantulan perintah bot sendiri dari broker, bukan pesan dari ESP32
+            state = self.devices.get_or_create(device_id)
+            state.last_message_time = recv_ts
+            state.is_online = True
+            self.liveness.touch(device_id)
+
+            if kind == "sensor":
+                state.sensor_data = json.loads(message)
+                if state.history is None:
+                    state.history = RingBuffer(HISTORY_CAPACITY)
+                state.history.append(state.sensor_data, recv_ts)
+                if CAPTURE_MODE == "event":
+                    # Setiap pembacaan disimpan (deduplikasi + batas laju per perangkat di ReadingCapture)
+                    self.bot.capture.offer(device_id, state.sensor_data, recv_ts, state.relay_status, state.relay_mode)
+                # Setiap pembacaan dievaluasi saat tiba (bukan sampel 30 detik sekali)
+                self.bot.alerts.evaluate(device_id, state.sensor_data, recv_ts)
+            else:
+                # Data sensor tidak dicetak karena frekuensinya tinggi
+                print(f"📩 MQTT: Pesan dari topik '{topic}': {message}")
+
+            if kind == "heartbeat":
+                self.relay_alert(state, message, transition=False)
+            elif kind == "ammonia":
+                state.ammonia_threshold = float(message)
+            elif kind == "setting":
                 relay_setting = json.loads(message)
                 if relay_setting["command"] == "relay_on":
-                    self.relay_on_duration = int(relay_setting["duration"]/1000)
+                    state.relay_on_duration = int(relay_setting["duration"]/1000)
                 if relay_setting["command"] == "relay_off":
-                    self.relay_off_duration = int(relay_setting["duration"]/1000)  
-            elif msg.topic == MQTT_RELAY_STATUS_TOPIC:
+                    state.relay_off_duration = int(relay_setting["duration"]/1000)
+            elif kind == "status":
                 relay_data = json.loads(message)
-                self.relay_status = relay_data["status"]
-                self.relay_mode = relay_data["mode"]
+                changed = (state.relay_status, state.relay_mode) != (relay_data["status"], relay_data["mode"])
+                state.relay_status = relay_data["status"]
+                state.relay_mode = relay_data["mode"]
                 affirmation = relay_data["affirmation"]
-                if channel:
-                    self.relay_alert(channel, affirmation)
-                else:
-                    print(f"❌ channel tidak ditemukan")
+                self.relay_alert(state, affirmation, transition=changed)
 
         except Exception as e:
-            print(f"❌ MQTT: Error saat memproses pesan: {e}")
-
-
-    def relay_alert(self, channel, affirmation):
-        try:    
-            if self.relay_status == "Relay ON" and self.relay_mode == "AUTO":
-                asyncio.run_coroutine_threadsafe(
-                    channel.send(f"-----------------------------\n"
-                                f"🔔 Peringatan! Amonia Lebih Dari {self.ammonia_threshold} PPM\n"
-                                f"• Status { self.relay_status}\n"
-                                f"• Relay menyala {self.relay_on_duration} detik"),
-                    self.bot.loop)
-            if self.relay_status == "Relay OFF" and  self.relay_mode == "AUTO" and affirmation == "OFF":
-                asyncio.run_coroutine_threadsafe(
-                    channel.send(f"-----------------------------\n"
-                                f"🔔 { self.relay_status}, Pendinginan {self.relay_off_duration} detik"),
-                    self.bot.loop)
+            HANDLE_ERRORS.inc()
+            print(f"❌ MQTT: Error saat memproses pesan: {e}")
+        finally:
+            # Jenis topik (bukan topik mentah) sebagai label agar jumlah seri tidak tumbuh per perangkat
+            label = kind or "unknown"
+            MESSAGES.labels(label).inc()
+            HANDLE_SECONDS.labels(label).observe(time.perf_counter() - start)
+
+    @staticmethod
+    def device_label(device_id):
+        """Label perangkat untuk pesan Discord (kosong untuk perangkat default)."""
+        return "" if device_id == DEFAULT_DEVICE_ID else f" [{device_id}]"
+
+    def send_to_channel(self, content, kind="info", device_id=None, transition=True):
+        """Menjadwalkan pesan lewat antrean notifikasi bot (digabung dan dibatasi lajunya)."""
+        self.bot.notifier.notify(CHANNEL_ID, content, kind=kind, device_id=device_id, transition=transition)
+
+    def relay_alert(self, state, affirmation, transition=True):
+        try:
+            label = self.device_label(state.device_id)
+            if state.relay_status == "Relay ON" and state.relay_mode == "AUTO":
+                self.send_to_channel(f"-----------------------------\n"
+                                     f"🔔 Peringatan{label}! Amonia Lebih Dari {state.ammonia_threshold} PPM\n"
+                                     f"• Status { state.relay_status}\n"
+                                     f"• Relay menyala {state.relay_on_duration} detik",
+                                     kind="relay", device_id=state.device_id, transition=transition)
+            if state.relay_status == "Relay OFF" and  state.relay_mode == "AUTO" and affirmation == "OFF":
+                self.send_to_channel(f"-----------------------------\n"
+                                     f"🔔{label} { state.relay_status}, Pendinginan {state.relay_off_duration} detik",
+                                     kind="relay", device_id=state.device_id, transition=transition)
             if affirmation == "alive":
-                asyncio.run_coroutine_threadsafe(
-                    channel.send(f"-----------------------------\n"
-                                f"✅ Sistem Pengendali Amonia Telah Siap 🚀\n"
-                                f"Silahkan ketik **!guide** untuk informasi lebih lanjut"),
-                    self.bot.loop)
+                self.send_to_channel(f"-----------------------------\n"
+                                     f"✅ Sistem Pengendali Amonia{label} Telah Siap 🚀\n"
+                                     f"Silahkan ketik **!guide** untuk informasi lebih lanjut",
+                                     kind="alive", device_id=state.device_id)
         except KeyError as e:
             print(f"❌ MQTT: KeyError pada parsing JSON: {e}")
         except Exception as e:
             print(f"❌ MQTT: Error di relay_alert: {e}")
 
-    def get_sensor_data(self):
+    def publish(self, template, payload, device_id=DEFAULT_DEVICE_ID):
+        """
+        Publish perintah ke topik kontrol milik perangkat tertentu (QoS kontrol).
+        Saat koneksi terputus perintah ditahan dan dikirim setelah tersambung kembali.
+        """
+        return self.session.publish(device_topic(template, device_id), payload, qos=MQTT_CONTROL_QOS)
+
+    def _state(self, device_id):
+        return self.devices.get(device_id)
+
+    def _sensor_data(self, device_id):
+        state = self._state(device_id)
+        return state.sensor_data if state else {}
+
+    def get_sensor_data(self, device_id=DEFAULT_DEVICE_ID):
+        sensor_data = self._sensor_data(device_id)
         return (
-            self.sensor_data.get("suhu"),
-            self.sensor_data.get("kelembapan"),
-            self.sensor_data.get("amonia")
+            sensor_data.get("suhu"),
+            sensor_data.get("kelembapan"),
+            sensor_data.get("amonia")
         )
-    
-    def get_wifi_data(self):
+
+    def get_wifi_data(self, device_id=DEFAULT_DEVICE_ID):
+        sensor_data = self._sensor_data(device_id)
         return (
-            self.sensor_data.get("ssid"),
-            self.sensor_data.get("ipaddress"),
-            self.sensor_data.get("wifi_status")
+            sensor_data.get("ssid"),
+            sensor_data.get("ipaddress"),
+            sensor_data.get("wifi_status")
         )
 
-    def get_relay_setting_data(self):
+    def get_relay_setting_data(self, device_id=DEFAULT_DEVICE_ID):
+        state = self._state(device_id)
         return (
-            self.relay_on_duration,
-            self.relay_off_duration
+            state.relay_on_duration if state else None,
+            state.relay_off_duration if state else None
         )
 
-    def get_relay_status_data(self):
+    def get_relay_status_data(self, device_id=DEFAULT_DEVICE_ID):
+        state = self._state(device_id)
         return (
-            self.relay_status,
-            self.relay_mode
+            state.relay_status if state else None,
+            state.relay_mode if state else None
         )
-    
-    def get_ammonia_threshold(self):
-        return self.ammonia_threshold
-    
-    def get_is_esp_online(self):
-        return self.is_esp_online
-        
-    
+
+    def get_ammonia_threshold(self, device_id=DEFAULT_DEVICE_ID):
+        state = self._state(device_id)
+        return state.ammonia_threshold if state else None
+
+    def get_is_esp_online(self, device_id=DEFAULT_DEVICE_ID):
+        state = self._state(device_id)
+        return state.is_online if state else False
+
+    def get_history_stats(self, minutes, device_id=DEFAULT_DEVICE_ID):
+        """Statistik pembacaan `minutes` menit terakhir dari ring buffer di memori."""
+        state = self._state(device_id)
+        if state is None or state.history is None:
+            return None
+        return state.history.stats(minutes * 60)
+
+    def get_history_window(self, seconds, device_id=DEFAULT_DEVICE_ID):
+        """Pembacaan `seconds` detik terakhir dari ring buffer: (timestamps, {metrik: nilai}) atau None."""
+        state = self._state(device_id)
+        if state is None or state.history is None:
+            return None
+        return state.history.window(seconds)
+
+    def get_device_ids(self):
+        return [state.device_id for state in self.devices.devices()]
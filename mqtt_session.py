@@ -0,0 +1,167 @@
+import random
+import threading
+import time
+from collections import deque
+import paho.mqtt.client as mqtt
+import metrics
+
+CONNECTED = metrics.gauge("mqtt_connected", "1 jika bot terhubung ke broker MQTT")
+DISCONNECTS = metrics.counter("mqtt_disconnects_total", "Koneksi ke broker MQTT yang terputus")
+RECONNECT_SECONDS = metrics.histogram(
+    "mqtt_reconnect_seconds", "Waktu dari koneksi terputus sampai terhubung kembali (detik)",
+    buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+OUTBOUND_BUFFERED = metrics.counter("mqtt_outbound_buffered_total", "Perintah yang ditahan karena koneksi terputus")
+OUTBOUND_DROPPED = metrics.counter("mqtt_outbound_dropped_total", "Perintah tertahan yang hilang karena buffer penuh")
+
+
+def backoff_delay(attempt, min_delay, max_delay):
+    """Exponential backoff dengan jitter: acak antara separuh dan penuh dari min(max_delay, min_delay * 2^attempt)."""
+    delay = min(max_delay, min_delay * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+class MQTTSession:
+    """
+    Koneksi MQTT yang tahan gangguan, dijalankan di satu thread jaringan.
+    - Koneksi ulang dengan exponential backoff + jitter sehingga banyak klien tidak menyerbu broker bersamaan.
+    - Session persisten (clean_session=False pada client) dan langganan diulang setiap kali tersambung.
+    - Perintah yang dipublikasikan saat terputus ditahan di buffer terbatas (terlama dibuang jika penuh)
+      lalu dikirim berurutan begitu tersambung; pesan QoS 1 yang belum di-ack dikirim ulang oleh paho.
+    """
+
+    def __init__(self, client, host, port, subscriptions, keepalive=60, min_delay=1.0, max_delay=60.0,
+                 buffer_size=1000, on_connected=None):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.subscriptions = list(subscriptions)  # [(topik, qos)]
+        self.keepalive = keepalive
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.buffer_size = buffer_size
+        self.on_connected = on_connected
+        self._buffer = deque()  # (topik, payload, qos, retain)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._connected = False
+        self._disconnected_at = None  # monotonic saat koneksi terakhir terputus
+        self.attempt = 0
+        self.reconnects = 0
+        self.disconnects = 0
+        self.dropped = 0
+        self.last_reconnect_seconds = 0.0
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        CONNECTED.set_function(lambda: int(self._connected))
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="mqtt-session", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.client.connect(self.host, self.port, self.keepalive)
+                while not self._stopping.is_set():
+                    if self.client.loop(timeout=1.0) != mqtt.MQTT_ERR_SUCCESS:
+                        break
+            except Exception as e:
+                print(f"❌ MQTT: Gagal terhubung ke broker: {e}")
+            self._mark_disconnected()
+            if self._stopping.is_set():
+                return
+            delay = backoff_delay(self.attempt, self.min_delay, self.max_delay)
+            self.attempt += 1
+            print(f"⚠ MQTT: Mencoba terhubung kembali dalam {delay:.1f} detik (percobaan {self.attempt})...")
+            self._stopping.wait(delay)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code != 0:
+            print(f"❌ MQTT: Gagal terhubung ke broker dengan kode {reason_code}")
+            return
+        # Langganan diulang meski broker masih menyimpan session, agar topik baru ikut terdaftar
+        client.subscribe(self.subscriptions)
+        recovered = None
+        with self._lock:
+            self._connected = True
+            self.attempt = 0
+            if self._disconnected_at is not None:
+                recovered = self.last_reconnect_seconds = time.monotonic() - self._disconnected_at
+                self._disconnected_at = None
+                self.reconnects += 1
+            pending = len(self._buffer)
+            # Dikirim di dalam lock agar perintah baru tidak mendahului perintah yang tertahan
+            while self._buffer:
+                client.publish(*self._buffer.popleft())
+        if recovered is None:
+            print("✅ MQTT: Terhubung ke broker!")
+        else:
+            RECONNECT_SECONDS.observe(recovered)
+            print(f"✅ MQTT: Terhubung kembali ke broker setelah {recovered:.1f} detik.")
+        if pending:
+            print(f"📤 MQTT: {pending} perintah tertahan dikirim.")
+        if self.on_connected is not None:
+            self.on_connected()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        if self._mark_disconnected():
+            print(f"⚠ MQTT: Koneksi ke broker terputus (kode {reason_code}).")
+
+    def _mark_disconnected(self):
+        """Mencatat koneksi yang terputus; True jika sebelumnya terhubung dan bukan karena stop()."""
+        with self._lock:
+            if not self._connected:
+                return False
+            self._connected = False
+            if self._stopping.is_set():
+                return False
+            self._disconnected_at = time.monotonic()
+            self.disconnects += 1
+        DISCONNECTS.inc()
+        return True
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        """
+        Publish saat tersambung; jika terputus, pesan ditahan dan dikirim setelah koneksi pulih.
+        Mengembalikan True jika langsung dikirim, False jika ditahan.
+        """
+        with self._lock:
+            if self._connected:
+                self.client.publish(topic, payload, qos, retain)
+                return True
+            if len(self._buffer) >= self.buffer_size:
+                self._buffer.popleft()
+                self.dropped += 1
+                OUTBOUND_DROPPED.inc()
+                print("⚠ MQTT: Buffer perintah penuh, perintah terlama dibuang.")
+            self._buffer.append((topic, payload, qos, retain))
+        OUTBOUND_BUFFERED.inc()
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "connected": self._connected,
+                "buffered": len(self._buffer),
+                "dropped": self.dropped,
+                "disconnects": self.disconnects,
+                "reconnects": self.reconnects,
+                "last_reconnect_seconds": self.last_reconnect_seconds,
+            }
@@ -0,0 +1,194 @@
+import asyncio
+import heapq
+import itertools
+import time
+import metrics
+
+# Prioritas pengiriman: perubahan status didahulukan dari peringatan berulang
+TRANSITION, REPEAT = 0, 1
+
+SEND_SECONDS = metrics.histogram("discord_send_seconds", "Durasi channel.send ke Discord (detik)", ("kind",))
+QUEUE_SECONDS = metrics.histogram(
+    "notification_queue_seconds", "Waktu notifikasi di antrean sampai terkirim (detik)", ("kind",),
+    buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 120.0, 300.0),
+)
+RATE_LIMIT_WAIT = metrics.counter(
+    "discord_rate_limit_wait_seconds_total", "Total waktu menunggu token bucket per channel (detik)"
+)
+RATE_LIMITED = metrics.counter("discord_rate_limited_total", "Pengiriman yang ditolak Discord dengan HTTP 429")
+
+
+class TokenBucket:
+    """Batas laju per channel: `rate` pesan per detik dengan ledakan maksimal `burst` pesan."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        """Waktu tunggu (detik) sampai satu token tersedia; 0 jika bisa langsung kirim."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Notification:
+    __slots__ = ("key", "content", "count", "enqueued")
+
+    def __init__(self, key, content, enqueued):
+        self.key = key
+        self.content = content
+        self.count = 1
+        self.enqueued = enqueued
+
+
+class NotificationScheduler:
+    """
+    Satu antrean keluar untuk semua pesan Discord.
+    - Peringatan sejenis (channel, jenis, perangkat) dalam `window` detik digabung menjadi satu digest.
+    - Perubahan status (transition) selalu dikirim lebih dulu daripada pengulangan.
+    - Setiap channel memiliki token bucket sehingga pengiriman tidak menabrak rate limit Discord.
+    Semua method dipanggil dari event loop bot.
+    """
+
+    def __init__(self, bot, window=60, rate=1.0, burst=5):
+        self.bot = bot
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self._heap = []  # (prioritas, waktu kirim paling awal, urutan, notifikasi)
+        self._pending = {}  # key -> notifikasi berulang yang belum terkirim
+        self._last_sent = {}  # key -> waktu kirim terakhir
+        self._buckets = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def notify(self, channel_id, content, kind="info", device_id=None, transition=True):
+        """
+        Menjadwalkan pesan. `transition=False` menandai pengulangan peringatan yang sama:
+        pesan tersebut digabung dengan pengulangan lain sampai jendela `window` berakhir.
+        """
+        key = (channel_id, kind, device_id)
+        now = time.monotonic()
+        if transition:
+            priority, due = TRANSITION, now
+            self._last_sent[key] = now  # Pengulangan berikutnya menunggu satu jendela setelah transisi
+        else:
+            pending = self._pending.get(key)
+            if pending is not None:
+                # Sudah ada di antrean: cukup perbarui isi dan hitungannya
+                pending.content = content
+                pending.count += 1
+                self.coalesced += 1
+                return
+            last = self._last_sent.get(key)
+            priority, due = REPEAT, now if last is None else max(now, last + self.window)
+
+        notification = _Notification(key, content, now)
+        if not transition:
+            self._pending[key] = notification
+        heapq.heappush(self._heap, (priority, due, next(self._sequence), notification))
+        self._wakeup.set()
+
+    def _bucket(self, channel_id):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def _wait(self, timeout):
+        """Tidur hingga `timeout` detik atau sampai ada pesan baru masuk."""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            try:
+                if not self._heap:
+                    await self._wait(None)
+                    continue
+                priority, due, _, notification = self._heap[0]
+                now = time.monotonic()
+                if due > now:
+                    await self._wait(due - now)
+                    continue
+                channel_id = notification.key[0]
+                bucket = self._bucket(channel_id)
+                delay = bucket.delay(now)
+                if delay > 0:
+                    await self._wait(delay)
+                    RATE_LIMIT_WAIT.inc(time.monotonic() - now)
+                    continue
+                heapq.heappop(self._heap)
+                if self._pending.get(notification.key) is notification:
+                    del self._pending[notification.key]
+                bucket.take()
+                await self._send(channel_id, notification)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error dalam antrean notifikasi: {e}")
+
+    async def _send(self, channel_id, notification):
+        content = notification.content
+        if notification.count > 1:
+            content += f"\n🔁 {notification.count} peringatan serupa digabung (jendela {self.window} detik)"
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            self.failed += 1
+            print("❌ channel tidak ditemukan")
+            return
+        kind = notification.key[1]
+        start = time.monotonic()
+        try:
+            await channel.send(content)
+        except Exception as e:
+            self.failed += 1
+            if getattr(e, "status", None) == 429:
+                RATE_LIMITED.inc()
+            print(f"❌ Gagal mengirim notifikasi: {e}")
+            return
+        now = time.monotonic()
+        SEND_SECONDS.labels(kind).observe(now - start)
+        self._last_sent[notification.key] = now
+        latency = now - notification.enqueued
+        QUEUE_SECONDS.labels(kind).observe(latency)
+        self.sent += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self._total_latency += latency
+
+    def stats(self):
+        return {
+            "pending": len(self._heap),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "last_latency": self.last_latency,
+            "max_latency": self.max_latency,
+            "avg_latency": self._total_latency / self.sent if self.sent else 0.0,
+        }
@@ -0,0 +1,248 @@
+import base64
+import bisect
+import csv
+import json
+import re
+import sys
+import threading
+from datetime import datetime
+import pytz
+from partition_writer import PARTITION_HEADER, device_prefix
+from columnar import ARCHIVE_PREFIX, TIMEZONE, decode_columnar, format_timestamps, partition_of
+
+# Nama objek manifest di bucket partisi harian
+MANIFEST_NAME = "manifest.json"
+PARTITION_PATTERN = re.compile(r"^(devices/[^/]+/)?\d{4}/\d{2}/data_\d{2}\.csv$")
+NUMERIC_COLUMNS = ("suhu", "kelembapan", "amonia")
+
+
+class PartitionIndex:
+    """
+    Manifest partisi harian YYYY/MM/data_DD.csv: jumlah baris dan timestamp min/max per objek.
+    Dipakai untuk membuka hanya partisi yang beririsan dengan rentang waktu query.
+    """
+
+    def __init__(self, bucket, name=MANIFEST_NAME):
+        self.bucket = bucket
+        self.name = name
+        self.partitions = {}  # nama partisi -> {"rows", "min_ts", "max_ts"}
+        self.generation = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Memuat manifest dari bucket. Mengembalikan False jika manifest belum ada."""
+        blob = self.bucket.get_blob(self.name)
+        if blob is None:
+            return False
+        self._load_blob(blob)
+        return True
+
+    def refresh(self):
+        """Memuat ulang manifest hanya jika generation-nya berubah (cek metadata saja)."""
+        blob = self.bucket.get_blob(self.name)
+        if blob is not None and blob.generation != self.generation:
+            self._load_blob(blob)
+
+    def _load_blob(self, blob):
+        manifest = json.loads(blob.download_as_text())
+        with self._lock:
+            self.partitions = manifest.get("partitions", {})
+            self.generation = blob.generation
+
+    def save(self):
+        with self._lock:
+            body = json.dumps({"partitions": self.partitions}, sort_keys=True)
+        self.bucket.blob(self.name).upload_from_string(body, content_type="application/json")
+
+    def update(self, name, rows):
+        """Memperbarui statistik partisi dengan baris baru (kolom pertama = timestamp)."""
+        if not rows:
+            return
+        timestamps = [row[0] for row in rows]
+        with self._lock:
+            entry = self.partitions.setdefault(name, {"rows": 0, "min_ts": timestamps[0], "max_ts": timestamps[0]})
+            entry["rows"] += len(rows)
+            entry["min_ts"] = min(entry["min_ts"], min(timestamps))
+            entry["max_ts"] = max(entry["max_ts"], max(timestamps))
+
+    def mark_archived(self, name, archive):
+        """Mencatat nama arsip kolom untuk partisi yang sudah dikompaksi."""
+        with self._lock:
+            self.partitions[name]["archive"] = archive
+
+    def rebuild(self):
+        """Membangun ulang manifest dengan memindai semua partisi yang ada di bucket."""
+        partitions = {}
+        for blob in self.bucket.list_blobs():
+            if not PARTITION_PATTERN.match(blob.name):
+                continue
+            reader = csv.reader(blob.download_as_text().splitlines())
+            next(reader, None)
+            timestamps = [row[0] for row in reader if row]
+            if timestamps:
+                partitions[blob.name] = {"rows": len(timestamps), "min_ts": min(timestamps), "max_ts": max(timestamps)}
+        with self._lock:
+            self.partitions = partitions
+        self.save()
+
+    def overlapping(self, start=None, end=None, device_id=None):
+        """
+        Daftar partisi (urut waktu) milik satu perangkat yang rentang timestamp-nya
+        beririsan dengan [start, end].
+        """
+        prefix = device_prefix(device_id)
+        with self._lock:
+            items = list(self.partitions.items())
+        names = [
+            name for name, entry in items
+            if (name.startswith(prefix) if prefix else not name.startswith("devices/"))
+            and (start is None or entry["max_ts"] >= start) and (end is None or entry["min_ts"] <= end)
+        ]
+        return sorted(names)
+
+
+def encode_cursor(name, offset):
+    return base64.urlsafe_b64encode(f"{name}:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        name, offset = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit(":", 1)
+        return name, int(offset)
+    except Exception:
+        raise ValueError("Cursor tidak valid!")
+
+
+def _convert(header, values, columns=None):
+    record = dict(zip(header, values))
+    if columns is not None:
+        record = {name: value for name, value in record.items() if name == "timestamp" or name in columns}
+    for column in NUMERIC_COLUMNS:
+        if column in record:
+            try:
+                record[column] = float(record[column])
+            except (TypeError, ValueError):
+                pass
+    return record
+
+
+def _iter_lines(blob, offset, window):
+    """
+    Membaca objek per jendela byte (ranged download) mulai dari `offset`.
+    Menghasilkan (posisi akhir baris, baris) sehingga pembacaan bisa berhenti kapan saja.
+    """
+    size = blob.size
+    position = offset
+    remainder = b""
+    while position < size:
+        data = remainder + blob.download_as_bytes(start=position, end=min(position + window, size) - 1)
+        base = position - len(remainder)
+        position = min(position + window, size)
+        lines = data.splitlines(keepends=True)
+        # Baris terakhir yang belum lengkap disimpan untuk jendela berikutnya
+        remainder = lines.pop() if lines and position < size and not lines[-1].endswith(b"\n") else b""
+        for line in lines:
+            base += len(line)
+            yield base, line
+    if remainder:
+        yield size, remainder
+
+
+def _query_csv(blob, offset, start, end, limit, columns, records):
+    """Membaca partisi CSV mulai dari offset byte. Mengembalikan offset lanjutan jika halaman penuh."""
+    # Perkiraan ~64 byte per baris CSV, minimal 16 KiB per ranged download
+    window = max(16 * 1024, limit * 64)
+    for position, line in _iter_lines(blob, offset, window):
+        values = next(csv.reader([line.decode("utf-8")]), None)
+        if not values or values[0] == "timestamp":
+            continue  # baris kosong atau header
+        timestamp = values[0]
+        if start is not None and timestamp < start:
+            continue
+        if end is not None and timestamp > end:
+            break
+        records.append(_convert(PARTITION_HEADER, values, columns))
+        if len(records) >= limit:
+            return position
+    return None
+
+
+def _query_archive(blob, offset, start, end, limit, columns, records):
+    """Membaca arsip kolom (hanya kolom yang diminta) mulai dari indeks baris `offset`."""
+    wanted = set(PARTITION_HEADER if columns is None else columns) | {"timestamp"}
+    data = decode_columnar(blob.download_as_bytes(), wanted)
+    epochs = data.pop("timestamp")
+    # Timestamp arsip terurut sehingga batas rentang dicari dengan bisect
+    lo = max(offset, bisect.bisect_left(epochs, _to_epoch(start)) if start else 0)
+    hi = bisect.bisect_right(epochs, _to_epoch(end)) if end else len(epochs)
+    take = min(hi, lo + limit - len(records))
+    timestamps = format_timestamps(epochs[lo:take])
+    names = [name for name in PARTITION_HEADER if name in data]
+    for row, timestamp in zip(range(lo, take), timestamps):
+        record = {"timestamp": timestamp}
+        for name in names:
+            value = data[name][row]
+            record[name] = value if isinstance(value, str) else round(value, 4)
+        records.append(record)
+    if len(records) >= limit:
+        return take
+    return None
+
+
+def _to_epoch(value):
+    return int(pytz.timezone(TIMEZONE).localize(datetime.strptime(value, "%Y-%m-%d %H:%M:%S")).timestamp())
+
+
+def read_partition(bucket, source, start=None, end=None, columns=None):
+    """
+    Seluruh record satu objek partisi (CSV atau arsip kolom) dalam rentang [start, end].
+    Mengembalikan None jika objek tidak ada di bucket.
+    """
+    blob = bucket.get_blob(source)
+    if blob is None:
+        return None
+    records = []
+    query = _query_archive if source.startswith(ARCHIVE_PREFIX) else _query_csv
+    query(blob, 0, start, end, sys.maxsize, columns, records)
+    return records
+
+
+def query_partitions(index, start=None, end=None, limit=500, cursor=None, columns=None, device_id=None):
+    """
+    Mengambil satu halaman data pada rentang [start, end] (string "YYYY-MM-DD HH:MM:SS").
+    Hanya partisi yang beririsan yang dibuka. Partisi yang sudah dikompaksi dibaca dari arsip
+    kolom (hanya kolom yang diminta); partisi CSV dibaca dengan ranged download dari offset byte
+    pada cursor. Biaya sebanding dengan ukuran halaman, bukan total riwayat.
+    Mengembalikan (daftar record, cursor berikutnya atau None).
+    """
+    names = index.overlapping(start, end, device_id)
+    cursor_source, cursor_offset = decode_cursor(cursor) if cursor else (None, 0)
+    cursor_partition = partition_of(cursor_source) if cursor_source else None
+
+    records = []
+    for name in names:
+        if cursor_partition is not None and name < cursor_partition:
+            continue  # partisi sebelum posisi cursor
+        if name == cursor_partition:
+            # Cursor bisa menunjuk ke CSV maupun arsip kolomnya
+            source, offset = cursor_source, cursor_offset
+        else:
+            source, offset = index.partitions.get(name, {}).get("archive") or name, 0
+
+        blob = index.bucket.get_blob(source)
+        if blob is None:
+            continue
+        query = _query_archive if source.startswith(ARCHIVE_PREFIX) else _query_csv
+        next_offset = query(blob, offset, start, end, limit, columns, records)
+        if next_offset is not None:
+            return records, encode_cursor(source, next_offset)
+    return records, None
+
+
+if __name__ == "__main__":
+    # Membangun ulang manifest untuk riwayat yang ditulis sebelum manifest ada
+    from storage_session import get_bucket
+    bucket_name = sys.argv[1] if len(sys.argv) > 1 else "all-data-sensor-bucket"
+    index = PartitionIndex(get_bucket(bucket_name))
+    index.rebuild()
+    print(f"✅ Manifest dibangun ulang: {len(index.partitions)} partisi di {bucket_name}/{MANIFEST_NAME}")
@@ -0,0 +1,134 @@
+import heapq
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+import metrics
+from partition_index import read_partition
+from storage_session import HTTP_POOL_SIZE
+
+FETCH_SECONDS = metrics.histogram(
+    "partition_fetch_seconds", "Durasi unduh + parse satu partisi harian (detik)",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+FETCH_RETRIES = metrics.counter("partition_fetch_retries_total", "Unduhan partisi yang diulang setelah gagal")
+FETCH_MISSING = metrics.counter("partition_missing_total", "Partisi di manifest yang tidak ada di bucket")
+
+
+class PartitionReader:
+    """
+    Membaca banyak partisi harian sekaligus: unduh + parse berjalan paralel di thread pool terbatas
+    (memakai client storage bersama yang koneksinya di-pool), hasilnya dialirkan urut timestamp.
+    Partisi yang hilang dilewati; kegagalan sementara diulang dengan backoff.
+    """
+
+    def __init__(self, workers=HTTP_POOL_SIZE, retries=3, retry_delay=0.2, prefetch=None):
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # Jumlah partisi yang boleh diunduh di depan konsumen (membatasi memori)
+        self.prefetch = prefetch or workers * 2
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="partition-read")
+
+    def fetch(self, index, name, start=None, end=None, columns=None):
+        """Seluruh record satu partisi (nama dari PartitionIndex) dalam rentang [start, end]; [] jika tidak ada."""
+        began = time.perf_counter()
+        archive = index.partitions.get(name, {}).get("archive")
+        for attempt in range(self.retries + 1):
+            try:
+                records = None
+                for source in filter(None, (archive, name)):
+                    # Arsip belum/tidak ada: coba CSV aslinya
+                    records = read_partition(index.bucket, source, start, end, columns)
+                    if records is not None:
+                        break
+                else:
+                    FETCH_MISSING.inc()
+                    print(f"⚠ Partisi {name} tidak ditemukan, dilewati.")
+                    records = []
+                FETCH_SECONDS.observe(time.perf_counter() - began)
+                return records
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                FETCH_RETRIES.inc()
+                delay = self.retry_delay * 2 ** attempt
+                print(f"⚠ Gagal membaca partisi {name} ({e}), diulang dalam {delay:.1f} detik...")
+                time.sleep(delay)
+
+    def stream(self, index, start=None, end=None, columns=None, device_ids=(None,), transform=None):
+        """
+        Generator record urut timestamp untuk satu atau beberapa perangkat. Partisi setiap perangkat
+        dibaca berurutan hari; antar perangkat digabung dengan heapq.merge (kolom `device` ditambahkan
+        bila lebih dari satu perangkat). `transform(records)` (mis. interpolasi) diterapkan per perangkat
+        sebelum digabung.
+        """
+        names = {device_id: index.overlapping(start, end, device_id) for device_id in device_ids}
+        # Urutan unduhan mengikuti urutan konsumsi: hari demi hari untuk semua perangkat
+        order = sorted(
+            (name for partitions in names.values() for name in partitions),
+            key=lambda name: name.rsplit("/", 3)[-3:],
+        )
+        prefetcher = _Prefetcher(self._pool, self.prefetch, order, lambda name: self.fetch(index, name, start, end, columns))
+        try:
+            sources = [
+                self._device_records(prefetcher, partitions, device_id if len(names) > 1 else None)
+                for device_id, partitions in names.items()
+            ]
+            if transform is not None:
+                sources = [transform(source) for source in sources]
+            if len(sources) == 1:
+                yield from sources[0]
+            else:
+                yield from heapq.merge(*sources, key=itemgetter("timestamp"))
+        finally:
+            prefetcher.cancel()
+
+    @staticmethod
+    def _device_records(prefetcher, partitions, device_id):
+        for name in partitions:
+            for record in prefetcher.result(name):
+                if device_id is not None:
+                    record["device"] = device_id
+                yield record
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _Prefetcher:
+    """Menjaga paling banyak `limit` partisi sedang/sudah diunduh tetapi belum dikonsumsi."""
+
+    def __init__(self, pool, limit, names, fetch):
+        self.pool = pool
+        self.limit = limit
+        self.fetch = fetch
+        self.pending = deque(names)
+        self.futures = {}
+        self._lock = threading.Lock()
+        self._fill()
+
+    def _fill(self):
+        with self._lock:
+            while self.pending and len(self.futures) < self.limit:
+                name = self.pending.popleft()
+                self.futures[name] = self.pool.submit(self.fetch, name)
+
+    def result(self, name):
+        with self._lock:
+            future = self.futures.pop(name, None)
+            if future is None:
+                # Diminta lebih awal dari urutan unduhan (tidak biasa): ambil langsung
+                self.pending.remove(name)
+        self._fill()
+        if future is None:
+            return self.fetch(name)
+        return future.result()
+
+    def cancel(self):
+        with self._lock:
+            self.pending.clear()
+            for future in self.futures.values():
+                future.cancel()
+            self.futures.clear()
@@ -0,0 +1,147 @@
+import csv
+import io
+import os
+import threading
+import time
+from storage_session import append_object, get_upload_stats
+from device_registry import DEFAULT_DEVICE_ID
+
+# Header partisi harian YYYY/MM/data_DD.csv
+PARTITION_HEADER = ["timestamp", "suhu", "kelembapan", "amonia", "status relay", "mode relay"]
+
+
+def device_prefix(device_id=None):
+    """Prefix objek per perangkat; perangkat default tetap di root bucket (layout lama)."""
+    if device_id is None or device_id == DEFAULT_DEVICE_ID:
+        return ""
+    return f"devices/{device_id}/"
+
+
+def partition_name(current_time, device_id=None):
+    """Nama objek partisi harian untuk waktu tertentu: [devices/<id>/]YYYY/MM/data_DD.csv"""
+    return f"{device_prefix(device_id)}{current_time.strftime('%Y/%m')}/data_{current_time.strftime('%d')}.csv"
+
+
+def encode_rows(rows, header=None):
+    """Mengubah baris menjadi bytes CSV (opsional dengan header)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+class PartitionWriter:
+    """
+    Penulis partisi harian append-only.
+    Baris ditampung di buffer lokal, lalu di-flush per batch sebagai objek chunk kecil
+    yang digabungkan ke objek harian dengan compose. Biaya per penulisan tetap konstan
+    sepanjang hari karena objek harian tidak pernah diunduh ulang.
+    """
+
+    def __init__(self, bucket, flush_rows=10, flush_interval=300, local_dir=None, index=None):
+        self.bucket = bucket
+        self.index = index  # PartitionIndex opsional yang diperbarui setiap flush
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.local_dir = local_dir
+        self._pending = {}  # nama partisi -> daftar baris yang belum di-flush
+        self._pending_count = 0
+        self._known = set()  # partisi yang sudah pasti ada di bucket
+        self._last_timestamps = {}  # nama partisi -> timestamp baris terakhir yang diterima
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        # Flush berjalan satu per satu: chunk setiap partisi digabung sesuai urutan baris dan
+        # pemeriksaan objek baru (header) tidak berlomba dengan upload pertama dari thread lain
+        self._flush_lock = threading.Lock()
+
+    def append(self, current_time, row, device_id=None, flush=True):
+        """
+        Menambahkan satu baris ke partisi harian sesuai `current_time` (dan perangkat).
+        Baris dengan timestamp yang tidak lebih baru dari baris terakhir partisi diabaikan,
+        sehingga pengiriman ulang dari WAL bersifat idempoten.
+        `flush=False` hanya menampung baris (pemindahan massal memanggil flush() sendiri per potongan).
+        Mengembalikan jumlah baris yang di-flush ke bucket (0 jika masih ditampung).
+        """
+        name = partition_name(current_time, device_id)
+        with self._lock:
+            last = self._last_timestamps.get(name)
+            if last is None and self.index is not None:
+                last = self.index.partitions.get(name, {}).get("max_ts")
+            if last is not None and row[0] <= last:
+                return 0
+            self._last_timestamps[name] = row[0]
+            if self.local_dir is not None:
+                self._append_local(name, row)
+            # Pergantian hari: partisi hari sebelumnya langsung di-flush
+            day = partition_name(current_time)
+            rollover = any(not pending.endswith(day) for pending in self._pending)
+            if rollover:
+                for old in [n for n in self._last_timestamps if not n.endswith(day)]:
+                    del self._last_timestamps[old]
+            self._pending.setdefault(name, []).append(row)
+            self._pending_count += 1
+            due = flush and (
+                rollover
+                or self._pending_count >= self.flush_rows
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        """
+        Mengunggah semua baris yang tertunda sebagai chunk dan menggabungkannya ke objek harian.
+        Aman dipanggil dari beberapa thread (worker pipeline, replayer WAL, pemindahan hot store);
+        saat kembali tanpa error, semua baris yang ditampung sebelum panggilan sudah ada di bucket.
+        Mengembalikan jumlah baris yang berhasil diunggah.
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_count = 0
+            self._last_flush = time.monotonic()
+
+        flushed = 0
+        items = list(pending.items())
+        try:
+            for position, (name, rows) in enumerate(items):
+                try:
+                    self._append_object(name, rows)
+                    flushed += len(rows)
+                    if self.index is not None:
+                        self.index.update(name, rows)
+                except Exception:
+                    # Kembalikan baris yang belum terunggah ke buffer agar dicoba lagi pada flush berikutnya
+                    with self._lock:
+                        for failed_name, failed_rows in items[position:]:
+                            self._pending[failed_name] = failed_rows + self._pending.get(failed_name, [])
+                            self._pending_count += len(failed_rows)
+                    raise
+        finally:
+            # Manifest disimpan sekali per flush untuk partisi yang berhasil diunggah
+            if flushed and self.index is not None:
+                self.index.save()
+        return flushed
+
+    def _append_object(self, name, rows):
+        exists = True if name in self._known else self.bucket.blob(name).exists()
+        data = encode_rows(rows, None if exists else PARTITION_HEADER)
+        nbytes = append_object(self.bucket, name, data, exists=exists)
+        self._known.add(name)
+        get_upload_stats(self.bucket.name).record(nbytes, len(rows))
+
+    def _append_local(self, name, row):
+        local_file = os.path.join(self.local_dir, name)
+        os.makedirs(os.path.dirname(local_file), exist_ok=True)
+        file_exists = os.path.exists(local_file)
+        with open(local_file, "a", newline="") as f:
+            writer = csv.writer(f)
+            if not file_exists:
+                writer.writerow(PARTITION_HEADER)
+            writer.writerow(row)
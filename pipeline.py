@@ -0,0 +1,254 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import pytz
+import metrics
+from device_registry import DEFAULT_DEVICE_ID
+
+TIMEZONE = pytz.timezone("Asia/Jakarta")
+
+# Kebijakan saat antrean penuh
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_BLOCK = "block"
+POLICY_SPILL = "spill"
+
+
+def make_reading(suhu, kelembapan, amonia, relay_status=None, relay_mode=None, timestamp=None,
+                 device_id=DEFAULT_DEVICE_ID):
+    """Membuat satu data pembacaan sensor dengan timestamp saat pembacaan diambil."""
+    return {
+        "timestamp": timestamp or datetime.now(TIMEZONE),
+        "device": device_id,
+        "suhu": suhu,
+        "kelembapan": kelembapan,
+        "amonia": amonia,
+        "relay_status": relay_status,
+        "relay_mode": relay_mode,
+    }
+
+
+def serialize_reading(reading):
+    """Pembacaan -> JSON satu baris (dipakai file spill dan write-ahead log)."""
+    data = dict(reading)
+    data["timestamp"] = reading["timestamp"].isoformat()
+    return json.dumps(data)
+
+
+def deserialize_reading(line):
+    data = json.loads(line)
+    data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+    return data
+
+
+FLUSH_SECONDS = metrics.histogram("pipeline_flush_seconds", "Durasi flush satu batch ke semua sink (detik)")
+
+
+class PersistencePipeline:
+    """
+    Tahap persistensi di luar event loop Discord.
+    Event loop (ReadingCapture atau monitor_system_task) hanya memasukkan data ke antrean terbatas, lalu worker di thread
+    terpisah mengurasnya per batch dan memanggil setiap sink (mis. save_to_csv_batch, save_to_gcs_batch).
+    """
+
+    def __init__(self, sinks, maxsize=1000, batch_size=20, policy=POLICY_DROP_OLDEST,
+                 workers=1, spill_path="pipeline_spill.jsonl", block_timeout=5.0):
+        if policy not in (POLICY_DROP_OLDEST, POLICY_BLOCK, POLICY_SPILL):
+            raise ValueError(f"Kebijakan antrean tidak dikenal: {policy}")
+        self.sinks = sinks
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.policy = policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+        self._workers = workers
+        # Posisi byte baris spill berikutnya yang belum dimuat; disimpan di file .offset agar restart
+        # melanjutkan dari posisi yang sama tanpa menulis ulang file spill
+        self._spill_offset_path = f"{spill_path}.offset"
+        self._spill_offset = self._load_spill_offset()
+        self._spilled_pending = self._count_spilled()
+
+        # Metrik
+        self.enqueued = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self._workers):
+            thread = threading.Thread(target=self._worker, name=f"persistence-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=10.0):
+        """Menghentikan worker setelah antrean dikuras."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def put(self, reading):
+        """
+        Memasukkan satu data ke antrean tanpa melakukan I/O jaringan.
+        Jika antrean penuh, data diperlakukan sesuai kebijakan (drop_oldest, block, spill).
+        """
+        self.put_many([reading])
+
+    def put_many(self, readings):
+        """Seperti put untuk beberapa data sekaligus (satu kali lock dan satu kali membangunkan worker)."""
+        with self._cond:
+            for reading in readings:
+                # Selama masih ada data di file spill, data baru ikut di-spill agar urutan terjaga
+                if self.policy == POLICY_SPILL and (self._spilled_pending or len(self._queue) >= self.maxsize):
+                    self._spill(reading)
+                    continue
+                if len(self._queue) >= self.maxsize:
+                    if self.policy == POLICY_BLOCK:
+                        self._cond.notify_all()
+                        self._cond.wait_for(lambda: len(self._queue) < self.maxsize, self.block_timeout)
+                    if len(self._queue) >= self.maxsize:
+                        self._queue.popleft()
+                        self.dropped += 1
+                        print("⚠ Antrean persistensi penuh, data terlama dibuang.")
+                self._queue.append(reading)
+                self.enqueued += 1
+            self._cond.notify_all()
+
+    async def put_async(self, reading):
+        """Versi coroutine dari put; kebijakan block dijalankan di thread agar event loop tidak tertahan."""
+        await self.put_many_async([reading])
+
+    async def put_many_async(self, readings):
+        if self.policy == POLICY_BLOCK:
+            return await asyncio.to_thread(self.put_many, readings)
+        return self.put_many(readings)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._spilled_pending or not self._running)
+                if not self._queue and self._spilled_pending:
+                    self._refill_from_spill()
+                if not self._queue:
+                    if not self._running:
+                        return
+                    continue
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._cond.notify_all()
+            self._flush(batch)
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        failed = 0
+        for sink in self.sinks:
+            try:
+                sink(batch)
+            except Exception as e:
+                failed += len(batch)
+                print(f"❌ Error pada sink persistensi {getattr(sink, '__name__', sink)}: {e}")
+        latency = time.perf_counter() - start
+        FLUSH_SECONDS.observe(latency)
+        with self._cond:
+            self.failed += failed
+            self.flushed += len(batch)
+            self.batches += 1
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self._total_flush_latency += latency
+
+    def _spill(self, reading):
+        with open(self.spill_path, "a") as f:
+            f.write(serialize_reading(reading) + "\n")
+        self.spilled += 1
+        self._spilled_pending += 1
+
+    def _refill_from_spill(self):
+        """
+        Memuat ulang data dari file spill ke antrean (dipanggil dengan lock dipegang).
+        Pembacaan dilanjutkan dari offset terakhir, jadi setiap baris hanya dibaca sekali; file dihapus
+        setelah seluruh isinya dimuat.
+        """
+        try:
+            f = open(self.spill_path, "rb")
+        except FileNotFoundError:
+            self._spilled_pending = 0
+            self._reset_spill()
+            return
+        with f:
+            f.seek(self._spill_offset)
+            space = self.maxsize - len(self._queue)
+            loaded, line = 0, b"\n"
+            while loaded < space:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # Akhir file (atau baris terpotong saat proses mati)
+                self._queue.append(deserialize_reading(line))
+                self._spill_offset = f.tell()
+                loaded += 1
+            finished = not line.endswith(b"\n") or self._spill_offset >= os.fstat(f.fileno()).st_size
+        if finished:
+            self._spilled_pending = 0
+            self._reset_spill()
+            return
+        self._spilled_pending = max(0, self._spilled_pending - loaded)
+        with open(self._spill_offset_path, "w") as f:
+            f.write(str(self._spill_offset))
+
+    def _reset_spill(self):
+        for path in (self.spill_path, self._spill_offset_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._spill_offset = 0
+
+    def _load_spill_offset(self):
+        try:
+            with open(self._spill_offset_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _count_spilled(self):
+        try:
+            with open(self.spill_path, "rb") as f:
+                f.seek(self._spill_offset)
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def stats(self):
+        """Metrik antrean: kedalaman dan latensi flush (detik)."""
+        with self._cond:
+            return {
+                "queue_depth": len(self._queue),
+                "queue_maxsize": self.maxsize,
+                "spill_depth": self._spilled_pending,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "flushed": self.flushed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "last_flush_latency": self.last_flush_latency,
+                "max_flush_latency": self.max_flush_latency,
+                "avg_flush_latency": self._total_flush_latency / self.batches if self.batches else 0.0,
+            }
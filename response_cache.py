@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Cache respons API di memori proses, dikunci per objek dan generation blob.
+    Entri dengan generation lama dianggap basi; total ukuran dibatasi dengan eviksi LRU.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (generation, body)
+        self._lock = threading.Lock()
+
+    def get(self, key, generation):
+        """Mengembalikan body yang di-cache jika generation masih sama, selain itu None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, generation, body):
+        size = len(body)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old[1])
+            if size > self.max_bytes:
+                # Respons lebih besar dari kapasitas cache tidak disimpan
+                return
+            self._entries[key] = (generation, body)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
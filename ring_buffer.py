@@ -0,0 +1,89 @@
+import threading
+import time
+from array import array
+import numpy as np
+
+METRICS = ("amonia", "suhu", "kelembapan")
+
+
+class RingBuffer:
+    """
+    Riwayat pembacaan terbaru dengan kapasitas tetap: satu array('d') timestamp dan satu
+    array('f') per metrik. Append O(1) menimpa data tertua; statistik jendela dihitung
+    secara vektor dengan NumPy langsung di atas buffer (tanpa salinan dan tanpa I/O storage).
+    """
+
+    def __init__(self, capacity, metrics=METRICS):
+        self.capacity = capacity
+        self.metrics = metrics
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._values = {metric: array("f", bytes(4 * capacity)) for metric in metrics}
+        self._head = 0  # posisi tulis berikutnya
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, values, timestamp=None):
+        """Menambahkan satu pembacaan (dict metrik -> nilai); nilai kosong disimpan sebagai NaN."""
+        with self._lock:
+            i = self._head
+            self._timestamps[i] = time.time() if timestamp is None else timestamp
+            for metric, column in self._values.items():
+                value = values.get(metric)
+                try:
+                    column[i] = float(value)
+                except (TypeError, ValueError):
+                    column[i] = float("nan")
+            self._head = (i + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def window(self, seconds, now=None):
+        """
+        Salinan urut waktu dari pembacaan `seconds` detik terakhir:
+        (timestamps, {metrik: nilai}) sebagai array NumPy.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            # Urutan kronologis: [head, capacity) lalu [0, head) saat buffer sudah penuh
+            if self._count < self.capacity:
+                order = np.arange(self._count)
+            else:
+                order = np.roll(np.arange(self.capacity), -self._head)
+            timestamps = np.frombuffer(self._timestamps, dtype=np.float64)[order]
+            mask = timestamps >= now - seconds
+            values = {
+                metric: np.frombuffer(column, dtype=np.float32)[order][mask].astype(np.float64)
+                for metric, column in self._values.items()
+            }
+        return timestamps[mask], values
+
+    def stats(self, seconds, now=None):
+        """
+        Statistik per metrik pada jendela waktu: min, max, mean, count dan slope
+        (kemiringan regresi linear, satuan per jam). Mengembalikan dict metrik -> dict atau None.
+        """
+        timestamps, values = self.window(seconds, now)
+        result = {}
+        for metric, column in values.items():
+            valid = ~np.isnan(column)
+            x, y = timestamps[valid], column[valid]
+            if not len(y):
+                result[metric] = None
+                continue
+            slope = None
+            if len(y) > 1:
+                dx = x - x.mean()
+                denominator = float(np.dot(dx, dx))
+                if denominator > 0:
+                    slope = float(np.dot(dx, y - y.mean()) / denominator) * 3600
+            result[metric] = {
+                "min": float(y.min()),
+                "max": float(y.max()),
+                "mean": float(y.mean()),
+                "count": int(len(y)),
+                "slope": slope,
+            }
+        return result
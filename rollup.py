@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from datetime import datetime
+import pytz
+from partition_writer import device_prefix
+
+ROLLUP_PREFIX = "rollups/"
+TIMEZONE = pytz.timezone("Asia/Jakarta")
+METRICS = ("amonia", "suhu", "kelembapan")
+
+# Resolusi -> lebar bucket (detik)
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Resolusi -> format periode objek: menit per hari, jam per bulan, hari per tahun
+PERIOD_FORMATS = {"minute": "%Y/%m/%d", "hour": "%Y/%m", "day": "%Y"}
+
+# Indeks statistik dalam list per metrik
+COUNT, TOTAL, MINIMUM, MAXIMUM, LAST = range(5)
+
+
+def bucket_start(epoch, resolution, utc_offset):
+    """Awal bucket (epoch) yang berisi `epoch`, diselaraskan ke waktu lokal."""
+    width = RESOLUTIONS[resolution]
+    return epoch - (epoch + utc_offset) % width
+
+
+def period_name(resolution, epoch, device_id=None):
+    """Nama objek rollup untuk periode yang berisi `epoch`, mis. [devices/<id>/]rollups/hour/2025/01.json"""
+    local = datetime.fromtimestamp(epoch, TIMEZONE)
+    return f"{device_prefix(device_id)}{ROLLUP_PREFIX}{resolution}/{local.strftime(PERIOD_FORMATS[resolution])}.json"
+
+
+def summarize(stats):
+    """Mengubah list statistik [count, total, min, max, last] menjadi dict untuk API."""
+    return {
+        "min": stats[MINIMUM],
+        "max": stats[MAXIMUM],
+        "mean": stats[TOTAL] / stats[COUNT] if stats[COUNT] else None,
+        "count": stats[COUNT],
+        "last": stats[LAST],
+    }
+
+
+class RollupEngine:
+    """
+    Agregat inkremental min/max/mean/count/last amonia, suhu dan kelembapan per menit, jam dan hari.
+    Setiap pembacaan diperbarui O(1) per resolusi. Rollup disimpan di bucket partisi sebagai
+    rollups/<resolusi>/<periode>.json dan hanya periode yang berubah yang diunggah ulang.
+    Setiap objek periode menyimpan epoch pembacaan terakhir yang sudah dihitung (`last_epoch`), sehingga
+    batch yang diputar ulang dari WAL setelah crash tidak dihitung dua kali walaupun rollup sudah
+    tersimpan sebelum posisi WAL dikonfirmasi.
+    """
+
+    def __init__(self, bucket, persist_interval=300):
+        self.bucket = bucket
+        self.persist_interval = persist_interval
+        self._periods = {}  # nama objek periode -> {bucket_start: {metric: stats}}
+        self._period_epochs = {}  # nama objek periode -> epoch pembacaan terakhir yang dihitung di periode itu
+        self._current = {}  # (perangkat, resolusi) -> nama periode terbaru
+        self._last_epochs = {}  # perangkat -> epoch pembacaan terakhir (replay WAL diabaikan)
+        self._dirty = set()
+        self._last_persist = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, reading):
+        timestamp = reading["timestamp"]
+        epoch = int(timestamp.timestamp())
+        utc_offset = int(timestamp.utcoffset().total_seconds()) if timestamp.utcoffset() else 0
+        device_id = reading.get("device")
+        with self._lock:
+            if epoch <= self._last_epochs.get(device_id, -1):
+                return
+            self._last_epochs[device_id] = epoch
+            for resolution in RESOLUTIONS:
+                name = period_name(resolution, epoch, device_id)
+                buckets = self._period(name)
+                if epoch <= self._period_epochs.get(name, -1):
+                    continue  # Sudah tercakup objek yang tersimpan (replay WAL setelah restart)
+                self._period_epochs[name] = epoch
+                current_key = (device_id, resolution)
+                self._current[current_key] = max(self._current.get(current_key, name), name)
+                key = str(bucket_start(epoch, resolution, utc_offset))
+                entry = buckets.get(key)
+                if entry is None:
+                    entry = buckets[key] = {}
+                for metric in METRICS:
+                    value = reading.get(metric)
+                    if value is None:
+                        continue
+                    value = float(value)
+                    stats = entry.get(metric)
+                    if stats is None:
+                        entry[metric] = [1, value, value, value, value]
+                    else:
+                        stats[COUNT] += 1
+                        stats[TOTAL] += value
+                        stats[MINIMUM] = min(stats[MINIMUM], value)
+                        stats[MAXIMUM] = max(stats[MAXIMUM], value)
+                        stats[LAST] = value
+                self._dirty.add(name)
+
+    def add_batch(self, readings):
+        """Menambahkan batch pembacaan lalu menyimpan rollup jika interval persist sudah lewat."""
+        for reading in readings:
+            self.add(reading)
+        if time.monotonic() - self._last_persist >= self.persist_interval:
+            self.persist()
+
+    def _period(self, name):
+        """Periode di memori; dimuat dari bucket saat pertama disentuh agar data lama tidak tertimpa."""
+        buckets = self._periods.get(name)
+        if buckets is None:
+            blob = self.bucket.get_blob(name)
+            data = json.loads(blob.download_as_text()) if blob is not None else {}
+            buckets = self._periods[name] = data.get("buckets", {})
+            if data.get("last_epoch") is not None:
+                self._period_epochs[name] = data["last_epoch"]
+        return buckets
+
+    def _body(self, name):
+        return json.dumps({"buckets": self._periods[name], "last_epoch": self._period_epochs.get(name)})
+
+    def read_period(self, name):
+        """Isi objek periode (bytes): dari memori jika masih dimuat (termasuk bucket yang belum disimpan), selain itu dari bucket."""
+        with self._lock:
+            buckets = self._periods.get(name)
+            if buckets is not None:
+                return self._body(name).encode("utf-8")
+        blob = self.bucket.get_blob(name)
+        return blob.download_as_bytes() if blob is not None else None
+
+    def persist(self):
+        """Mengunggah periode yang berubah, lalu melepas periode lama dari memori."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            bodies = {name: self._body(name) for name in dirty}
+            self._last_persist = time.monotonic()
+        try:
+            for name, body in bodies.items():
+                self.bucket.blob(name).upload_from_string(body, content_type="application/json")
+                dirty.discard(name)
+        finally:
+            with self._lock:
+                self._dirty |= dirty
+                # Hanya periode terbaru per perangkat dan resolusi yang perlu tetap di memori
+                current = set(self._current.values())
+                for name in list(self._periods):
+                    if name not in current and name not in self._dirty:
+                        del self._periods[name]
+                        self._period_epochs.pop(name, None)
+
+
+def load_rollups(bucket, resolution, start_epoch, end_epoch, metrics=METRICS, read_blob=None, device_id=None):
+    """
+    Membaca titik rollup pada rentang [start_epoch, end_epoch] dari objek periode di bucket.
+    `read_blob(name)` opsional untuk membaca objek lewat cache; mengembalikan bytes atau None.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Resolusi tidak dikenal: {resolution} (pilih: {', '.join(RESOLUTIONS)})")
+
+    # Nama periode yang dicakup rentang, berurutan dan unik
+    names = []
+    step = RESOLUTIONS[resolution]
+    epoch = start_epoch
+    while True:
+        name = period_name(resolution, min(epoch, end_epoch), device_id)
+        if not names or names[-1] != name:
+            names.append(name)
+        if epoch >= end_epoch:
+            break
+        epoch += step
+
+    points = []
+    for name in names:
+        if read_blob is not None:
+            data = read_blob(name)
+        else:
+            blob = bucket.get_blob(name)
+            data = blob.download_as_bytes() if blob is not None else None
+        if data is None:
+            continue
+        buckets = json.loads(data)["buckets"]
+        for key in sorted(buckets, key=int):
+            start = int(key)
+            if start + step <= start_epoch or start > end_epoch:
+                continue
+            point = {"timestamp": datetime.fromtimestamp(start, TIMEZONE).strftime("%Y-%m-%d %H:%M:%S")}
+            for metric in metrics:
+                if metric in buckets[key]:
+                    point[metric] = summarize(buckets[key][metric])
+            points.append(point)
+    return points
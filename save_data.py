@@ -1,54 +1,124 @@
-import csv
 from datetime import datetime
-from google.cloud import storage
-import pytz
-import os
+from config import GCS_FLUSH_ROWS, GCS_FLUSH_INTERVAL
+from partition_writer import PartitionWriter
+from partition_index import PartitionIndex
+from pipeline import make_reading, TIMEZONE
+from columnar import compact_closed_partitions
+from rollup import RollupEngine
+from storage_session import get_bucket
+
+# Satu penulis partisi dan satu mesin rollup per bucket, dipakai ulang selama proses berjalan
+_writers = {}
+_rollups = {}
+
+
+def get_partition_writer(bucket_name="all-data-sensor-bucket", bucket=None):
+    # Satu penulis per objek bucket: flush partisi yang sama selalu lewat kunci flush yang sama
+    if bucket is None:
+        bucket = get_bucket(bucket_name)
+    writer = _writers.get(bucket)
+    if writer is None:
+
+        # Manifest partisi (jumlah baris, timestamp min/max) untuk query rentang waktu di API
+        index = PartitionIndex(bucket)
+        if not index.load():
+            index.rebuild()
+
+        # Salinan lokal tetap ditulis di struktur folder YYYY/MM/data_DD.csv (mode append)
+        writer = PartitionWriter(
+            bucket,
+            flush_rows=GCS_FLUSH_ROWS,
+            flush_interval=GCS_FLUSH_INTERVAL,
+            local_dir=".",
+            index=index,
+        )
+        _writers[bucket] = writer
+    return writer
+
+
+def save_to_gcs_batch(readings, bucket_name="all-data-sensor-bucket", bulk=False, bucket=None):
+    """
+    Menambahkan beberapa data ke partisi harian [devices/<id>/]YYYY/MM/data_DD.csv.
+    `bulk`: seluruh batch diunggah sekali di akhir (pemindahan dari hot store), bukan per GCS_FLUSH_ROWS.
+    `bucket`: objek bucket eksplisit (backend penyimpanan); jika None dari client bersama.
+    Error diteruskan ke pemanggil.
+    """
+    writer = get_partition_writer(bucket_name, bucket)
+    flushed = 0
+    for reading in readings:
+        current_time = reading["timestamp"]
+        timestamp = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        flushed += writer.append(current_time, [
+            timestamp, reading["suhu"], reading["kelembapan"], reading["amonia"],
+            reading["relay_status"], reading["relay_mode"],
+        ], reading.get("device"), flush=not bulk)
+    if bulk:
+        flushed += writer.flush()
+    if flushed:
+        print(f"✅ Tersimpan: {bucket_name} (+{flushed} baris)")
+
+
+def get_rollup_engine(bucket_name="all-data-sensor-bucket"):
+    engine = _rollups.get(bucket_name)
+    if engine is None:
+        # Rollup disimpan di bucket yang sama dengan partisi harian (rollups/...)
+        engine = RollupEngine(get_bucket(bucket_name), persist_interval=GCS_FLUSH_INTERVAL)
+        _rollups[bucket_name] = engine
+    return engine
+
+
+def update_rollups_batch(readings, bucket_name="all-data-sensor-bucket"):
+    """Memperbarui rollup menit/jam/hari dengan batch pembacaan. Error diteruskan ke pemanggil."""
+    get_rollup_engine(bucket_name).add_batch(readings)
+
 
 def save_to_gcs(suhu, kelembapan, amonia, relay_status, relay_mode, bucket_name="all-data-sensor-bucket"):
     try:
-        # Setup waktu
-        tz = pytz.timezone("Asia/Jakarta")
-        current_time = datetime.now(tz)
-        
-        # Struktur folder YYYY/MM/data_DD.csv
-        folder_path = f"{current_time.strftime('%Y/%m')}"
-        filename = f"{folder_path}/data_{current_time.strftime('%d')}.csv"
-        timestamp = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        # Tambah data baru ke partisi harian YYYY/MM/data_DD.csv (append-only)
+        save_to_gcs_batch([make_reading(suhu, kelembapan, amonia, relay_status, relay_mode)], bucket_name)
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
 
-        # Setup GCS
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(filename)
 
-        # Buat folder lokal jika belum ada
-        os.makedirs(folder_path, exist_ok=True)
-        local_file = f"{folder_path}/data_{current_time.strftime('%d')}.csv"
+def flush_gcs():
+    """Mengunggah semua baris dan rollup yang masih tertunda (dipanggil saat bot berhenti)."""
+    for writer in _writers.values():
+        try:
+            writer.flush()
+        except Exception as e:
+            print(f"❌ Error: {str(e)}")
+    for engine in _rollups.values():
+        try:
+            engine.persist()
+        except Exception as e:
+            print(f"❌ Error: {str(e)}")
 
-        # Cek & buat file
+
+def commit_gcs():
+    """
+    Seperti flush_gcs, tetapi error diteruskan ke pemanggil setelah semua penulis dicoba.
+    Dipakai WalReplayer sebelum mengonfirmasi posisi WAL.
+    """
+    errors = []
+    for writer in _writers.values():
+        try:
+            writer.flush()
+        except Exception as e:
+            errors.append(e)
+    for engine in _rollups.values():
         try:
-            # Download file jika sudah ada
-            blob.download_to_filename(local_file)
-            with open(local_file, 'r') as f:
-                reader = csv.reader(f)
-                existing_data = list(reader)
-        except:
-            # Buat file baru
-            existing_data = [["timestamp", "suhu", "kelembapan", "amonia" , "status relay", "mode relay"]]
-            print(f"✅ File baru: {filename}")
-
-        # Tambah data baru
-        existing_data.append([timestamp, suhu, kelembapan, amonia, relay_status, relay_mode])
-
-        # Simpan ke file lokal
-        with open(local_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerows(existing_data)
-
-        # Upload ke GCS
-        blob.upload_from_filename(local_file)
-        print(f"✅ Tersimpan: {bucket_name}/{filename}")
-        print(f"✅ File lokal: {local_file}")
+            engine.persist()
+        except Exception as e:
+            errors.append(e)
+    if errors:
+        raise errors[0]
+
 
+def compact_gcs(bucket_name="all-data-sensor-bucket"):
+    """Mengompaksi partisi harian yang sudah ditutup menjadi arsip kolom (archive/YYYY/MM/data_DD.col)."""
+    try:
+        writer = get_partition_writer(bucket_name)
+        today = datetime.now(TIMEZONE).strftime("%Y-%m-%d")
+        compact_closed_partitions(writer.index, today)
     except Exception as e:
         print(f"❌ Error: {str(e)}")
-
@@ -0,0 +1,241 @@
+import csv
+import gzip
+import json
+import re
+import struct
+from itertools import islice
+import numpy as np
+
+try:
+    import brotli  # Opsional: Content-Encoding br hanya ditawarkan jika paket tersedia
+except ImportError:
+    brotli = None
+
+FORMATS = ("records", "columns", "msgpack")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+RECORDS_CHUNK = 4096  # Baris per potongan saat menulis layout records
+
+# Penanda nilai kosong yang juga dikenali pandas.read_csv sebagai NaN
+MISSING_VALUES = frozenset(("", "nan", "NaN", "None", "null", "NULL", "NA", "N/A"))
+# Kolom angka dicek sekaligus (nilai digabung dengan \n): hanya karakter angka, tanpa bentuk yang
+# diterima float() tetapi bukan angka JSON (+1, .5, 1., 01); sisanya divalidasi saat konversi float
+_NUMERIC_CHARS = re.compile(r"[-+0-9.eE\n]*")
+_NON_JSON_NUMBER = re.compile(r"(?m)^(?:[+.]|-\.|-?0\d)|\.(?:$|[eE])")
+# Nilai string yang bisa dikutip apa adanya tanpa escape JSON (dipisah \x00)
+_PLAIN_COLUMN = re.compile(r'[^"\\\x01-\x1f]*')
+
+
+class ColumnTable:
+    """
+    Isi CSV per kolom (tuple string apa adanya dari file). Token JSON per kolom dihitung sekali:
+    angka diteruskan tanpa parse, string dikutip langsung jika tidak perlu escape, nilai kosong -> null.
+    """
+
+    def __init__(self, header, columns):
+        self.header = header
+        self.columns = columns
+        self.rows = len(columns[0]) if columns else 0
+        self._floats = {}
+        self._missing = {}
+
+    def has_missing(self, i):
+        missing = self._missing.get(i)
+        if missing is None:
+            missing = self._missing[i] = not MISSING_VALUES.isdisjoint(self.columns[i])
+        return missing
+
+    def floats(self, i):
+        """Kolom angka sebagai array float64 (nilai kosong -> NaN), atau None jika bukan kolom angka."""
+        if i not in self._floats:
+            self._floats[i] = self._parse_floats(i)
+        return self._floats[i]
+
+    def _parse_floats(self, i):
+        values = self.columns[i]
+        present = [value for value in values if value not in MISSING_VALUES] if self.has_missing(i) else values
+        joined = "\n".join(present)
+        if _NUMERIC_CHARS.fullmatch(joined) is None or _NON_JSON_NUMBER.search(joined) is not None:
+            return None
+        if present is not values:
+            values = ["nan" if value in MISSING_VALUES else value for value in values]
+        try:
+            return np.array(values, dtype=np.float64)
+        except ValueError:
+            return None
+
+    def is_numeric(self, i):
+        return self.floats(i) is not None
+
+    def json_tokens(self, i):
+        values = self.columns[i]
+        if self.is_numeric(i):
+            if not self.has_missing(i):
+                return values  # Token angka dari CSV sudah berupa angka JSON yang valid
+            return ["null" if value in MISSING_VALUES else value for value in values]
+        if _PLAIN_COLUMN.fullmatch("\x00".join(values)):
+            return ['"' + value + '"' if value else "null" for value in values]
+        return [json.dumps(value) if value else "null" for value in values]
+
+
+def _split_simple(text, width):
+    """
+    CSV tanpa tanda kutip: seluruh isi dipecah sekali lalu diambil per kolom dengan slicing.
+    None jika ada baris dengan jumlah kolom berbeda (ditangani modul csv).
+    """
+    # Urutan pemisah harus persis (width - 1) koma lalu satu baris baru untuk setiap baris;
+    # dicek dengan numpy tanpa memecah teks per baris
+    raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    separators = raw[(raw == 44) | (raw == 10)]
+    rows = (separators.size + 1) // width
+    if rows * width != separators.size + 1:
+        return None
+    expected = np.full(separators.size, 44, dtype=np.uint8)
+    expected[width - 1::width] = 10
+    if not np.array_equal(separators, expected):
+        return None
+    fields = text.replace("\n", ",").split(",")
+    return [tuple(fields[k::width]) for k in range(width)]
+
+
+def parse_csv(text):
+    """CSV (dengan header) -> ColumnTable tanpa membuat dict per baris."""
+    text = text.replace("\r\n", "\n").strip("\n")
+    if not text:
+        return ColumnTable([], [])
+    header_line, _, body = text.partition("\n")
+    header = next(csv.reader([header_line]))
+    if not body:
+        return ColumnTable(header, [() for _ in header])
+    columns = None
+    if '"' not in text and "\r" not in text:
+        columns = _split_simple(body, len(header))
+    if columns is None:
+        # Baris kosong dilewati; baris pendek diisi nilai kosong, kolom berlebih dibuang
+        width = len(header)
+        rows = [(row + [""] * width)[:width] for row in csv.reader(body.splitlines()) if row]
+        columns = list(zip(*rows)) if rows else [() for _ in header]
+    return ColumnTable(header, columns)
+
+
+def encode_records(table):
+    """Layout lama {"status", "data": [{kolom: nilai}, ...]}, ditulis langsung sebagai teks JSON."""
+    keys = [json.dumps(name) for name in table.header]
+    template = "{" + ",".join(f"{key}:%s" for key in keys) + "}"
+    rows = zip(*(table.json_tokens(i) for i in range(len(table.header))))
+    # Ditulis per potongan agar teks JSON seluruh baris tidak pernah disalin berkali-kali
+    parts = [b'{"status":"success","data":[']
+    while True:
+        chunk = [template % row for row in islice(rows, RECORDS_CHUNK)]
+        if not chunk:
+            break
+        if len(parts) > 1:
+            parts.append(b",")
+        parts.append(",".join(chunk).encode("utf-8"))
+    parts.append(b"]}")
+    return b"".join(parts)
+
+
+def encode_columns(table):
+    """Layout kolom: {"status", "format", "rows", "columns": [nama], "data": {nama: [nilai]}}."""
+    data = ",".join(
+        json.dumps(name) + ":[" + ",".join(table.json_tokens(i)) + "]" for i, name in enumerate(table.header)
+    )
+    return (
+        '{"status":"success","format":"columns","rows":' + str(table.rows)
+        + ',"columns":' + json.dumps(table.header) + ',"data":{' + data + "}}"
+    ).encode("utf-8")
+
+
+# --- MessagePack (subset yang dibutuhkan: map, array, str, float64, int, nil) ---
+
+def _pack_str(value):
+    data = value.encode("utf-8")
+    size = len(data)
+    if size < 32:
+        return bytes([0xa0 | size]) + data
+    if size < 256:
+        return b"\xd9" + bytes([size]) + data
+    if size < 65536:
+        return b"\xda" + struct.pack(">H", size) + data
+    return b"\xdb" + struct.pack(">I", size) + data
+
+
+def _pack_header(size, fix, code16, code32):
+    if size < 16:
+        return bytes([fix | size])
+    if size < 65536:
+        return code16 + struct.pack(">H", size)
+    return code32 + struct.pack(">I", size)
+
+
+def _pack_array_header(size):
+    return _pack_header(size, 0x90, b"\xdc", b"\xdd")
+
+
+def _pack_map_header(size):
+    return _pack_header(size, 0x80, b"\xde", b"\xdf")
+
+
+def _pack_float_column(values):
+    """Array float64 -> float64 msgpack (0xcb + big-endian) secara vektor; nilai kosong tetap NaN."""
+    packed = np.empty(len(values), dtype=[("tag", "u1"), ("value", ">f8")])
+    packed["tag"] = 0xcb
+    packed["value"] = values
+    return packed.tobytes()
+
+
+def _pack_str_column(values):
+    lengths = {len(value) for value in values}
+    if len(lengths) == 1 and next(iter(lengths)) < 32 and all(value.isascii() for value in values):
+        # Panjang sama (mis. timestamp): fixstr secara vektor
+        size = next(iter(lengths))
+        packed = np.empty(len(values), dtype=[("tag", "u1"), ("value", f"S{size}")])
+        packed["tag"] = 0xa0 | size
+        packed["value"] = values
+        return packed.tobytes()
+    return b"".join(_pack_str(value) if value else b"\xc0" for value in values)
+
+
+def encode_msgpack(table):
+    """MessagePack berlayout kolom: {"status", "format", "rows", "columns", "data": {nama: array}}."""
+    parts = [
+        _pack_map_header(5),
+        _pack_str("status"), _pack_str("success"),
+        _pack_str("format"), _pack_str("columns"),
+        _pack_str("rows"), b"\xce" + struct.pack(">I", table.rows),
+        _pack_str("columns"), _pack_array_header(len(table.header)), *(_pack_str(name) for name in table.header),
+        _pack_str("data"), _pack_map_header(len(table.header)),
+    ]
+    for i, name in enumerate(table.header):
+        values = table.columns[i]
+        parts.append(_pack_str(name))
+        parts.append(_pack_array_header(len(values)))
+        floats = table.floats(i)
+        if floats is not None:
+            parts.append(_pack_float_column(floats))
+        else:
+            parts.append(_pack_str_column(values))
+    return b"".join(parts)
+
+
+ENCODERS = {
+    "records": (encode_records, "application/json"),
+    "columns": (encode_columns, "application/json"),
+    "msgpack": (encode_msgpack, "application/msgpack"),
+}
+
+
+def available_encodings():
+    """Content-Encoding yang didukung, urut preferensi server."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(body, encoding):
+    """Mengompres body sesuai Content-Encoding; None/identity -> body apa adanya."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
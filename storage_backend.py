@@ -0,0 +1,375 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from heapq import merge
+from itertools import chain
+from operator import itemgetter
+import metrics
+import local_storage
+import storage_session
+from device_registry import DEFAULT_DEVICE_ID
+from partition_index import PartitionIndex, query_partitions, encode_cursor, decode_cursor
+from partition_reader import PartitionReader
+from partition_writer import PARTITION_HEADER
+from pipeline import TIMEZONE
+
+BACKENDS = ("gcs", "local", "sqlite")
+PARTITION_BUCKET = "all-data-sensor-bucket"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+HOT_SOURCE = "hot/"  # Prefix cursor halaman yang dibaca dari hot store
+AGE_OUT_BATCH = 20000  # Baris per potongan saat memindahkan data lama ke object store
+
+# Nama kolom record API (header partisi) -> kolom tabel SQLite
+COLUMNS = dict(zip(PARTITION_HEADER, ("timestamp", "suhu", "kelembapan", "amonia", "relay_status", "relay_mode")))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    device TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    suhu REAL,
+    kelembapan REAL,
+    amonia REAL,
+    relay_status TEXT,
+    relay_mode TEXT,
+    PRIMARY KEY (device, timestamp)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS readings_timestamp ON readings (timestamp, device);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+HOT_ROWS = metrics.counter("hot_store_rows_total", "Baris hot store SQLite per operasi", ("op",))
+
+
+class StorageBackend:
+    """
+    Antarmuka penyimpanan pembacaan sensor. `write_batch` dan `commit` dipakai WalReplayer (error
+    diteruskan ke pemanggil); `query` dan `stream` dipakai API dengan format record dan cursor yang sama
+    untuk semua backend. `maintain` dijalankan berkala oleh bot (mis. memindahkan data lama).
+    """
+
+    name = None
+
+    def write_batch(self, readings):
+        raise NotImplementedError
+
+    def commit(self):
+        pass
+
+    def query(self, start=None, end=None, limit=500, cursor=None, columns=None, device_id=None):
+        """Satu halaman record pada rentang [start, end]. Mengembalikan (record, cursor berikutnya atau None)."""
+        raise NotImplementedError
+
+    def stream(self, start=None, end=None, columns=None, device_ids=(None,), transform=None):
+        """Iterator record urut timestamp untuk satu atau beberapa perangkat (lihat PartitionReader.stream)."""
+        raise NotImplementedError
+
+    def maintain(self):
+        pass
+
+    def stats(self):
+        return {"backend": self.name}
+
+    def close(self):
+        pass
+
+
+class ObjectStoreBackend(StorageBackend):
+    """
+    Partisi harian [devices/<id>/]YYYY/MM/data_DD.csv (dan arsip kolomnya) di object store: `bucket`
+    eksplisit (mis. dari local_storage.Client), atau bucket `bucket_name` dari client bersama jika None.
+    `write(readings, bucket_name, bulk, bucket)` dan `commit()` disuntikkan bot (save_data); tanpa
+    keduanya backend hanya bisa dibaca (API).
+    """
+
+    def __init__(self, name="gcs", bucket_name=PARTITION_BUCKET, write=None, commit=None, read_workers=8,
+                 bucket=None):
+        self.name = name
+        self.bucket_name = bucket_name
+        self.bucket = bucket
+        self._write = write
+        self._commit = commit
+        self.read_workers = read_workers
+        self._index = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def write_batch(self, readings, bulk=False):
+        self._write(readings, self.bucket_name, bulk=bulk, bucket=self.bucket)
+
+    def commit(self):
+        if self._commit is not None:
+            self._commit()
+
+    def index(self):
+        """Manifest partisi, dimuat sekali lalu hanya dimuat ulang jika generation-nya berubah."""
+        with self._lock:
+            if self._index is None:
+                bucket = self.bucket if self.bucket is not None else storage_session.get_bucket(self.bucket_name)
+                self._index = PartitionIndex(bucket)
+        self._index.refresh()
+        return self._index
+
+    def query(self, start=None, end=None, limit=500, cursor=None, columns=None, device_id=None):
+        return query_partitions(self.index(), start, end, limit, cursor, columns, device_id)
+
+    def stream(self, start=None, end=None, columns=None, device_ids=(None,), transform=None):
+        with self._lock:
+            if self._reader is None:
+                # Thread pool unduhan paralel dibuat sekali saat ekspor pertama
+                self._reader = PartitionReader(workers=self.read_workers)
+        return self._reader.stream(self.index(), start, end, columns, device_ids, transform)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.shutdown()
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Hot store SQLite (mode WAL) untuk `days` hari terakhir. Setiap batch ditulis dalam satu transaksi;
+    primary key (device, timestamp) menjadi indeks query rentang per perangkat dan membuat replay WAL
+    idempoten. `maintain()` memindahkan hari-hari yang lebih lama ke `archive` (object store) per hari
+    penuh, sehingga partisi harian sudah lengkap sebelum dikompaksi. Batas pemindahan (`aged_until`)
+    disimpan di tabel meta: data sebelum batas dibaca dari arsip, sesudahnya dari SQLite.
+    Bot menulis (satu writer), API membaca file yang sama dari proses lain (`readonly`); koneksi per thread.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, days=7, archive=None, readonly=False, batch=AGE_OUT_BATCH):
+        self.path = path
+        self.days = days
+        self.archive = archive
+        self.readonly = readonly
+        self.batch = batch
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        if not readonly:
+            with self._write_lock:
+                self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # fsync per transaksi: posisi WAL bot baru dikonfirmasi setelah batch benar-benar tersimpan
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def write_batch(self, readings):
+        rows = [
+            (
+                reading.get("device", DEFAULT_DEVICE_ID), reading["timestamp"].strftime(TIMESTAMP_FORMAT),
+                reading["suhu"], reading["kelembapan"], reading["amonia"],
+                reading["relay_status"], reading["relay_mode"],
+            )
+            for reading in readings
+        ]
+        if not rows:
+            return
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            inserted = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            inserted = conn.total_changes - inserted
+            # Batas diisi oleh batch pertama: data sebelumnya (mis. saat masih memakai backend gcs)
+            # tetap dibaca dari arsip
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('aged_until', ?)", (min(row[1] for row in rows),))
+        HOT_ROWS.labels("inserted").inc(inserted)
+
+    def boundary(self):
+        """Timestamp awal data di hot store (sebelumnya ada di arsip), atau None jika hot store masih kosong."""
+        if self.readonly and not os.path.exists(self.path):
+            return None
+        try:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = 'aged_until'").fetchone()
+        except sqlite3.OperationalError:
+            return None  # File dibuat tetapi skema belum ditulis bot
+        return row[0] if row else None
+
+    def _archived(self, start, boundary):
+        """Batas akhir (inklusif) bagian rentang yang dibaca dari arsip, atau None jika tidak ada."""
+        if self.archive is None:
+            return None
+        if boundary is None:
+            return ""  # Tanpa hot store: seluruh rentang dari arsip
+        if start is not None and start >= boundary:
+            return None
+        before = datetime.strptime(boundary, TIMESTAMP_FORMAT) - timedelta(seconds=1)
+        return before.strftime(TIMESTAMP_FORMAT)
+
+    def _select(self, device_id, lower, after, end, columns, limit=None):
+        names = ["timestamp"] + [name for name in PARTITION_HEADER[1:] if columns is None or name in columns]
+        clauses, params = ["device = ?"], [device_id or DEFAULT_DEVICE_ID]
+        for clause, value in (("timestamp >= ?", lower), ("timestamp > ?", after), ("timestamp <= ?", end)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        sql = (f"SELECT {', '.join(COLUMNS[name] for name in names)} FROM readings "
+               f"WHERE {' AND '.join(clauses)} ORDER BY timestamp")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return names, self._connect().execute(sql, params)
+
+    def query(self, start=None, end=None, limit=500, cursor=None, columns=None, device_id=None):
+        boundary = self.boundary()
+        archived = self._archived(start, boundary)
+        records, after = [], None
+        if cursor:
+            source, _ = decode_cursor(cursor)
+            if source.startswith(HOT_SOURCE):
+                after, archived = source[len(HOT_SOURCE):], None
+        if archived is not None:
+            archive_end = min(filter(None, (end, archived)), default=None)
+            records, next_cursor = self.archive.query(start, archive_end, limit, cursor, columns, device_id)
+            if next_cursor is not None or boundary is None:
+                return records, next_cursor
+            if len(records) >= limit:
+                # Halaman penuh tepat di batas arsip: halaman berikutnya dimulai dari hot store
+                return records, encode_cursor(HOT_SOURCE + records[-1]["timestamp"], 0)
+        if boundary is None:
+            return records, None
+
+        lower = max(start or boundary, boundary)
+        remaining = limit - len(records)
+        names, rows = self._select(device_id, lower, after, end, columns, remaining)
+        records.extend(dict(zip(names, row)) for row in rows)
+        if len(records) >= limit:
+            return records, encode_cursor(HOT_SOURCE + records[-1]["timestamp"], 0)
+        return records, None
+
+    def stream(self, start=None, end=None, columns=None, device_ids=(None,), transform=None):
+        boundary = self.boundary()
+        archived = self._archived(start, boundary)
+        tagged = len(device_ids) > 1
+        sources = []
+        for device_id in device_ids:
+            parts = []
+            if archived is not None:
+                archive_end = min(filter(None, (end, archived)), default=None)
+                parts.append(self.archive.stream(start, archive_end, columns, (device_id,)))
+            if boundary is not None:
+                parts.append(self._hot_records(device_id, max(start or boundary, boundary), end, columns))
+            records = chain.from_iterable(parts)
+            sources.append(_tag(records, device_id) if tagged else records)
+        if transform is not None:
+            sources = [transform(source) for source in sources]
+        if len(sources) == 1:
+            return iter(sources[0])
+        return merge(*sources, key=itemgetter("timestamp"))
+
+    def _hot_records(self, device_id, lower, end, columns):
+        names, rows = self._select(device_id, lower, None, end, columns)
+        while True:
+            chunk = rows.fetchmany(1000)
+            if not chunk:
+                return
+            for row in chunk:
+                yield dict(zip(names, row))
+
+    def maintain(self):
+        try:
+            moved = self.age_out()
+            if moved:
+                print(f"✅ Hot store: {moved} baris dipindahkan ke {self.archive.name}")
+        except Exception as e:
+            print(f"❌ Gagal memindahkan data hot store ke {self.archive.name}: {e}")
+
+    def age_out(self, now=None):
+        """
+        Memindahkan baris sebelum tengah malam `days` hari lalu ke arsip (urut perangkat lalu waktu,
+        per potongan `batch` baris), commit arsip, lalu menggeser batas dan menghapusnya dalam satu
+        transaksi sehingga pembaca tidak pernah melihat celah. Mengembalikan jumlah baris yang dipindahkan.
+        Flush arsip berbagi kunci flush PartitionWriter dengan replayer WAL (`commit_gcs`), jadi baris
+        hanya dihapus setelah flush yang mencakupnya selesai tanpa error; jika gagal, baris tetap di
+        SQLite dan dipindahkan ulang pada pemanggilan berikutnya (partisi membuang baris ganda).
+        """
+        if self.archive is None or self.readonly:
+            return 0
+        now = now or datetime.now(TIMEZONE)
+        cutoff = (now - timedelta(days=self.days)).strftime("%Y-%m-%d 00:00:00")
+        conn = self._connect()
+        moved = 0
+        key = ("", "")
+        while True:
+            rows = conn.execute(
+                "SELECT device, timestamp, suhu, kelembapan, amonia, relay_status, relay_mode FROM readings "
+                "WHERE timestamp < ? AND (device, timestamp) > (?, ?) ORDER BY device, timestamp LIMIT ?",
+                (cutoff, *key, self.batch),
+            ).fetchall()
+            if not rows:
+                break
+            self.archive.write_batch([
+                {
+                    "device": device, "timestamp": TIMEZONE.localize(datetime.strptime(timestamp, TIMESTAMP_FORMAT)),
+                    "suhu": suhu, "kelembapan": kelembapan, "amonia": amonia,
+                    "relay_status": relay_status, "relay_mode": relay_mode,
+                }
+                for device, timestamp, suhu, kelembapan, amonia, relay_status, relay_mode in rows
+            ], bulk=True)
+            moved += len(rows)
+            key = rows[-1][:2]
+        # Error flush/commit diteruskan ke maintain() sebelum baris mana pun dihapus
+        self.archive.commit()
+
+        with self._write_lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            aged_until = conn.execute("SELECT value FROM meta WHERE key = 'aged_until'").fetchone()
+            if aged_until is not None and cutoff > aged_until[0]:
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'aged_until'", (cutoff,))
+            if moved:
+                conn.execute("DELETE FROM readings WHERE timestamp < ? AND (device, timestamp) <= (?, ?)",
+                             (cutoff, *key))
+        HOT_ROWS.labels("aged_out").inc(moved)
+        return moved
+
+    def stats(self):
+        conn = self._connect()
+        rows, oldest = conn.execute("SELECT count(*), min(timestamp) FROM readings").fetchone()
+        return {"backend": self.name, "rows": rows, "oldest": oldest, "aged_until": self.boundary(),
+                "days": self.days, "archive": self.archive.name if self.archive is not None else None}
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        if self.archive is not None:
+            self.archive.close()
+
+
+def _tag(records, device_id):
+    for record in records:
+        record["device"] = device_id
+        yield record
+
+
+def object_store_kind(kind, archive="gcs"):
+    """Object store yang dipakai backend `kind`: arsip untuk "sqlite", backend itu sendiri untuk lainnya."""
+    return archive if kind == "sqlite" else kind
+
+
+def create_backend(kind, archive="gcs", local_root="storage", path="hot_store.db", days=7, readonly=False,
+                   write=None, commit=None, read_workers=8, client=None):
+    """
+    Backend penyimpanan sesuai konfigurasi: "gcs", "local" (object store di folder `local_root`) atau
+    "sqlite" (hot store `path` untuk `days` hari terakhir di depan object store `archive`).
+    `client`: client object store eksplisit; jika None, "gcs" memakai client bersama dan "local" membuat
+    local_storage.Client(local_root). Client bersama proses (storage_session) tidak diubah.
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Backend penyimpanan harus salah satu dari: {', '.join(BACKENDS)}")
+    if kind == "sqlite":
+        if archive == "sqlite":
+            raise ValueError("Arsip hot store harus object store (gcs atau local)")
+        store = create_backend(archive, local_root=local_root, write=write, commit=commit, read_workers=read_workers,
+                               client=client)
+        return SQLiteBackend(path, days, store, readonly=readonly)
+    if kind == "local" and client is None:
+        client = local_storage.Client(local_root)
+    bucket = storage_session.get_bucket(PARTITION_BUCKET, client) if client is not None else None
+    return ObjectStoreBackend(kind, write=write, commit=commit, read_workers=read_workers, bucket=bucket)
@@ -0,0 +1,143 @@
+import threading
+import time
+import uuid
+from google.cloud import storage
+import metrics
+
+# Ukuran pool koneksi HTTP yang dipakai bersama oleh semua upload/download
+HTTP_POOL_SIZE = 10
+
+_client = None
+_buckets = {}
+_lock = threading.Lock()
+
+UPLOAD_SECONDS = metrics.histogram(
+    "storage_upload_seconds", "Durasi append_object ke object store (detik)", ("bucket",)
+)
+UPLOAD_BYTES = metrics.counter("storage_upload_bytes_total", "Byte yang diunggah lewat append_object", ("bucket",))
+UPLOAD_FAILURES = metrics.counter("storage_upload_failures_total", "append_object yang gagal", ("bucket",))
+
+
+def get_client():
+    """
+    Mengembalikan satu storage client per proses.
+    Client dibuat sekali lalu dipakai ulang agar koneksi HTTP tetap di-pool.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                client = storage.Client()
+                _enable_connection_pool(client)
+                _client = client
+    return _client
+
+
+def set_client(client):
+    """Mengganti client yang dipakai bersama (mis. dengan local_storage.Client untuk benchmark)."""
+    global _client
+    with _lock:
+        _client = client
+        _buckets.clear()
+
+
+def get_bucket(bucket_name, client=None):
+    """Mengembalikan objek bucket yang di-cache untuk client bersama (atau `client` jika diberikan)."""
+    if client is None:
+        client = get_client()
+    bucket = _buckets.get((client, bucket_name))
+    if bucket is None:
+        bucket = client.bucket(bucket_name)
+        _buckets[(client, bucket_name)] = bucket
+    return bucket
+
+
+def _enable_connection_pool(client):
+    try:
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        client._http.mount("https://", adapter)
+    except Exception as e:
+        print(f"⚠ Gagal mengatur pool koneksi storage: {e}")
+
+
+def append_object(bucket, name, data, exists=None):
+    """
+    Menambahkan `data` (bytes) ke akhir objek `name` tanpa mengunduhnya.
+    Data diunggah sebagai chunk kecil lalu digabungkan dengan compose (server-side),
+    sehingga biaya per panggilan sebanding dengan ukuran chunk, bukan ukuran objek.
+    """
+    start = time.perf_counter()
+    try:
+        nbytes = _append_object(bucket, name, data, exists)
+    except Exception:
+        UPLOAD_FAILURES.labels(bucket.name).inc()
+        raise
+    UPLOAD_SECONDS.labels(bucket.name).observe(time.perf_counter() - start)
+    UPLOAD_BYTES.labels(bucket.name).inc(nbytes)
+    return nbytes
+
+
+def _append_object(bucket, name, data, exists):
+    target = bucket.blob(name)
+    if exists is None:
+        exists = target.exists()
+    if not exists:
+        target.upload_from_string(data, content_type="text/csv")
+        return len(data)
+
+    chunk = bucket.blob(f"{name}.chunks/{uuid.uuid4().hex}")
+    chunk.upload_from_string(data, content_type="text/csv")
+    try:
+        target.compose([target, chunk])
+    finally:
+        chunk.delete()
+    return len(data)
+
+
+class UploadStats:
+    """Penghitung byte yang diunggah per baris yang ditulis untuk satu objek tujuan."""
+
+    def __init__(self):
+        self.bytes_uploaded = 0
+        self.rows_written = 0
+        self.uploads = 0
+        self.last_bytes_per_row = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, nbytes, rows):
+        with self._lock:
+            self.bytes_uploaded += nbytes
+            self.rows_written += rows
+            self.uploads += 1
+            if rows:
+                self.last_bytes_per_row = nbytes / rows
+
+    def bytes_per_row(self):
+        return self.bytes_uploaded / self.rows_written if self.rows_written else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "bytes_uploaded": self.bytes_uploaded,
+                "rows_written": self.rows_written,
+                "uploads": self.uploads,
+                "bytes_per_row": self.bytes_per_row(),
+                "last_bytes_per_row": self.last_bytes_per_row,
+            }
+
+
+_upload_stats = {}
+
+
+def get_upload_stats(name):
+    """Mengembalikan penghitung upload untuk objek tujuan `name` (dibuat jika belum ada)."""
+    stats = _upload_stats.get(name)
+    if stats is None:
+        with _lock:
+            stats = _upload_stats.setdefault(name, UploadStats())
+    return stats
+
+
+def all_upload_stats():
+    return {name: stats.snapshot() for name, stats in _upload_stats.items()}
@@ -0,0 +1,124 @@
+import json
+import os
+import socket
+import threading
+from collections import deque
+
+# Alamat loopback tempat bot mengirim pembacaan baru ke proses API (UDP, satu datagram per pembacaan)
+STREAM_HOST = os.getenv("STREAM_HOST", "127.0.0.1")
+STREAM_PORT = int(os.getenv("STREAM_PORT", 5055))
+KEEPALIVE_INTERVAL = 15  # Detik tanpa event sebelum komentar keep-alive dikirim ke klien SSE
+
+
+def encode_reading(reading):
+    """Pembacaan pipeline -> JSON bytes (timestamp sebagai "YYYY-MM-DD HH:MM:SS")."""
+    return json.dumps({
+        "timestamp": reading["timestamp"].strftime("%Y-%m-%d %H:%M:%S"),
+        "device": reading.get("device"),
+        "suhu": reading.get("suhu"),
+        "kelembapan": reading.get("kelembapan"),
+        "amonia": reading.get("amonia"),
+        "status relay": reading.get("relay_status"),
+        "mode relay": reading.get("relay_mode"),
+    }).encode("utf-8")
+
+
+class StreamPublisher:
+    """Sisi bot: mengirim pembacaan yang sudah disimpan ke proses API lewat UDP loopback (tanpa blokir)."""
+
+    def __init__(self, host=STREAM_HOST, port=STREAM_PORT):
+        self.address = (host, port)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def publish_batch(self, readings):
+        for reading in readings:
+            try:
+                self._socket.sendto(encode_reading(reading), self.address)
+            except OSError:
+                pass  # Tidak ada pendengar atau buffer penuh: stream bersifat best-effort
+
+
+class StreamHub:
+    """
+    Sisi API: buffer replay event terbaru dan siaran ke semua subscriber SSE.
+    Frame SSE diformat sekali per event; subscriber hanya membaca buffer bersama
+    setelah dibangunkan oleh Condition, tanpa antrean per subscriber.
+    """
+
+    def __init__(self, replay_size=1000):
+        self._events = deque(maxlen=replay_size)  # (event id, device, frame SSE)
+        self._last_id = 0
+        self._condition = threading.Condition()
+        self.subscribers = 0
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, payload):
+        """Menambahkan satu event (JSON bytes) dan membangunkan semua subscriber."""
+        try:
+            device = json.loads(payload).get("device")
+        except ValueError:
+            return
+        with self._condition:
+            self._last_id += 1
+            event_id = self._last_id
+            frame = f"id: {event_id}\nevent: reading\ndata: {payload.decode('utf-8')}\n\n".encode("utf-8")
+            self._events.append((event_id, device, frame))
+            self._condition.notify_all()
+
+    def _since(self, last_seen):
+        """Frame dengan id > last_seen dari buffer replay (dipanggil dengan lock)."""
+        if not self._events:
+            return []
+        first_id = self._events[0][0]
+        if last_seen > self._last_id:
+            last_seen = 0  # ID dari sebelum hub dimulai ulang: kirim seluruh buffer
+        start = max(0, last_seen + 1 - first_id)
+        return [self._events[i] for i in range(start, len(self._events))]
+
+    def subscribe(self, last_event_id=None, device=None, keepalive=KEEPALIVE_INTERVAL):
+        """
+        Generator frame SSE. `last_event_id` (header Last-Event-ID) melanjutkan dari buffer replay;
+        tanpa itu hanya event baru yang dikirim. `device` menyaring satu perangkat.
+        """
+        with self._condition:
+            last_seen = self._last_id if last_event_id is None else last_event_id
+            self.subscribers += 1
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                with self._condition:
+                    if self._last_id <= last_seen:
+                        self._condition.wait(keepalive)
+                    events = self._since(last_seen)
+                if not events:
+                    yield b": keep-alive\n\n"
+                    continue
+                last_seen = events[-1][0]
+                frames = [frame for _, event_device, frame in events if device is None or event_device == device]
+                if frames:
+                    yield b"".join(frames)
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+
+
+def start_listener(hub, host=STREAM_HOST, port=STREAM_PORT):
+    """Thread daemon yang menerima datagram dari bot dan meneruskannya ke hub."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+
+    def listen():
+        while True:
+            try:
+                payload, _ = sock.recvfrom(65535)
+                hub.publish(payload)
+            except Exception as e:
+                print(f"❌ Stream: Error saat menerima data: {e}")
+
+    thread = threading.Thread(target=listen, name="stream-listener", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,308 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from pipeline import serialize_reading, deserialize_reading
+
+# Header record: panjang payload dan CRC32 payload (uint32 LE)
+RECORD_HEADER = struct.Struct("<II")
+SEGMENT_SUFFIX = ".wal"
+CHECKPOINT_NAME = "checkpoint.json"
+
+
+def _segment_id(filename):
+    return int(filename[:-len(SEGMENT_SUFFIX)])
+
+
+def _fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    Write-ahead log lokal untuk pembacaan sensor: file segmen berurutan berisi record
+    [panjang, CRC32, JSON]. Setiap batch ditulis lalu di-fsync sekali. Posisi (segmen, offset)
+    yang sudah dikonfirmasi tersimpan di checkpoint.json; segmen di belakangnya dihapus.
+    Ukuran total dibatasi `max_bytes`: jika terlampaui, segmen tertua dibuang.
+    """
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self.dropped_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = sorted(
+            _segment_id(name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)
+        )
+        if not self._segments:
+            self._segments = [0]
+            open(self._path(0), "ab").close()
+
+        # Ekor segmen aktif yang terpotong (crash saat menulis) dibuang
+        active = self._segments[-1]
+        valid = self._valid_length(active)
+        if valid < os.path.getsize(self._path(active)):
+            print(f"⚠ WAL: Ekor segmen {active} rusak, dipotong ke {valid} byte.")
+            with open(self._path(active), "r+b") as f:
+                f.truncate(valid)
+                os.fsync(f.fileno())
+        self._file = open(self._path(active), "ab")
+        self.end = (active, valid)  # Posisi akhir data yang sudah di-fsync
+        self.acked = self._load_checkpoint()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:012d}{SEGMENT_SUFFIX}")
+
+    def _valid_length(self, segment):
+        """Panjang bagian segmen yang berisi record utuh dengan CRC yang cocok."""
+        length = 0
+        with open(self._path(segment), "rb") as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return length
+                size, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(size)
+                if len(payload) < size or zlib.crc32(payload) != crc:
+                    return length
+                length += RECORD_HEADER.size + size
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_NAME)) as f:
+                checkpoint = json.load(f)
+            position = (checkpoint["segment"], checkpoint["offset"])
+        except (FileNotFoundError, ValueError, KeyError):
+            position = (self._segments[0], 0)
+        # Checkpoint menunjuk segmen yang sudah dihapus: mulai dari segmen tertua yang ada
+        if position[0] < self._segments[0]:
+            position = (self._segments[0], 0)
+        return position
+
+    def _write_checkpoint(self, position):
+        path = os.path.join(self.directory, CHECKPOINT_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": position[0], "offset": position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def append_batch(self, readings):
+        """Menulis batch pembacaan sebagai record lalu fsync sekali untuk seluruh batch."""
+        records = []
+        for reading in readings:
+            payload = serialize_reading(reading).encode("utf-8")
+            records.append(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        data = b"".join(records)
+        if not data:
+            return
+        with self._cond:
+            segment, offset = self.end
+            if offset and offset + len(data) > self.segment_bytes:
+                segment, offset = self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.end = (segment, offset + len(data))
+            self._enforce_limit()
+            self._cond.notify_all()
+
+    def _rotate(self):
+        """Menutup segmen aktif dan membuka segmen baru (dipanggil dengan lock)."""
+        self._file.close()
+        segment = self._segments[-1] + 1
+        self._segments.append(segment)
+        self._file = open(self._path(segment), "ab")
+        _fsync_dir(self.directory)
+        return segment, 0
+
+    def _enforce_limit(self):
+        """Membuang segmen tertua (meski belum dikonfirmasi) jika ukuran log melebihi batas."""
+        while len(self._segments) > 1 and self.size_bytes() > self.max_bytes:
+            oldest = self._segments.pop(0)
+            size = os.path.getsize(self._path(oldest))
+            os.remove(self._path(oldest))
+            self.dropped_bytes += size
+            print(f"⚠ WAL: Batas ukuran terlampaui, segmen {oldest} ({size} byte) dibuang.")
+            if self.acked[0] <= oldest:
+                self.acked = (self._segments[0], 0)
+                self._write_checkpoint(self.acked)
+
+    def size_bytes(self):
+        segment, offset = self.end
+        return sum(os.path.getsize(self._path(s)) for s in self._segments if s != segment) + offset
+
+    def backlog_bytes(self):
+        """Perkiraan ukuran data yang belum dikonfirmasi (byte)."""
+        with self._cond:
+            acked_segment, acked_offset = self.acked
+            end_segment, end_offset = self.end
+            if acked_segment == end_segment:
+                return end_offset - acked_offset
+            total = end_offset - acked_offset
+            for segment in self._segments:
+                if acked_segment <= segment < end_segment:
+                    total += os.path.getsize(self._path(segment))
+            return total
+
+    def read(self, position, max_records):
+        """
+        Membaca maksimal `max_records` pembacaan mulai dari `position`.
+        Mengembalikan (daftar pembacaan, posisi setelah record terakhir yang dibaca).
+        """
+        with self._cond:
+            end = self.end
+            segments = list(self._segments)
+        segment, offset = position
+        if segment < segments[0]:
+            segment, offset = segments[0], 0
+        readings = []
+        while len(readings) < max_records and (segment, offset) < end:
+            limit = end[1] if segment == end[0] else None
+            with open(self._path(segment), "rb") as f:
+                f.seek(offset)
+                while len(readings) < max_records and (limit is None or offset < limit):
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    size, crc = RECORD_HEADER.unpack(header)
+                    payload = f.read(size)
+                    if len(payload) < size or zlib.crc32(payload) != crc:
+                        print(f"⚠ WAL: Record rusak di segmen {segment} offset {offset}, sisa segmen dilewati.")
+                        break
+                    readings.append(deserialize_reading(payload.decode("utf-8")))
+                    offset += RECORD_HEADER.size + size
+            if len(readings) >= max_records or segment == end[0]:
+                break
+            # Segmen habis: lanjut ke segmen berikutnya
+            later = [s for s in segments if s > segment]
+            if not later:
+                break
+            segment, offset = later[0], 0
+        return readings, (segment, offset)
+
+    def ack(self, position):
+        """Menyimpan posisi yang sudah terkirim ke object store lalu menghapus segmen di belakangnya."""
+        with self._cond:
+            self._write_checkpoint(position)
+            self.acked = position
+            while len(self._segments) > 1 and self._segments[0] < position[0]:
+                os.remove(self._path(self._segments.pop(0)))
+
+    def wait(self, position, timeout, stop=None):
+        """Menunggu hingga ada data baru setelah `position`, `timeout` detik berlalu, atau `stop` di-set."""
+        with self._cond:
+            if self.end <= position and not (stop is not None and stop.is_set()):
+                self._cond.wait(timeout)
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._file.close()
+
+
+class WalReplayer:
+    """
+    Thread yang mengirim isi WAL ke sink penyimpanan (CSV, partisi GCS, rollup, stream).
+    Sink bersifat idempoten berdasarkan (perangkat, timestamp), sehingga batch yang gagal
+    cukup dikirim ulang. Posisi WAL baru dikonfirmasi setelah `commit()` (flush ke object store)
+    berhasil; jika bot mati sebelum itu, data dikirim ulang dari checkpoint tanpa celah.
+    """
+
+    def __init__(self, wal, sinks, commit=None, batch_size=100, commit_rows=10, commit_interval=300,
+                 retry_interval=5, max_retry_interval=300):
+        self.wal = wal
+        self.sinks = sinks
+        self.commit = commit
+        self.batch_size = batch_size
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._stopping = threading.Event()
+        self._thread = None
+        self.shipped = 0
+        self.committed = 0
+        self.failures = 0
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="wal-replayer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Mengirim sisa WAL, commit, lalu menghentikan thread."""
+        self._stopping.set()
+        self.wal.wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _ship(self, readings):
+        for sink in self.sinks:
+            sink(readings)
+
+    def _run(self):
+        position = self.wal.acked
+        uncommitted = 0
+        last_commit = time.monotonic()
+        backoff = self.retry_interval
+        while True:
+            readings, next_position = self.wal.read(position, self.batch_size)
+            try:
+                if readings:
+                    self._ship(readings)
+                    self.shipped += len(readings)
+                    uncommitted += len(readings)
+                position = next_position
+
+                idle = not readings
+                due = (
+                    uncommitted >= self.commit_rows
+                    or time.monotonic() - last_commit >= self.commit_interval
+                    or (idle and self._stopping.is_set())
+                )
+                if due and position != self.wal.acked:
+                    if self.commit is not None:
+                        self.commit()
+                    self.wal.ack(position)
+                    self.committed += uncommitted
+                    uncommitted = 0
+                    last_commit = time.monotonic()
+                backoff = self.retry_interval
+            except Exception as e:
+                self.failures += 1
+                print(f"❌ WAL: Gagal mengirim data, dicoba lagi dalam {backoff} detik: {e}")
+                if self._stopping.is_set():
+                    return  # Data tetap di WAL dan dikirim ulang saat bot berjalan lagi
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_retry_interval)
+                continue
+
+            if idle:
+                if self._stopping.is_set():
+                    return
+                remaining = self.commit_interval - (time.monotonic() - last_commit)
+                self.wal.wait(position, max(remaining, 0.1) if uncommitted else None, self._stopping)
+
+    def stats(self):
+        return {
+            "backlog_bytes": self.wal.backlog_bytes(),
+            "size_bytes": self.wal.size_bytes(),
+            "dropped_bytes": self.wal.dropped_bytes,
+            "shipped": self.shipped,
+            "committed": self.committed,
+            "failures": self.failures,
+        }